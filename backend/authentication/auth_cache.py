@@ -0,0 +1,216 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from authentication.models import AuthorizationEpoch
+
+
+_MISSING = object()
+
+
+class LRUTTLCache:
+	# Fills pass the generation they started at, so a value loaded before an
+	# invalidation is dropped instead of overwriting it.
+	def __init__(self, max_entries, ttl_seconds):
+		self.max_entries = max(0, int(max_entries))
+		self.ttl_seconds = max(0, float(ttl_seconds))
+		self._entries = OrderedDict()
+		self._lock = threading.Lock()
+		self._generation = 0
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+		self.invalidations = 0
+
+	@property
+	def enabled(self):
+		return self.max_entries > 0 and self.ttl_seconds > 0
+
+	def generation(self):
+		return self._generation
+
+	def get(self, key, default=None):
+		now = time.monotonic()
+		with self._lock:
+			entry = self._entries.get(key, _MISSING)
+			if entry is _MISSING:
+				self.misses += 1
+				return default
+
+			expires_at, value = entry
+			if expires_at <= now:
+				del self._entries[key]
+				self.misses += 1
+				return default
+
+			self._entries.move_to_end(key)
+			self.hits += 1
+			return value
+
+	def set(self, key, value, generation=None):
+		if not self.enabled:
+			return
+
+		with self._lock:
+			if generation is not None and generation != self._generation:
+				return
+
+			self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+			self._entries.move_to_end(key)
+			while len(self._entries) > self.max_entries:
+				self._entries.popitem(last=False)
+				self.evictions += 1
+
+	def invalidate(self, key):
+		with self._lock:
+			self._generation += 1
+			self.invalidations += 1
+			self._entries.pop(key, None)
+
+	def invalidate_where(self, predicate):
+		with self._lock:
+			self._generation += 1
+			stale = [key for key in self._entries if predicate(key)]
+			for key in stale:
+				del self._entries[key]
+			self.invalidations += len(stale)
+
+	def clear(self):
+		with self._lock:
+			self._generation += 1
+			self._entries.clear()
+
+	def stats(self):
+		with self._lock:
+			lookups = self.hits + self.misses
+			return {
+				'size': len(self._entries),
+				'max_entries': self.max_entries,
+				'ttl_seconds': self.ttl_seconds,
+				'hits': self.hits,
+				'misses': self.misses,
+				'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+				'evictions': self.evictions,
+				'invalidations': self.invalidations,
+			}
+
+
+_USER_FIELD_NAMES = tuple(field.attname for field in User._meta.concrete_fields)
+
+user_cache = LRUTTLCache(
+	getattr(settings, 'AUTH_USER_CACHE_SIZE', 2048),
+	getattr(settings, 'AUTH_USER_CACHE_TTL_SECONDS', 60),
+)
+
+epoch_cache = LRUTTLCache(
+	getattr(settings, 'AUTH_USER_CACHE_SIZE', 2048),
+	getattr(settings, 'AUTH_EPOCH_CACHE_TTL_SECONDS', 5),
+)
+
+
+def _build_user(entry):
+	# Every caller gets its own instance so request code can never mutate the cached copy.
+	values, role = entry
+	user = User.from_db('default', _USER_FIELD_NAMES, values)
+	user._cached_role = role
+	return user
+
+
+def get_cached_user(user_id):
+	# Token claims carry the id as a string while signals see the integer pk.
+	key = str(user_id)
+	entry = user_cache.get(key)
+	if entry is not None:
+		return _build_user(entry)
+
+	generation = user_cache.generation()
+	user = User.objects.select_related('profile').filter(id=user_id).first()
+	return _cache_loaded_user(key, user, generation)
+
+
+def peek_cached_user(user_id):
+	# Cache-only lookup that never touches the database, for use on the event loop.
+	entry = user_cache.get(str(user_id))
+	return _build_user(entry) if entry is not None else None
+
+
+async def aget_cached_user(user_id):
+	key = str(user_id)
+	entry = user_cache.get(key)
+	if entry is not None:
+		return _build_user(entry)
+
+	generation = user_cache.generation()
+	user = await User.objects.select_related('profile').filter(id=user_id).afirst()
+	return _cache_loaded_user(key, user, generation)
+
+
+def _cache_loaded_user(key, user, generation):
+	if user is None:
+		return None
+
+	role = getattr(getattr(user, 'profile', None), 'role', None)
+	entry = (tuple(getattr(user, name) for name in _USER_FIELD_NAMES), role)
+	user_cache.set(key, entry, generation=generation)
+	return _build_user(entry)
+
+
+def get_user_role(user):
+	role = getattr(user, '_cached_role', _MISSING)
+	if role is not _MISSING:
+		return role
+	return getattr(getattr(user, 'profile', None), 'role', None)
+
+
+def invalidate_user(user_id):
+	if user_id is not None:
+		user_cache.invalidate(str(user_id))
+
+
+def user_cache_stats():
+	return user_cache.stats()
+
+
+def get_auth_epoch(user_id):
+	key = str(user_id)
+	epoch = epoch_cache.get(key)
+	if epoch is not None:
+		return epoch
+
+	generation = epoch_cache.generation()
+	epoch = AuthorizationEpoch.objects.filter(user_id=user_id).values_list('epoch', flat=True).first() or 0
+	epoch_cache.set(key, epoch, generation=generation)
+	return epoch
+
+
+async def aget_auth_epoch(user_id):
+	key = str(user_id)
+	epoch = epoch_cache.get(key)
+	if epoch is not None:
+		return epoch
+
+	generation = epoch_cache.generation()
+	epoch = await AuthorizationEpoch.objects.filter(user_id=user_id).values_list('epoch', flat=True).afirst() or 0
+	epoch_cache.set(key, epoch, generation=generation)
+	return epoch
+
+
+def bump_auth_epoch(user_id):
+	if user_id is None:
+		return
+
+	updated = AuthorizationEpoch.objects.filter(user_id=user_id).update(epoch=F('epoch') + 1)
+	if not updated:
+		try:
+			with transaction.atomic():
+				AuthorizationEpoch.objects.create(user_id=user_id, epoch=1)
+		except IntegrityError:
+			AuthorizationEpoch.objects.filter(user_id=user_id).update(epoch=F('epoch') + 1)
+
+	epoch_cache.invalidate(str(user_id))
+	invalidate_user(user_id)
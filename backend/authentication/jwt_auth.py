@@ -3,11 +3,57 @@ from django.contrib.auth.models import User
 from rest_framework_simplejwt.exceptions import TokenError
 from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
 
+from authentication.auth_cache import (
+	aget_auth_epoch,
+	aget_cached_user,
+	get_auth_epoch,
+	get_cached_user,
+	get_user_role,
+)
+
+
+# Claim names -> build(user), for claims other apps add to access tokens.
+_claim_providers = {}
+
+
+def register_access_claims(names, build):
+	"""
+	Add build(user)'s claims to every access token issued with claims. build may leave
+	any of names out, and a refreshed token then drops them. Changes to what they
+	describe must bump the user's auth epoch, or tokens keep stale claims.
+	"""
+	_claim_providers[tuple(names)] = build
+
+
+def build_access_claims(user):
+	# Read the epoch first: a bump racing with the providers' queries below
+	# then leaves the token stale instead of silently under-reporting changes.
+	claims = {
+		'auth_epoch': get_auth_epoch(user.id),
+		'role': get_user_role(user),
+		'email': user.email,
+	}
+	for build in _claim_providers.values():
+		claims.update(build(user))
+	return claims
+
+
+def _apply_claims(token, claims):
+	for names in _claim_providers:
+		for name in names:
+			if name in token.payload:
+				del token[name]
+	for name, value in claims.items():
+		token[name] = value
+
 
-def issue_tokens_for_user(user):
+def issue_tokens_for_user(user, include_claims=False):
 	refresh = RefreshToken.for_user(user)
+	access = refresh.access_token
+	if include_claims:
+		_apply_claims(access, build_access_claims(user))
 	return {
-		'access': str(refresh.access_token),
+		'access': str(access),
 		'refresh': str(refresh),
 	}
 
@@ -43,31 +89,83 @@ def refresh_access_from_cookie(request):
 	except TokenError:
 		return None
 
+	user = get_cached_user(refresh.get('user_id'))
+	if user is None:
+		return None
+
+	access = refresh.access_token
+	_apply_claims(access, build_access_claims(user))
 	return {
-		'access': str(refresh.access_token),
+		'access': str(access),
 		'refresh': str(refresh),
 	}
 
 
-def get_user_from_request(request):
+def _access_token_from_request(request):
+	if hasattr(request, '_access_token'):
+		return request._access_token
+
+	token = None
 	authorization_header = request.headers.get('Authorization', '')
-	if not authorization_header.startswith('Bearer '):
+	if authorization_header.startswith('Bearer '):
+		token_string = authorization_header.split(' ', 1)[1].strip()
+		if token_string:
+			try:
+				token = AccessToken(token_string)
+			except TokenError:
+				token = None
+
+	request._access_token = token
+	return token
+
+
+def get_user_from_request(request):
+	token = _access_token_from_request(request)
+	if token is None:
 		return None
 
-	token_string = authorization_header.split(' ', 1)[1].strip()
-	if not token_string:
+	user_id = token.get('user_id')
+	if not user_id:
 		return None
 
-	try:
-		token = AccessToken(token_string)
-	except TokenError:
+	return get_cached_user(user_id)
+
+
+async def aget_user_from_request(request):
+	token = _access_token_from_request(request)
+	if token is None:
 		return None
 
 	user_id = token.get('user_id')
 	if not user_id:
 		return None
 
-	try:
-		return User.objects.get(id=user_id)
-	except User.DoesNotExist:
+	return await aget_cached_user(user_id)
+
+
+def _claims_token(request):
+	token = _access_token_from_request(request)
+	if token is None or 'auth_epoch' not in token.payload or not token.get('user_id'):
+		return None
+	return token
+
+
+def get_access_claims(request):
+	token = _claims_token(request)
+	if token is None or token['auth_epoch'] != get_auth_epoch(token['user_id']):
 		return None
+	return token.payload
+
+
+async def aget_access_claims(request):
+	token = _claims_token(request)
+	if token is None or token['auth_epoch'] != await aget_auth_epoch(token['user_id']):
+		return None
+	return token.payload
+
+
+def get_claims_user(claims):
+	user = User(id=int(claims['user_id']), username=claims.get('email') or '', email=claims.get('email') or '')
+	user._state.adding = False
+	user._cached_role = claims.get('role')
+	return user
@@ -0,0 +1,23 @@
+# Generated by Django 6.0.2 on 2026-10-17 01:55
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0004_userprofile_password_reset_sent_at_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthorizationEpoch',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='authorization_epoch', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('epoch', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+    ]
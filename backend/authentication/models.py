@@ -20,3 +20,13 @@ class UserProfile(models.Model):
 
 	def __str__(self):
 		return f'{self.user.email} ({self.role})'
+
+
+class AuthorizationEpoch(models.Model):
+	# Bumped whenever a user's role, memberships or password change; access tokens
+	# carrying an older epoch no longer authorize from their embedded claims.
+	user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='authorization_epoch')
+	epoch = models.PositiveIntegerField(default=0)
+
+	def __str__(self):
+		return f'{self.user_id} @ {self.epoch}'
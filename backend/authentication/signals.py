@@ -0,0 +1,44 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from authentication.auth_cache import bump_auth_epoch, invalidate_user
+from authentication.models import UserProfile
+
+
+def _fields_changed(sender, instance, field_names, update_fields):
+	if instance.pk is None or instance._state.adding:
+		return False
+	if update_fields is not None:
+		field_names = [name for name in field_names if name in update_fields]
+		if not field_names:
+			return False
+	current = sender.objects.filter(pk=instance.pk).values_list(*field_names).first()
+	return current is not None and current != tuple(getattr(instance, name) for name in field_names)
+
+
+@receiver(pre_save, sender=User)
+def detect_password_change(sender, instance, update_fields=None, **kwargs):
+	# Email too, as access tokens carry it as a claim.
+	instance._auth_epoch_stale = _fields_changed(sender, instance, ('password', 'email'), update_fields)
+
+
+@receiver(pre_save, sender=UserProfile)
+def detect_role_change(sender, instance, update_fields=None, **kwargs):
+	instance._auth_epoch_stale = _fields_changed(sender, instance, ('role',), update_fields)
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+	if getattr(instance, '_auth_epoch_stale', False):
+		instance._auth_epoch_stale = False
+		bump_auth_epoch(instance.pk)
+	invalidate_user(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=UserProfile)
+def invalidate_cached_user_profile(sender, instance, **kwargs):
+	if getattr(instance, '_auth_epoch_stale', False):
+		instance._auth_epoch_stale = False
+		bump_auth_epoch(instance.user_id)
+	invalidate_user(instance.user_id)
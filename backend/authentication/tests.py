@@ -6,6 +6,8 @@ from django.contrib.auth.models import User
 from django.test import TestCase
 from django.utils import timezone
 
+from authentication.auth_cache import get_cached_user, get_user_role, user_cache
+from authentication.jwt_auth import issue_tokens_for_user
 from authentication.models import UserProfile
 
 
@@ -136,3 +138,47 @@ class PasswordResetTests(TestCase):
 		)
 		self.assertEqual(response.status_code, 400)
 		self.assertIn('Password reset link has expired', response.json()['detail'])
+
+
+class AuthUserCacheTests(TestCase):
+	def setUp(self):
+		user_cache.clear()
+		self.user = User.objects.create_user(
+			username='cached@example.com',
+			email='cached@example.com',
+			password='pass12345'
+		)
+		self.profile = UserProfile.objects.create(user=self.user, role=UserProfile.ROLE_TEACHER)
+		self.access_token = issue_tokens_for_user(self.user)['access']
+
+	def _me(self):
+		return self.client.get('/api/auth/me/', HTTP_AUTHORIZATION=f'Bearer {self.access_token}')
+
+	def test_repeat_requests_are_served_from_cache(self):
+		self._me()
+		hits_before = user_cache.hits
+
+		with self.assertNumQueries(0):
+			response = self._me()
+
+		self.assertEqual(response.json()['role'], UserProfile.ROLE_TEACHER)
+		self.assertEqual(user_cache.hits, hits_before + 1)
+
+	def test_profile_change_invalidates_cached_role(self):
+		self._me()
+
+		self.profile.role = UserProfile.ROLE_STUDENT
+		self.profile.save()
+
+		response = self._me()
+		self.assertEqual(response.json()['role'], UserProfile.ROLE_STUDENT)
+
+	def test_cached_users_are_independent_instances(self):
+		self._me()
+
+		first = get_cached_user(self.user.id)
+		first.email = 'mutated@example.com'
+		second = get_cached_user(self.user.id)
+
+		self.assertEqual(second.email, 'cached@example.com')
+		self.assertEqual(get_user_role(second), UserProfile.ROLE_TEACHER)
@@ -5,9 +5,11 @@ from django.db import transaction
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 
+from authentication.auth_cache import get_user_role
 from authentication.jwt_auth import (
+	aget_access_claims,
+	aget_user_from_request,
 	clear_refresh_cookie,
-	get_user_from_request,
 	issue_tokens_for_user,
 	refresh_access_from_cookie,
 	set_refresh_cookie,
@@ -59,7 +61,7 @@ def _accept_invite_for_user(raw_token, user):
 
 
 def _auth_payload(user):
-	tokens = issue_tokens_for_user(user)
+	tokens = issue_tokens_for_user(user, include_claims=True)
 	role = getattr(getattr(user, 'profile', None), 'role', None)
 	return {
 		'id': user.id,
@@ -221,12 +223,21 @@ def logout_view(request):
 	return response
 
 
-def me(request):
-	user = get_user_from_request(request)
+async def me(request):
+	claims = await aget_access_claims(request)
+	if claims is not None:
+		return JsonResponse({
+			'authenticated': True,
+			'id': int(claims['user_id']),
+			'email': claims.get('email'),
+			'role': claims.get('role'),
+		})
+
+	user = await aget_user_from_request(request)
 	if user is None:
 		return JsonResponse({'authenticated': False})
 
-	role = getattr(getattr(user, 'profile', None), 'role', None)
+	role = get_user_role(user)
 	return JsonResponse({
 		'authenticated': True,
 		'id': user.id,
@@ -95,7 +95,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'backend.middleware.AsyncWhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -131,12 +131,23 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'backend.wsgi.application'
 
+REDIS_URL = os.environ.get('REDIS_URL', '')
+
+# 'process-local' (classroom.channel_layers) publishes a group message once per process
+# instead of writing it once per member channel as RedisChannelLayer does.
+CHANNEL_LAYER_BACKEND = os.environ.get('CHANNEL_LAYER_BACKEND', 'redis' if REDIS_URL else 'memory')
+CHANNEL_LAYER_BACKENDS = {
+    'redis': 'channels_redis.core.RedisChannelLayer',
+    'process-local': 'classroom.channel_layers.ProcessLocalGroupChannelLayer',
+    'memory': 'channels.layers.InMemoryChannelLayer',
+}
+
 CHANNEL_LAYERS = {
     'default': {
-        'BACKEND': 'channels_redis.core.RedisChannelLayer' if os.environ.get('REDIS_URL') else 'channels.layers.InMemoryChannelLayer',
+        'BACKEND': CHANNEL_LAYER_BACKENDS[CHANNEL_LAYER_BACKEND],
         'CONFIG': {
-            "hosts": [os.environ.get('REDIS_URL', 'redis://127.0.0.1:6379')],
-        } if os.environ.get('REDIS_URL') else {},
+            "hosts": [REDIS_URL],
+        } if REDIS_URL and CHANNEL_LAYER_BACKEND != 'memory' else {},
     }
 }
 
@@ -228,3 +239,87 @@ JWT_REFRESH_COOKIE_NAME = os.environ.get('JWT_REFRESH_COOKIE_NAME', 'refresh_tok
 JWT_REFRESH_COOKIE_SECURE = os.environ.get('JWT_REFRESH_COOKIE_SECURE', 'false').lower() == 'true'
 JWT_REFRESH_COOKIE_SAMESITE = os.environ.get('JWT_REFRESH_COOKIE_SAMESITE', 'Lax')
 JWT_REFRESH_COOKIE_PATH = os.environ.get('JWT_REFRESH_COOKIE_PATH', '/api/auth/')
+
+# Process-local cache of authenticated users (User row + profile role), keyed by user id.
+AUTH_USER_CACHE_SIZE = int(os.environ.get('AUTH_USER_CACHE_SIZE', '2048'))
+AUTH_USER_CACHE_TTL_SECONDS = int(os.environ.get('AUTH_USER_CACHE_TTL_SECONDS', '60'))
+
+# Access tokens embed role, class memberships and the user's authorization epoch so hot
+# read endpoints can authorize without queries. The epoch lookup is cached this long.
+AUTH_EPOCH_CACHE_TTL_SECONDS = int(os.environ.get('AUTH_EPOCH_CACHE_TTL_SECONDS', '5'))
+JWT_MEMBERSHIP_CLAIMS_LIMIT = int(os.environ.get('JWT_MEMBERSHIP_CLAIMS_LIMIT', '50'))
+
+# Classroom lookups and membership checks: in-process L1, plus a shared Redis L2 when
+# REDIS_URL is set (invalidations are fanned out to every process over pub/sub).
+CLASSROOM_ACCESS_CACHE_SIZE = int(os.environ.get('CLASSROOM_ACCESS_CACHE_SIZE', '20000'))
+CLASSROOM_ACCESS_CACHE_TTL_SECONDS = int(os.environ.get('CLASSROOM_ACCESS_CACHE_TTL_SECONDS', '60'))
+CLASSROOM_ACCESS_REDIS_TTL_SECONDS = int(os.environ.get('CLASSROOM_ACCESS_REDIS_TTL_SECONDS', '600'))
+# Active session id per classroom, cached in-process; ending a session elsewhere is picked up within the TTL.
+CLASSROOM_ACTIVE_SESSION_CACHE_TTL_SECONDS = int(os.environ.get('CLASSROOM_ACTIVE_SESSION_CACHE_TTL_SECONDS', '10'))
+
+# Worker threads for blocking database work done by WebSocket consumers. Each worker holds
+# its own database connection; 0 falls back to Channels' single thread-sensitive executor.
+CLASSROOM_DB_POOL_SIZE = int(os.environ.get('CLASSROOM_DB_POOL_SIZE', '16'))
+
+# Attendance heartbeats are buffered and written in batches. A record's pending heartbeat
+# is written at most HEARTBEAT_MAX_STALENESS_SECONDS after it first arrived; the flusher
+# wakes every HEARTBEAT_FLUSH_INTERVAL_SECONDS. 'redis' shares the buffer between processes.
+HEARTBEAT_BUFFER_BACKEND = os.environ.get('HEARTBEAT_BUFFER_BACKEND', 'redis' if REDIS_URL else 'memory')
+HEARTBEAT_FLUSH_INTERVAL_SECONDS = float(os.environ.get('HEARTBEAT_FLUSH_INTERVAL_SECONDS', '5'))
+HEARTBEAT_MAX_STALENESS_SECONDS = float(os.environ.get('HEARTBEAT_MAX_STALENESS_SECONDS', '15'))
+
+# A student counts as online until this long after their last connect or heartbeat
+# (clients heartbeat every 15 seconds).
+CLASSROOM_PRESENCE_TTL_SECONDS = int(os.environ.get('CLASSROOM_PRESENCE_TTL_SECONDS', '45'))
+
+# WebSocket connects slower than this log their per-stage timing breakdown.
+CLASSROOM_CONNECT_SLOW_LOG_MS = float(os.environ.get('CLASSROOM_CONNECT_SLOW_LOG_MS', '1000'))
+
+# Broadcasts also carry a pre-encoded MessagePack frame for clients that negotiate the
+# 'msgpack' WebSocket subprotocol. Off: each msgpack connection converts the JSON frame itself.
+CLASSROOM_WEBSOCKET_MSGPACK = os.environ.get('CLASSROOM_WEBSOCKET_MSGPACK', 'true').lower() == 'true'
+
+# Classroom broadcasts carry a per-classroom sequence number; the last
+# CLASSROOM_EVENT_REPLAY_SIZE frames are kept so reconnecting clients can resume.
+CLASSROOM_EVENT_REPLAY_SIZE = int(os.environ.get('CLASSROOM_EVENT_REPLAY_SIZE', '500'))
+CLASSROOM_EVENT_REPLAY_TTL_SECONDS = int(os.environ.get('CLASSROOM_EVENT_REPLAY_TTL_SECONDS', '86400'))
+
+# Frames waiting to be written to one WebSocket client. A client that falls this far
+# behind is closed with code 4009 and resumes from its last seq on reconnect.
+CLASSROOM_OUTBOUND_QUEUE_SIZE = int(os.environ.get('CLASSROOM_OUTBOUND_QUEUE_SIZE', '1000'))
+
+# A student who reconnects to the same session within this many seconds of leaving
+# continues their previous attendance record. 0 always starts a new record.
+ATTENDANCE_RECONNECT_GRACE_SECONDS = int(os.environ.get('ATTENDANCE_RECONNECT_GRACE_SECONDS', '120'))
+
+# Attendance records keep a bitmap of the minutes the student was present, up to this many
+# minutes into the session (a week: at most 1260 bytes a record). Gaps between reconnects
+# are kept in it, so a long grace window above loses no detail.
+ATTENDANCE_BITMAP_MAX_MINUTES = int(os.environ.get('ATTENDANCE_BITMAP_MAX_MINUTES', str(7 * 24 * 60)))
+
+# Active attendance records without a heartbeat for this long are closed at their last
+# heartbeat by the sweeper: "manage.py sweep_attendance", or in-process every
+# ATTENDANCE_SWEEP_INTERVAL_SECONDS when that is above 0.
+ATTENDANCE_STALE_AFTER_SECONDS = int(os.environ.get('ATTENDANCE_STALE_AFTER_SECONDS', '120'))
+ATTENDANCE_SWEEP_INTERVAL_SECONDS = float(os.environ.get('ATTENDANCE_SWEEP_INTERVAL_SECONDS', '0'))
+
+# End a classroom's session as soon as its last student disconnects, instead of
+# waiting for the teacher to end it.
+CLASSROOM_AUTO_END_SESSION = os.environ.get('CLASSROOM_AUTO_END_SESSION', 'false').lower() == 'true'
+
+# CSV exports are streamed, reading this many rows per query.
+EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', '2000'))
+
+# Background export jobs ("manage.py run_export_jobs") write gzipped CSVs here and
+# delete them EXPORT_ARTIFACT_TTL_SECONDS after they finish. A running job whose
+# worker has not reported in for EXPORT_JOB_STALE_SECONDS is picked up again, up to
+# EXPORT_JOB_MAX_ATTEMPTS times.
+EXPORT_ARTIFACT_DIR = os.environ.get('EXPORT_ARTIFACT_DIR', str(BASE_DIR / 'exports'))
+EXPORT_ARTIFACT_TTL_SECONDS = int(os.environ.get('EXPORT_ARTIFACT_TTL_SECONDS', str(7 * 86400)))
+EXPORT_JOB_STALE_SECONDS = int(os.environ.get('EXPORT_JOB_STALE_SECONDS', '300'))
+EXPORT_JOB_MAX_ATTEMPTS = int(os.environ.get('EXPORT_JOB_MAX_ATTEMPTS', '3'))
+EXPORT_JOB_POLL_SECONDS = float(os.environ.get('EXPORT_JOB_POLL_SECONDS', '2'))
+
+# Upper bound on the points in a session concurrency timeline; finer bucket_seconds
+# for a session this long are refused.
+SESSION_TIMELINE_MAX_BUCKETS = int(os.environ.get('SESSION_TIMELINE_MAX_BUCKETS', '10000'))
@@ -0,0 +1,121 @@
+"""Stress test for active-session resolution: exactly one session must result.
+
+Run from the backend directory:
+
+    python -m benchmarks.active_session_stress --processes 32 --joiners 1000 --rounds 20
+
+--processes threads race load_or_create_active_session with no shared cache, as separate
+server processes would; --joiners concurrent joins in one process go through the
+single-flight path. Exits non-zero if any round ends with more than one active session.
+"""
+import argparse
+import asyncio
+import sys
+import threading
+
+from benchmarks.common import install_db_latency, print_table, test_database
+
+from django.contrib.auth.models import User
+from django.db import close_old_connections, connection
+from django.db.backends.signals import connection_created
+
+from classroom import db_pool
+from classroom.models import Classroom, ClassroomSession
+from classroom.sessions import active_session_cache, aget_or_create_active_session, load_or_create_active_session
+
+
+class QueryCounter:
+	def __init__(self):
+		self.count = 0
+		self._lock = threading.Lock()
+
+	def __call__(self, execute, sql, params, many, context):
+		with self._lock:
+			self.count += 1
+		return execute(sql, params, many, context)
+
+	def install(self):
+		def attach(sender, connection, **kwargs):
+			connection.execute_wrappers.append(self)
+
+		connection_created.connect(attach, weak=False)
+		connection.execute_wrappers.append(self)
+
+
+def race_processes(classroom_pk, processes):
+	barrier = threading.Barrier(processes)
+	errors = []
+
+	def worker():
+		try:
+			barrier.wait()
+			load_or_create_active_session(classroom_pk)
+		except Exception as exc:
+			errors.append(exc)
+		finally:
+			close_old_connections()
+
+	threads = [threading.Thread(target=worker) for _ in range(processes)]
+	for thread in threads:
+		thread.start()
+	for thread in threads:
+		thread.join()
+	return errors
+
+
+async def join_burst(classroom_pk, joiners):
+	return await asyncio.gather(*(aget_or_create_active_session(classroom_pk) for _ in range(joiners)))
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument('--processes', type=int, default=32)
+	parser.add_argument('--joiners', type=int, default=1000)
+	parser.add_argument('--rounds', type=int, default=20)
+	parser.add_argument('--db-latency-ms', type=float, default=1.0)
+	args = parser.parse_args(argv)
+
+	failed_rounds = 0
+	rows = []
+	with test_database(on_disk=True):
+		teacher = User.objects.create_user(username='bench-teacher', email='bench-teacher@example.com', password='x')
+		install_db_latency(args.db_latency_ms / 1000)
+		counter = QueryCounter()
+		counter.install()
+
+		for scenario in ('processes', 'joiners'):
+			sessions_seen, queries, errors = [], 0, 0
+			for round_index in range(args.rounds):
+				classroom = Classroom.objects.create(owner=teacher, name=f'{scenario} {round_index}')
+				active_session_cache.clear()
+				counter.count = 0
+				if scenario == 'processes':
+					errors += len(race_processes(classroom.pk, args.processes))
+				else:
+					asyncio.run(join_burst(classroom.pk, args.joiners))
+				queries += counter.count
+				active = ClassroomSession.objects.filter(classroom=classroom, is_active=True).count()
+				sessions_seen.append(active)
+				if active != 1:
+					failed_rounds += 1
+
+			callers = args.processes if scenario == 'processes' else args.joiners
+			rows.append((
+				scenario,
+				callers,
+				args.rounds,
+				max(sessions_seen),
+				sum(1 for value in sessions_seen if value == 1),
+				f'{queries / args.rounds:.1f}',
+				errors,
+			))
+
+	db_pool.consumer_db_pool.shutdown()
+	print_table(('scenario', 'callers', 'rounds', 'max active', 'rounds ok', 'queries/round', 'errors'), rows)
+	if failed_rounds:
+		print(f'FAILED: {failed_rounds} rounds did not end with exactly one active session')
+		sys.exit(1)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,132 @@
+"""Attendance CSV export: streamed chunks against the previous single HttpResponse.
+
+Run from the backend directory:
+
+    python -m benchmarks.attendance_export --records 200000
+
+Checks that both produce the same CSV, then reports total time, time until the first
+64 KiB of body is ready, and peak Python memory (tracemalloc) for each.
+"""
+import argparse
+import csv
+import hashlib
+import random
+import time
+import tracemalloc
+from datetime import timedelta
+
+from benchmarks.common import print_table, test_database
+
+from django.contrib.auth.models import User
+from django.http import HttpResponse
+from django.utils import timezone
+
+from classroom.exports import attendance_export_queryset, gzip_chunks, iter_attendance_csv
+from classroom.models import Classroom, ClassroomSession, StudentAttendanceRecord
+
+
+def legacy_export(classroom):
+	# export_attendance_csv before streaming, minus authentication.
+	records = StudentAttendanceRecord.objects.filter(classroom=classroom).select_related('student', 'session').order_by('-joined_at', '-id')
+	response = HttpResponse(content_type='text/csv')
+	writer = csv.writer(response)
+	writer.writerow(['Student Username', 'Student Email', 'Session Title', 'Joined Topic', 'Joined At', 'Left At', 'Duration (Mins)', 'Status'])
+	for r in records:
+		joined = r.joined_at.strftime('%Y-%m-%d %H:%M:%S') if r.joined_at else ''
+		left = r.left_at.strftime('%Y-%m-%d %H:%M:%S') if r.left_at else ('Active' if r.status == 'active' else '')
+		writer.writerow([
+			r.student.username,
+			r.student.email,
+			r.session.title if r.session else 'General Session',
+			r.joined_topic,
+			joined,
+			left,
+			round(r.duration_seconds / 60, 1),
+			r.status.capitalize(),
+		])
+	return [response.content]
+
+
+def seed(student_count, record_count, session_count, seed_value):
+	rng = random.Random(seed_value)
+	teacher = User.objects.create_user(username='bench-teacher', email='bench-teacher@example.com', password='x')
+	classroom = Classroom.objects.create(owner=teacher, name='Export Classroom')
+	students = User.objects.bulk_create(
+		User(username=f'bench-{index}', email=f'bench-{index}@example.com') for index in range(student_count)
+	)
+	sessions = ClassroomSession.objects.bulk_create(
+		ClassroomSession(classroom=classroom, title=f'Session {index}', is_active=False) for index in range(session_count)
+	)
+	started = timezone.now() - timedelta(days=365)
+	records = []
+	for _ in range(record_count):
+		joined_at = started + timedelta(seconds=rng.randrange(365 * 86400))
+		duration = rng.randrange(3600)
+		active = rng.random() < 0.01
+		records.append(StudentAttendanceRecord(
+			classroom=classroom, session=rng.choice(sessions) if rng.random() < 0.95 else None, student=rng.choice(students),
+			joined_at=joined_at, left_at=None if active else joined_at + timedelta(seconds=duration), duration_seconds=duration,
+			status=StudentAttendanceRecord.STATUS_ACTIVE if active else StudentAttendanceRecord.STATUS_LEFT,
+		))
+	StudentAttendanceRecord.objects.bulk_create(records, batch_size=5000)
+	return classroom
+
+
+FIRST_BYTES = 64 * 1024
+
+
+def consume(make_chunks):
+	first = None
+	size = 0
+	started = time.perf_counter()
+	chunks = make_chunks()
+	# Hashed rather than kept, so the measurement holds no more of the body than the export does.
+	digest = hashlib.sha256()
+	for chunk in chunks:
+		size += len(chunk)
+		if first is None and size >= FIRST_BYTES:
+			first = time.perf_counter() - started
+		digest.update(chunk)
+	return digest.hexdigest(), first, time.perf_counter() - started, size
+
+
+def measure(make_chunks):
+	# Timed and traced in separate runs: tracemalloc slows allocation-heavy code several times over.
+	digest, first, total, size = consume(make_chunks)
+	tracemalloc.start()
+	consume(make_chunks)
+	_, peak = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+	return digest, first, total, peak, size
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument('--students', type=int, default=500)
+	parser.add_argument('--records', type=int, default=200000)
+	parser.add_argument('--sessions', type=int, default=200)
+	parser.add_argument('--seed', type=int, default=7)
+	args = parser.parse_args(argv)
+
+	with test_database():
+		classroom = seed(args.students, args.records, args.sessions, args.seed)
+		records = attendance_export_queryset(classroom)
+		rows = []
+		legacy_digest = None
+		for label, make_chunks in (
+			('HttpResponse', lambda: legacy_export(classroom)),
+			('streamed', lambda: iter_attendance_csv(records)),
+			('streamed + gzip', lambda: gzip_chunks(iter_attendance_csv(records))),
+		):
+			digest, first, total, peak, size = measure(make_chunks)
+			if legacy_digest is None:
+				legacy_digest = digest
+			csv_check = '-' if 'gzip' in label else 'same' if digest == legacy_digest else 'differs'
+			rows.append((label, f'{first * 1000:.0f}', f'{total * 1000:.0f}', f'{peak / 2 ** 20:.1f}', f'{size / 2 ** 20:.1f}', csv_check))
+
+	print(f'{args.records} records; times in ms, memory and size in MiB')
+	print_table(('export', 'first 64 KiB', 'total', 'peak memory', 'body', 'csv'), rows)
+
+
+if __name__ == '__main__':
+	main()
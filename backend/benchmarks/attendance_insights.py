@@ -0,0 +1,199 @@
+"""Attendance insights: reads from the rollup table against the original per-record Python loop.
+
+Run from the backend directory:
+
+    python -m benchmarks.attendance_insights --students 2000 --records 200000
+
+Checks that both produce the same summary, student rows and row order on a seeded
+classroom, then times them, along with a full rollup rebuild and what keeping the
+rollups current adds to a heartbeat flush.
+"""
+import argparse
+import random
+import time
+from datetime import timedelta
+from unittest.mock import patch
+
+from benchmarks.common import print_table, test_database
+
+from django.contrib.auth.models import User
+from django.db import connection, reset_queries
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from classroom.heartbeats import PendingHeartbeat, write_heartbeats
+from classroom.insights import attendance_insights
+from classroom.models import Classroom, ClassroomSession, Enrollment, StudentAttendanceRecord
+from classroom.rollups import rebuild_attendance_rollups
+
+
+def legacy_insights(classroom, session_id, present_ids):
+	# classroom_attendance_insights before it moved to SQL, minus the HTTP layer.
+	records_qs = StudentAttendanceRecord.objects.filter(classroom=classroom)
+	if session_id:
+		records_qs = records_qs.filter(session_id=session_id)
+	enrolled_students = User.objects.filter(class_enrollments__classroom=classroom).distinct()
+	total_enrolled = enrolled_students.count()
+
+	student_records_map = {}
+	for rec in records_qs.select_related('student', 'session').order_by('-joined_at', '-id'):
+		is_live = rec.status == StudentAttendanceRecord.STATUS_ACTIVE and rec.student_id in present_ids
+		if rec.student_id not in student_records_map:
+			student_records_map[rec.student_id] = {
+				'records': [], 'total_duration_seconds': 0, 'is_active': False,
+				'latest_joined_at': rec.joined_at, 'latest_left_at': rec.left_at, 'latest_topic': rec.joined_topic,
+			}
+		s_data = student_records_map[rec.student_id]
+		s_data['records'].append(rec)
+		s_data['total_duration_seconds'] += rec.duration_seconds
+		if is_live:
+			s_data['is_active'] = True
+
+	student_insights = []
+	total_attended = len(student_records_map)
+	active_now_count = 0
+	sum_duration_secs = 0
+	for s in enrolled_students.order_by('id'):
+		s_info = student_records_map.get(s.id)
+		base = {'student_id': s.id, 'username': s.username, 'email': s.email, 'full_name': s.get_full_name() or s.username}
+		if not s_info:
+			student_insights.append({
+				**base, 'status': 'Absent', 'total_duration_minutes': 0, 'joined_at': None, 'left_at': None,
+				'joined_topic': 'N/A', 'engagement': 'None', 'sessions_attended_count': 0,
+			})
+			continue
+		duration_mins = round(s_info['total_duration_seconds'] / 60, 1)
+		sum_duration_secs += s_info['total_duration_seconds']
+		if s_info['is_active']:
+			active_now_count += 1
+		engagement = 'High' if duration_mins >= 15 else 'Moderate' if duration_mins >= 5 else 'Low'
+		student_insights.append({
+			**base,
+			'status': 'Active Now' if s_info['is_active'] else 'Left',
+			'total_duration_minutes': duration_mins,
+			'joined_at': s_info['latest_joined_at'].isoformat() if s_info['latest_joined_at'] else None,
+			'left_at': s_info['latest_left_at'].isoformat() if s_info['latest_left_at'] else None,
+			'joined_topic': s_info['latest_topic'],
+			'engagement': engagement,
+			'sessions_attended_count': len(s_info['records']),
+		})
+	student_insights.sort(key=lambda x: (x['status'] != 'Active Now', -x['total_duration_minutes']))
+
+	return {
+		'summary': {
+			'total_enrolled': total_enrolled,
+			'total_attended': total_attended,
+			'active_now': active_now_count,
+			'attendance_rate': round((total_attended / total_enrolled * 100), 1) if total_enrolled > 0 else 0,
+			'avg_duration_minutes': round((sum_duration_secs / total_attended / 60), 1) if total_attended > 0 else 0,
+		},
+		'students': student_insights,
+	}
+
+
+def seed(student_count, record_count, session_count, seed_value):
+	rng = random.Random(seed_value)
+	teacher = User.objects.create_user(username='bench-teacher', email='bench-teacher@example.com', password='x')
+	classroom = Classroom.objects.create(owner=teacher, name='Insights Classroom')
+	students = User.objects.bulk_create(
+		User(username=f'bench-{index}', email=f'bench-{index}@example.com', first_name='' if index % 3 else f'First{index}')
+		for index in range(student_count)
+	)
+	# A few students with history who are no longer enrolled.
+	Enrollment.objects.bulk_create(Enrollment(classroom=classroom, student=student) for student in students[: student_count - 20])
+
+	started = timezone.now() - timedelta(days=session_count)
+	sessions = ClassroomSession.objects.bulk_create(
+		ClassroomSession(classroom=classroom, title=f'Session {index}', is_active=index == session_count - 1)
+		for index in range(session_count)
+	)
+	topics = ['Fractions', 'Decimals', 'Geometry', 'Live Classroom']
+	records = []
+	for _ in range(record_count):
+		# Skewed so some students have long histories and some none at all.
+		student = students[int(rng.random() ** 2 * (student_count - 40))]
+		index = rng.randrange(session_count)
+		joined_at = started + timedelta(days=index, seconds=rng.randrange(3600))
+		duration = rng.randrange(0, 3600)
+		active = index == session_count - 1 and rng.random() < 0.3
+		records.append(StudentAttendanceRecord(
+			classroom=classroom, session=sessions[index], student=student, joined_at=joined_at,
+			left_at=None if active else joined_at + timedelta(seconds=duration),
+			duration_seconds=duration, joined_topic=rng.choice(topics),
+			status=StudentAttendanceRecord.STATUS_ACTIVE if active else StudentAttendanceRecord.STATUS_LEFT,
+		))
+	StudentAttendanceRecord.objects.bulk_create(records, batch_size=5000)
+	present_ids = {student.id: 0 for student in students[: student_count // 2] if rng.random() < 0.2}
+	return classroom, sessions, present_ids
+
+
+def compare(legacy, current):
+	by_id = {row['student_id']: row for row in current['students']}
+	return {
+		'summary': legacy['summary'] == current['summary'],
+		'rows': sum(1 for row in legacy['students'] if by_id.get(row['student_id']) != row),
+		'order': sum(1 for old, new in zip(legacy['students'], current['students']) if old['student_id'] != new['student_id']),
+	}
+
+
+def timed(func, repeats):
+	best = float('inf')
+	for _ in range(repeats):
+		reset_queries()
+		with CaptureQueriesContext(connection) as queries:
+			started = time.perf_counter()
+			result = func()
+			best = min(best, time.perf_counter() - started)
+	return result, best, len(queries)
+
+
+def heartbeat_entries(session):
+	entries = []
+	for record in StudentAttendanceRecord.objects.filter(session=session, status=StudentAttendanceRecord.STATUS_ACTIVE):
+		seen_at = record.joined_at + timedelta(seconds=record.duration_seconds + 30)
+		entries.append((record.id, PendingHeartbeat(time.time(), record.joined_at, seen_at, None)))
+	return entries
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument('--students', type=int, default=2000)
+	parser.add_argument('--records', type=int, default=200000)
+	parser.add_argument('--sessions', type=int, default=120)
+	parser.add_argument('--repeats', type=int, default=3)
+	parser.add_argument('--seed', type=int, default=7)
+	args = parser.parse_args(argv)
+
+	with test_database():
+		classroom, sessions, present_ids = seed(args.students, args.records, args.sessions, args.seed)
+		session_ids = [session.id for session in sessions]
+		rollups, rebuild_s, _ = timed(lambda: rebuild_attendance_rollups(session_ids), 1)
+
+		entries = heartbeat_entries(sessions[-1])
+		with patch('classroom.heartbeats.add_to_rollups', lambda changes, records: 0):
+			_, records_only_s, records_only_q = timed(lambda: write_heartbeats(entries), args.repeats)
+		_, flush_s, flush_q = timed(lambda: write_heartbeats(entries), args.repeats)
+
+		rows = []
+		for label, session_id in (('all sessions', None), ('one session', sessions[-1].id)):
+			legacy, legacy_s, legacy_q = timed(lambda: legacy_insights(classroom, session_id, present_ids), args.repeats)
+			current, sql_s, sql_q = timed(lambda: attendance_insights(classroom, session_id, present_ids), args.repeats)
+			_, page_s, page_q = timed(lambda: attendance_insights(classroom, session_id, present_ids, limit=50), args.repeats)
+			diff = compare(legacy, current)
+			rows.append((
+				label, f'{legacy_s * 1000:.0f} ({legacy_q}q)', f'{sql_s * 1000:.0f} ({sql_q}q)', f'{page_s * 1000:.0f}',
+				'same' if diff['summary'] else 'differs', diff['rows'], diff['order'],
+			))
+
+	print(f'{args.students} students, {args.records} records, {args.sessions} sessions; best of {args.repeats}, ms')
+	print_table(('scope', 'python loop', 'rollups', 'rollups page=50', 'summary', 'rows differing', 'positions differing'), rows)
+	print()
+	print(f'rebuild: {rollups} rollups in {rebuild_s * 1000:.0f} ms')
+	print(
+		f'heartbeat flush of {len(entries)} records: {records_only_s * 1000:.1f} ms ({records_only_q}q) without rollups, '
+		f'{flush_s * 1000:.1f} ms ({flush_q}q) with'
+	)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,61 @@
+"""Student x session attendance matrix: one rollup query against an insights call per session.
+
+Run from the backend directory:
+
+    python -m benchmarks.attendance_matrix --students 2000 --sessions 120
+
+Seeds the same classroom as benchmarks.attendance_insights, checks that the matrix
+holds the minutes the per-session insights report, then times both and each ordering.
+"""
+import argparse
+
+from benchmarks.attendance_insights import seed, timed
+from benchmarks.common import print_table, test_database
+
+from classroom.insights import attendance_insights
+from classroom.matrix import ORDERS, attendance_matrix
+from classroom.rollups import rebuild_attendance_rollups
+
+
+def per_session_matrix(classroom, sessions):
+	# What a heatmap costs today: classroom_attendance_insights once per session.
+	return {
+		session.id: {row['student_id']: row['total_duration_minutes'] for row in attendance_insights(classroom, session.id)['students']}
+		for session in sessions
+	}
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument('--students', type=int, default=2000)
+	parser.add_argument('--records', type=int, default=200000)
+	parser.add_argument('--sessions', type=int, default=120)
+	parser.add_argument('--repeats', type=int, default=3)
+	parser.add_argument('--seed', type=int, default=7)
+	args = parser.parse_args(argv)
+
+	with test_database():
+		classroom, sessions, _ = seed(args.students, args.records, args.sessions, args.seed)
+		rebuild_attendance_rollups([session.id for session in sessions])
+
+		legacy, legacy_s, legacy_q = timed(lambda: per_session_matrix(classroom, sessions), 1)
+		matrix, _, _ = timed(lambda: attendance_matrix(classroom), 1)
+		width = matrix['shape'][1]
+		differing = sum(
+			1
+			for row, student_id in enumerate(matrix['students']['ids'])
+			for column, session_id in enumerate(matrix['sessions']['ids'])
+			if legacy[session_id][student_id] != matrix['minutes'][row * width + column]
+		)
+
+		rows = [('insights per session', f'{legacy_s * 1000:.0f}', legacy_q, '-')]
+		for order in ORDERS:
+			_, matrix_s, matrix_q = timed(lambda: attendance_matrix(classroom, order), args.repeats)
+			rows.append((f'matrix order={order}', f'{matrix_s * 1000:.0f}', matrix_q, differing))
+
+	print(f"{args.students} students, {args.records} records, {args.sessions} sessions; {matrix['shape'][0]} x {width} cells; ms")
+	print_table(('approach', 'time', 'queries', 'cells differing'), rows)
+
+
+if __name__ == '__main__':
+	main()
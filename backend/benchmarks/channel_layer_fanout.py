@@ -0,0 +1,86 @@
+"""Group broadcast cost of the channel-layer backends at different group sizes.
+
+Run from the backend directory:
+
+    python -m benchmarks.channel_layer_fanout --group-sizes 100,1000,5000 --redis-url redis://localhost:6379/0
+
+Without --redis-url only the in-memory variants run. Each row is the time from the first
+group_send until every member has received every broadcast.
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks.common import print_table
+
+from channels.layers import InMemoryChannelLayer
+
+from classroom.channel_layers import ProcessLocalGroupChannelLayer
+from classroom.events import event_frame_message
+
+
+def layer_factories(redis_url):
+	factories = [
+		('InMemoryChannelLayer', 'n/a', lambda: InMemoryChannelLayer(capacity=1000)),
+		('ProcessLocalGroupChannelLayer', 'n/a', lambda: ProcessLocalGroupChannelLayer(capacity=1000)),
+	]
+	if redis_url:
+		from channels_redis.core import RedisChannelLayer
+		from channels_redis.pubsub import RedisPubSubChannelLayer
+
+		factories += [
+			('RedisChannelLayer', 'one per member', lambda: RedisChannelLayer(hosts=[redis_url], capacity=1000)),
+			('RedisPubSubChannelLayer', 'one', lambda: RedisPubSubChannelLayer(hosts=[redis_url])),
+			('ProcessLocalGroupChannelLayer + Redis', 'one', lambda: ProcessLocalGroupChannelLayer(hosts=[redis_url], capacity=1000)),
+		]
+	return factories
+
+
+async def run(layer, group_size, broadcasts):
+	group = 'classroom_benchmark_notes'
+	channels = [await layer.new_channel() for _ in range(group_size)]
+	for channel in channels:
+		await layer.group_add(group, channel)
+
+	async def member(channel):
+		for _ in range(broadcasts):
+			await layer.receive(channel)
+
+	receivers = [asyncio.ensure_future(member(channel)) for channel in channels]
+	await asyncio.sleep(0.2)
+
+	message = event_frame_message('note_displayed', {'id': 1, 'title': 'Benchmark', 'content': 'x' * 2048})
+	started = time.perf_counter()
+	cpu_started = time.process_time()
+	for _ in range(broadcasts):
+		await layer.group_send(group, message)
+	await asyncio.wait_for(asyncio.gather(*receivers), timeout=300)
+	elapsed = time.perf_counter() - started
+	cpu = time.process_time() - cpu_started
+
+	for channel in channels:
+		await layer.group_discard(group, channel)
+	if hasattr(layer, 'flush'):
+		await layer.flush()
+	return elapsed / broadcasts, cpu / broadcasts
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument('--group-sizes', default='100,1000,5000')
+	parser.add_argument('--broadcasts', type=int, default=5)
+	parser.add_argument('--redis-url', default='')
+	args = parser.parse_args(argv)
+
+	rows = []
+	for size in (int(value) for value in args.group_sizes.split(',')):
+		for name, publishes, factory in layer_factories(args.redis_url):
+			elapsed, cpu = asyncio.run(run(factory(), size, args.broadcasts))
+			rows.append((size, name, publishes, f'{elapsed * 1000:.1f}', f'{cpu * 1000:.1f}'))
+
+	print(f'{args.broadcasts} broadcasts per group, 2 KB payload')
+	print_table(('members', 'layer', 'Redis writes/event', 'ms per broadcast', 'CPU ms per broadcast'), rows)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,70 @@
+import contextlib
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+
+import django
+
+django.setup()
+
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+
+@contextlib.contextmanager
+def test_database(on_disk=False):
+	# Benchmarks run against a throwaway test database, never the configured one.
+	# SQLite's shared in-memory database fails concurrent writers with "table is
+	# locked" instead of waiting, so multi-threaded write benchmarks use a file.
+	if on_disk and connection.vendor == 'sqlite':
+		directory = tempfile.mkdtemp(prefix='lessonlive-bench-')
+		connection.settings_dict['TEST']['NAME'] = os.path.join(directory, 'bench.sqlite3')
+		connection.settings_dict.setdefault('OPTIONS', {})['timeout'] = 60
+	setup_test_environment()
+	old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=False)
+	try:
+		yield
+	finally:
+		connection.creation.destroy_test_db(old_name, verbosity=0)
+		teardown_test_environment()
+
+
+def install_db_latency(seconds):
+	# Delays every query on every connection (including ones opened later by worker
+	# threads) so in-memory SQLite behaves more like a networked database.
+	if not seconds:
+		return
+
+	def wrapper(execute, sql, params, many, context):
+		time.sleep(seconds)
+		return execute(sql, params, many, context)
+
+	def install(sender, connection, **kwargs):
+		connection.execute_wrappers.append(wrapper)
+
+	connection_created.connect(install, weak=False)
+	for existing in connections.all(initialized_only=True):
+		existing.execute_wrappers.append(wrapper)
+
+
+def percentile(samples, pct):
+	if not samples:
+		return 0.0
+	ordered = sorted(samples)
+	index = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+	return ordered[index]
+
+
+def print_table(headers, rows):
+	widths = [max(len(str(value)) for value in column) for column in zip(headers, *rows)]
+	line = '  '.join(f'{{:<{width}}}' for width in widths)
+	print(line.format(*headers))
+	print(line.format(*('-' * width for width in widths)))
+	for row in rows:
+		print(line.format(*row))
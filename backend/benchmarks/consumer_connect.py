@@ -0,0 +1,131 @@
+"""Connect/disconnect latency of ClassroomNoteConsumer under a burst of simultaneous students.
+
+Run from the backend directory:
+
+    python -m benchmarks.consumer_connect --connections 1000 --pool-sizes 0,4,16,32 --db-latency-ms 2
+
+Pool size 0 is the previous behaviour: every consumer DB call goes through Channels'
+single thread-sensitive executor.
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks.common import install_db_latency, percentile, print_table, test_database
+
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import User
+from django.test import override_settings
+
+from authentication.auth_cache import user_cache
+from authentication.jwt_auth import issue_tokens_for_user
+from authentication.models import UserProfile
+from classroom import db_pool
+from classroom.access_cache import clear_access_cache
+from classroom.connect_pipeline import CONNECT_STAGES, connect_timing_stats, reset_connect_timing_stats
+from classroom.models import Classroom, Enrollment, StudentAttendanceRecord
+from classroom.routing import websocket_urlpatterns
+from classroom.sessions import active_session_cache
+
+
+def seed(student_count):
+	teacher = User.objects.create_user(username='bench-teacher', email='bench-teacher@example.com', password='x')
+	UserProfile.objects.create(user=teacher, role=UserProfile.ROLE_TEACHER)
+	classroom = Classroom.objects.create(owner=teacher, name='Benchmark Classroom')
+
+	students = User.objects.bulk_create(
+		User(username=f'bench-{index}', email=f'bench-{index}@example.com') for index in range(student_count)
+	)
+	UserProfile.objects.bulk_create(UserProfile(user=student, role=UserProfile.ROLE_STUDENT) for student in students)
+	Enrollment.objects.bulk_create(Enrollment(classroom=classroom, student=student) for student in students)
+	tokens = [issue_tokens_for_user(student)['access'] for student in students]
+	return classroom, tokens
+
+
+async def run_burst(application, class_id, tokens):
+	async def connect(token):
+		communicator = WebsocketCommunicator(application, f'/ws/classrooms/{class_id}/notes/?token={token}')
+		started = time.perf_counter()
+		connected, _ = await communicator.connect(timeout=120)
+		return communicator, connected, time.perf_counter() - started
+
+	started = time.perf_counter()
+	results = await asyncio.gather(*(connect(token) for token in tokens))
+	connect_wall = time.perf_counter() - started
+
+	# Connects return before the attendance join is written; wait for every record.
+	expected = sum(1 for _, connected, _ in results if connected)
+	while await StudentAttendanceRecord.objects.filter(status=StudentAttendanceRecord.STATUS_ACTIVE).acount() < expected:
+		await asyncio.sleep(0.05)
+	joins_done = time.perf_counter() - started
+
+	async def disconnect(communicator):
+		disconnect_started = time.perf_counter()
+		await communicator.disconnect(timeout=120)
+		return time.perf_counter() - disconnect_started
+
+	disconnect_latencies = await asyncio.gather(
+		*(disconnect(communicator) for communicator, connected, _ in results if connected)
+	)
+	connect_latencies = [latency for _, connected, latency in results if connected]
+	return len(tokens) - expected, connect_latencies, connect_wall, joins_done, disconnect_latencies
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument('--connections', type=int, default=1000)
+	parser.add_argument('--pool-sizes', default='0,4,16,32')
+	parser.add_argument('--db-latency-ms', type=float, default=2.0)
+	args = parser.parse_args(argv)
+
+	layers = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+	rows = []
+	stage_rows = []
+	with test_database(on_disk=True), override_settings(CHANNEL_LAYERS=layers, CLASSROOM_CONNECT_SLOW_LOG_MS=float('inf')):
+		classroom, tokens = seed(args.connections)
+		install_db_latency(args.db_latency_ms / 1000)
+		application = URLRouter(websocket_urlpatterns)
+
+		for size in (int(value) for value in args.pool_sizes.split(',')):
+			user_cache.clear()
+			clear_access_cache()
+			active_session_cache.clear()
+			reset_connect_timing_stats()
+			StudentAttendanceRecord.objects.all().delete()
+			db_pool.consumer_db_pool = db_pool.DatabaseWorkerPool(size)
+
+			failed, connects, connect_wall, joins_done, disconnects = asyncio.run(
+				run_burst(application, classroom.class_id, tokens)
+			)
+			stats = db_pool.consumer_db_pool.stats()
+			db_pool.consumer_db_pool.shutdown()
+			rows.append((
+				size or 'thread-sensitive',
+				f'{percentile(connects, 50) * 1000:.0f}',
+				f'{percentile(connects, 99) * 1000:.0f}',
+				f'{connect_wall:.2f}',
+				f'{joins_done:.2f}',
+				f'{percentile(disconnects, 99) * 1000:.0f}',
+				stats['peak_queue_depth'] if size else '-',
+				f"{stats['wait']['p99_ms']:.0f}" if size else '-',
+				failed,
+			))
+			stages = connect_timing_stats()
+			stage_rows.append((size or 'thread-sensitive',) + tuple(
+				f"{stages[stage]['p50_ms']:.0f} / {stages[stage]['p99_ms']:.0f}" for stage in CONNECT_STAGES + ('total',)
+			))
+
+	print(f'{args.connections} simultaneous connections, simulated query latency {args.db_latency_ms} ms')
+	print_table(
+		('pool', 'connect p50 ms', 'connect p99 ms', 'all connected s', 'all joined s',
+			'disconnect p99 ms', 'peak queue', 'wait p99 ms', 'failed'),
+		rows,
+	)
+	print()
+	print('Per-stage connect time, p50 / p99 ms (session only runs for the first joiners of a classroom)')
+	print_table(('pool',) + CONNECT_STAGES + ('total',), stage_rows)
+
+
+if __name__ == '__main__':
+	main()
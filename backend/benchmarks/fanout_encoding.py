@@ -0,0 +1,106 @@
+"""CPU cost of delivering one classroom broadcast to every consumer in a group.
+
+Run from the backend directory:
+
+    python -m benchmarks.fanout_encoding --group-sizes 10,100,600,1000 --content-kb 8
+
+Compares the legacy note.event message (each consumer JSON-encodes the payload itself)
+with note.frame (encoded once by the broadcaster, forwarded verbatim). Consumers write to
+an in-memory sink, so the numbers isolate per-consumer handling from transport costs.
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks.common import print_table
+
+from classroom.consumers import ClassroomNoteConsumer
+from classroom.events import event_frame_message
+from classroom.outbound import OutboundQueue
+
+
+def build_payload(content_kb):
+	return {
+		'id': 42,
+		'note_id': 17,
+		'index': 3,
+		'title': 'Photosynthesis',
+		'content': ('Light reactions convert light energy into chemical energy. ' * 200)[:content_kb * 1024],
+		'saved_date': '2026-10-17T09:00:00+00:00',
+		'displayed_date': '2026-10-17T09:05:00+00:00',
+	}
+
+
+def build_consumers(count):
+	sent = []
+
+	async def sink(message):
+		sent.append(message)
+
+	consumers = []
+	for _ in range(count):
+		consumer = ClassroomNoteConsumer()
+		consumer.base_send = sink
+		consumer.use_msgpack = False
+		consumer.outbound = OutboundQueue(maxsize=1_000_000)
+		consumers.append(consumer)
+	return consumers, sent
+
+
+async def deliver_legacy(consumers, payload):
+	event = {'type': 'note.event', 'event_type': 'note_displayed', 'payload': payload}
+	for consumer in consumers:
+		await consumer.note_event(event)
+
+
+async def deliver_encoded(consumers, payload):
+	event = event_frame_message('note_displayed', payload)
+	for consumer in consumers:
+		await consumer.note_frame(event)
+
+
+async def drain(consumers):
+	# What each connection's writer task does, inlined so the run is deterministic.
+	for consumer in consumers:
+		while consumer.outbound.depth:
+			await consumer._send_frame(*await consumer.outbound.get())
+
+
+def measure(deliver, consumers, sent, payload, repeats):
+	async def run():
+		for _ in range(repeats):
+			await deliver(consumers, payload)
+			await drain(consumers)
+			sent.clear()
+
+	started = time.process_time()
+	asyncio.run(run())
+	return (time.process_time() - started) / repeats
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument('--group-sizes', default='10,100,600,1000')
+	parser.add_argument('--content-kb', type=int, default=8)
+	parser.add_argument('--repeats', type=int, default=20)
+	args = parser.parse_args(argv)
+
+	payload = build_payload(args.content_kb)
+	rows = []
+	for size in (int(value) for value in args.group_sizes.split(',')):
+		consumers, sent = build_consumers(size)
+		legacy = measure(deliver_legacy, consumers, sent, payload, args.repeats)
+		encoded = measure(deliver_encoded, consumers, sent, payload, args.repeats)
+		rows.append((
+			size,
+			f'{legacy * 1000:.2f}',
+			f'{encoded * 1000:.2f}',
+			f'{legacy / encoded:.1f}x' if encoded else '-',
+		))
+
+	print(f'CPU per broadcast, {args.content_kb} KB note content, mean of {args.repeats} broadcasts')
+	print_table(('group size', 'send_json ms', 'pre-encoded ms', 'speedup'), rows)
+
+
+if __name__ == '__main__':
+	main()
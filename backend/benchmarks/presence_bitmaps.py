@@ -0,0 +1,114 @@
+"""Presence bitmaps: bulk NumPy aggregation against per-record Python ints, and the flush cost.
+
+Run from the backend directory:
+
+    python -m benchmarks.presence_bitmaps --students 2000 --visits 5
+
+Seeds one three-hour session whose students reconnect a few times each, checks that
+both aggregations agree on per-student minutes and per-minute head counts, times them,
+then times a heartbeat flush with and without marking the bitmaps.
+"""
+import argparse
+import random
+import time
+from datetime import timedelta
+from unittest.mock import patch
+
+from benchmarks.attendance_insights import timed
+from benchmarks.common import print_table, test_database
+
+from django.contrib.auth.models import User
+from django.utils import timezone
+
+from classroom.bitmaps import mark_presence, popcount, presence_per_minute, session_presence
+from classroom.heartbeats import PendingHeartbeat, write_heartbeats
+from classroom.models import Classroom, ClassroomSession, StudentAttendanceRecord
+from classroom.rollups import refresh_attendance_rollups
+
+
+def python_aggregates(session, minutes):
+	# The same answers with one Python int per record.
+	per_student = {}
+	for student_id, presence in StudentAttendanceRecord.objects.filter(session=session).values_list('student_id', 'presence'):
+		value = int.from_bytes(bytes(presence).ljust(-(-minutes // 8), b'\0')[:-(-minutes // 8)], 'big')
+		per_student[student_id] = per_student.get(student_id, 0) | value
+	width = -(-minutes // 8) * 8
+	attended = {student_id: value.bit_count() for student_id, value in per_student.items()}
+	head_count = [sum(value >> (width - 1 - minute) & 1 for value in per_student.values()) for minute in range(minutes)]
+	return attended, head_count
+
+
+def numpy_aggregates(session, minutes):
+	student_ids, matrix = session_presence(session, minutes)
+	return dict(zip(student_ids.tolist(), popcount(matrix).tolist())), presence_per_minute(matrix, minutes).tolist()
+
+
+def seed(student_count, visits, minutes, seed_value):
+	rng = random.Random(seed_value)
+	teacher = User.objects.create_user(username='bench-teacher', email='bench-teacher@example.com', password='x')
+	classroom = Classroom.objects.create(owner=teacher, name='Bitmap Classroom')
+	students = User.objects.bulk_create(User(username=f'bench-{index}') for index in range(student_count))
+	session = ClassroomSession.objects.create(classroom=classroom, title='Long Session')
+	started_at = timezone.now() - timedelta(minutes=minutes)
+	ClassroomSession.objects.filter(id=session.id).update(started_at=started_at)
+	records = []
+	for student in students:
+		for _ in range(visits):
+			joined = rng.randrange(minutes * 60)
+			left = min(minutes * 60 - 1, joined + rng.randrange(60, 3600))
+			joined_at, left_at = started_at + timedelta(seconds=joined), started_at + timedelta(seconds=left)
+			records.append(StudentAttendanceRecord(
+				classroom=classroom, session=session, student=student, joined_at=joined_at, left_at=left_at,
+				duration_seconds=left - joined, status=StudentAttendanceRecord.STATUS_LEFT,
+				presence=mark_presence(b'', started_at, joined_at, left_at),
+			))
+	StudentAttendanceRecord.objects.bulk_create(records, batch_size=5000)
+	return ClassroomSession.objects.get(id=session.id), classroom, students
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument('--students', type=int, default=2000)
+	parser.add_argument('--visits', type=int, default=5)
+	parser.add_argument('--minutes', type=int, default=180)
+	parser.add_argument('--flush', type=int, default=500, help='active records in the heartbeat flush')
+	parser.add_argument('--repeats', type=int, default=3)
+	parser.add_argument('--seed', type=int, default=7)
+	args = parser.parse_args(argv)
+
+	with test_database():
+		session, classroom, students = seed(args.students, args.visits, args.minutes, args.seed)
+		expected, python_s, _ = timed(lambda: python_aggregates(session, args.minutes), args.repeats)
+		result, numpy_s, numpy_q = timed(lambda: numpy_aggregates(session, args.minutes), args.repeats)
+		stored = sum(len(bytes(presence)) for presence in StudentAttendanceRecord.objects.values_list('presence', flat=True))
+
+		now = timezone.now()
+		active = StudentAttendanceRecord.objects.bulk_create(
+			StudentAttendanceRecord(
+				classroom=classroom, session=session, student=student, joined_at=now - timedelta(minutes=30),
+				last_seen_at=now - timedelta(minutes=1),
+			)
+			for student in students[:args.flush]
+		)
+		refresh_attendance_rollups(StudentAttendanceRecord.objects.filter(id__in=[record.id for record in active]))
+		entries = [(record.id, PendingHeartbeat(time.time(), record.joined_at, now, None)) for record in active]
+		with patch('classroom.heartbeats.mark_presence', lambda bitmap, *args: bitmap):
+			_, plain_s, plain_q = timed(lambda: write_heartbeats(entries), args.repeats)
+		_, bitmap_s, bitmap_q = timed(lambda: write_heartbeats(entries), args.repeats)
+
+	records = args.students * args.visits
+	print(f'{records} records, {args.students} students, {args.minutes} minute session; best of {args.repeats}, ms')
+	print_table(('aggregation', 'time', 'agrees'), [
+		('python ints per record', f'{python_s * 1000:.1f}', '-'),
+		(f'numpy packed matrix ({numpy_q}q)', f'{numpy_s * 1000:.1f}', 'yes' if result == expected else 'no'),
+	])
+	print()
+	print(f'bitmaps stored: {stored / records:.1f} bytes a record')
+	print(
+		f'heartbeat flush of {args.flush} records: {plain_s * 1000:.1f} ms ({plain_q}q) without bitmaps, '
+		f'{bitmap_s * 1000:.1f} ms ({bitmap_q}q) with'
+	)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,187 @@
+"""Concurrent-request throughput of the async read endpoints against equivalent sync views.
+
+Run from the backend directory:
+
+    python -m benchmarks.read_endpoints --requests 2000 --concurrency 100 --db-latency-ms 2
+"""
+import argparse
+import asyncio
+import sys
+import time
+
+from benchmarks.common import install_db_latency, percentile, print_table, test_database
+
+from django.contrib.auth.models import User
+from django.db.models import Prefetch
+from django.http import JsonResponse
+from channels.testing import HttpCommunicator
+from django.core.asgi import get_asgi_application
+from django.test import override_settings
+from django.urls import path
+
+from authentication import views as auth_views
+from authentication.auth_cache import get_user_role
+from authentication.jwt_auth import get_user_from_request, issue_tokens_for_user
+from authentication.models import UserProfile
+from classroom import views as classroom_views
+from classroom.models import Classroom, ClassroomNote, DisplayedClassroomNote, Enrollment
+from examination import views as exam_views
+from examination.models import ClassroomQuestion, ExamTimingSettings, QuestionAnswer
+
+
+def sync_me(request):
+	user = get_user_from_request(request)
+	if user is None:
+		return JsonResponse({'authenticated': False})
+	return JsonResponse({'authenticated': True, 'id': user.id, 'email': user.email, 'role': get_user_role(user)})
+
+
+def sync_notes(request, class_id):
+	_, classroom, _, error_response = classroom_views._require_class_member(request, class_id)
+	if error_response:
+		return error_response
+	notes = ClassroomNote.objects.filter(classroom=classroom).order_by('note_index', 'id')
+	return JsonResponse({'notes': [classroom_views._serialize_saved_note(note) for note in notes]})
+
+
+def sync_displayed_notes(request, class_id):
+	_, classroom, _, error_response = classroom_views._require_class_member(request, class_id)
+	if error_response:
+		return error_response
+	displayed = DisplayedClassroomNote.objects.filter(classroom=classroom).select_related('note').order_by('displayed_at', 'id')
+	return JsonResponse({'displayed_notes': [classroom_views._serialize_displayed_note(item) for item in displayed]})
+
+
+def sync_questions(request, class_id):
+	_, classroom, is_owner, error_response = exam_views._require_class_member(request, class_id)
+	if error_response:
+		return error_response
+	questions = (
+		ClassroomQuestion.objects
+		.filter(classroom=classroom)
+		.select_related('classroom')
+		.prefetch_related(Prefetch('answers', queryset=QuestionAnswer.objects.order_by('position', 'id')))
+		.order_by('id')
+	)
+	return JsonResponse({'questions': [exam_views._serialize_question(question, include_correct=is_owner) for question in questions]})
+
+
+urlpatterns = [
+	path('sync/me/', sync_me),
+	path('sync/<str:class_id>/notes/', sync_notes),
+	path('sync/<str:class_id>/displayed-notes/', sync_displayed_notes),
+	path('sync/<str:class_id>/questions/', sync_questions),
+	path('async/me/', auth_views.me),
+	path('async/<str:class_id>/notes/', classroom_views.classroom_notes),
+	path('async/<str:class_id>/displayed-notes/', classroom_views.displayed_notes),
+	path('async/<str:class_id>/notifications/', classroom_views.list_notifications),
+	path('async/<str:class_id>/questions/', exam_views.classroom_questions),
+	path('async/<str:class_id>/timing/', exam_views.classroom_timing_settings),
+]
+
+
+def seed(student_count):
+	teacher = User.objects.create_user(username='bench-teacher', email='bench-teacher@example.com', password='x')
+	UserProfile.objects.create(user=teacher, role=UserProfile.ROLE_TEACHER)
+	classroom = Classroom.objects.create(owner=teacher, name='Benchmark Classroom')
+
+	students = []
+	for index in range(student_count):
+		student = User.objects.create_user(username=f'bench-{index}', email=f'bench-{index}@example.com', password='x')
+		UserProfile.objects.create(user=student, role=UserProfile.ROLE_STUDENT)
+		Enrollment.objects.create(classroom=classroom, student=student)
+		students.append(student)
+
+	for index in range(30):
+		note = ClassroomNote.objects.create(classroom=classroom, title=f'Note {index}', content='Lorem ipsum ' * 40)
+		if index % 6 == 0:
+			DisplayedClassroomNote.objects.create(classroom=classroom, note=note, displayed_by=teacher)
+
+	for index in range(10):
+		question = ClassroomQuestion.objects.create(classroom=classroom, created_by=teacher, prompt=f'Question {index}?')
+		QuestionAnswer.objects.bulk_create(
+			QuestionAnswer(question=question, text=f'Answer {position}', is_correct=position == 1, position=position)
+			for position in range(1, 5)
+		)
+
+	ExamTimingSettings.objects.create(
+		classroom=classroom, mode=ExamTimingSettings.MODE_TOTAL, total_seconds=600, updated_by=teacher,
+	)
+	tokens = [issue_tokens_for_user(student, include_claims=True)['access'] for student in students]
+	return classroom, tokens
+
+
+async def run_load(application, url, tokens, total_requests, concurrency):
+	# Requests go through Django's real ASGI handler, as they do under Daphne.
+	semaphore = asyncio.Semaphore(concurrency)
+	latencies = []
+	failures = 0
+
+	async def one(index):
+		nonlocal failures
+		headers = [
+			(b'host', b'testserver'),
+			(b'authorization', f'Bearer {tokens[index % len(tokens)]}'.encode('ascii')),
+		]
+		async with semaphore:
+			started = time.perf_counter()
+			response = await HttpCommunicator(application, 'GET', url, headers=headers).get_response(timeout=60)
+			latencies.append(time.perf_counter() - started)
+			if response['status'] != 200:
+				failures += 1
+
+	# Warm caches and connections so both variants are measured in steady state.
+	await asyncio.gather(*(one(index) for index in range(min(len(tokens), total_requests))))
+	latencies.clear()
+
+	started = time.perf_counter()
+	await asyncio.gather(*(one(index) for index in range(total_requests)))
+	elapsed = time.perf_counter() - started
+	return total_requests / elapsed, latencies, failures
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument('--requests', type=int, default=1000)
+	parser.add_argument('--concurrency', type=int, default=50)
+	parser.add_argument('--students', type=int, default=50)
+	parser.add_argument('--db-latency-ms', type=float, default=1.0)
+	args = parser.parse_args(argv)
+
+	with test_database(), override_settings(ROOT_URLCONF=sys.modules[__name__]):
+		classroom, tokens = seed(args.students)
+		install_db_latency(args.db_latency_ms / 1000)
+		application = get_asgi_application()
+
+		endpoints = [
+			('me', '/sync/me/', '/async/me/'),
+			('notes', f'/sync/{classroom.class_id}/notes/', f'/async/{classroom.class_id}/notes/'),
+			('displayed-notes', f'/sync/{classroom.class_id}/displayed-notes/', f'/async/{classroom.class_id}/displayed-notes/'),
+			('questions', f'/sync/{classroom.class_id}/questions/', f'/async/{classroom.class_id}/questions/'),
+			('notifications', None, f'/async/{classroom.class_id}/notifications/'),
+			('timing', None, f'/async/{classroom.class_id}/timing/'),
+		]
+
+		rows = []
+		for name, sync_url, async_url in endpoints:
+			for variant, url in (('sync', sync_url), ('async', async_url)):
+				if url is None:
+					continue
+				throughput, latencies, failures = asyncio.run(
+					run_load(application, url, tokens, args.requests, args.concurrency)
+				)
+				rows.append((
+					name,
+					variant,
+					f'{throughput:,.0f}',
+					f'{percentile(latencies, 50) * 1000:.1f}',
+					f'{percentile(latencies, 99) * 1000:.1f}',
+					failures,
+				))
+
+	print(f'{args.requests} requests, concurrency {args.concurrency}, simulated query latency {args.db_latency_ms} ms')
+	print_table(('endpoint', 'path', 'req/s', 'p50 ms', 'p99 ms', 'errors'), rows)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,159 @@
+"""Session concurrency timeline: the NumPy sweep against a per-record Python loop.
+
+Run from the backend directory:
+
+    python -m benchmarks.session_timeline --records 10000
+
+Seeds an ended three-hour session and a week-long one still running, some of whose
+records were reopened after a reconnect gap. Checks that both give the same series and
+peak for several bucket sizes, then times the NumPy computation alone and the whole
+session_timeline call including its query.
+"""
+import argparse
+import random
+import time
+from datetime import timedelta
+
+from benchmarks.common import percentile, print_table, test_database
+
+from django.contrib.auth.models import User
+from django.utils import timezone
+
+from classroom.bitmaps import gaps, mark_presence
+from classroom.models import Classroom, ClassroomSession, StudentAttendanceRecord
+from classroom.timeline import _session_intervals, concurrency_series, cut_absences, merge_student_intervals, session_timeline
+
+
+def python_timeline(rows, bitmaps, span, bucket_seconds):
+	# The same answer from plain loops: cut out each visit's absences, merge each student's
+	# visits, then sweep the events.
+	by_student = {}
+	for (student, start, end), bitmap in zip(rows, bitmaps):
+		start, end = min(max(start, 0), span), min(max(end, 0), span)
+		if end <= start:
+			continue
+		pieces = []
+		for first, last in gaps(bitmap):
+			pieces.append((start, min(end, first * 60)))
+			start = max(start, (last + 1) * 60)
+		pieces.append((start, end))
+		by_student.setdefault(student, []).extend(piece for piece in pieces if piece[1] > piece[0])
+	by_student = {student: visits for student, visits in by_student.items() if visits}
+	events = []
+	for visits in by_student.values():
+		visits.sort()
+		current_start, current_end = visits[0]
+		for start, end in visits[1:]:
+			if start > current_end:
+				events += [(current_start, 1), (current_end, -1)]
+				current_start, current_end = start, end
+			else:
+				current_end = max(current_end, end)
+		events += [(current_start, 1), (current_end, -1)]
+	events.sort()
+
+	series = [0] * (-(-span // bucket_seconds))
+	level = peak = 0
+	peak_offset = None
+	index = 0
+	for bucket in range(len(series)):
+		bucket_start = bucket * bucket_seconds
+		while index < len(events) and events[index][0] <= bucket_start:
+			level += events[index][1]
+			if level > peak:
+				peak, peak_offset = level, events[index][0]
+			index += 1
+		highest = level
+		while index < len(events) and events[index][0] < bucket_start + bucket_seconds:
+			level += events[index][1]
+			highest = max(highest, level)
+			if level > peak:
+				peak, peak_offset = level, events[index][0]
+			index += 1
+		series[bucket] = highest
+	return series, peak, peak_offset
+
+
+def seed(classroom, students, record_count, span, ended, rng, reopened=0.1):
+	# ended=False leaves the session running, with now at span seconds into it.
+	now = timezone.now()
+	started_at = now - timedelta(seconds=span)
+	session = ClassroomSession.objects.create(classroom=classroom, title=f'{span // 3600} h Session', is_active=not ended)
+	ClassroomSession.objects.filter(id=session.id).update(started_at=started_at, ended_at=now if ended else None)
+	records = []
+	for _ in range(record_count):
+		joined = rng.randrange(-300, span)
+		duration = rng.randrange(30, 1800)
+		joined_at, left_at = started_at + timedelta(seconds=joined), started_at + timedelta(seconds=joined + duration)
+		presence = mark_presence(b'', started_at, joined_at, left_at)
+		if rng.random() < reopened:
+			# Away for a while, then reconnected into the same record.
+			away = rng.randrange(300, 3600)
+			left_at += timedelta(seconds=away)
+			presence = mark_presence(presence, started_at, left_at - timedelta(seconds=60), left_at)
+		records.append(StudentAttendanceRecord(
+			classroom=classroom, session=session, student=rng.choice(students), joined_at=joined_at, left_at=left_at,
+			duration_seconds=duration, status=StudentAttendanceRecord.STATUS_LEFT, presence=presence,
+		))
+	StudentAttendanceRecord.objects.bulk_create(records, batch_size=5000)
+	return ClassroomSession.objects.get(id=session.id), now
+
+
+def timed(function, repeat):
+	samples = []
+	for _ in range(repeat):
+		started = time.perf_counter()
+		result = function()
+		samples.append((time.perf_counter() - started) * 1000)
+	return result, samples
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument('--students', type=int, default=400)
+	parser.add_argument('--records', type=int, default=10000)
+	parser.add_argument('--hours', type=int, default=3)
+	parser.add_argument('--days', type=int, default=7, help='span of the running session')
+	parser.add_argument('--repeat', type=int, default=20)
+	parser.add_argument('--seed', type=int, default=7)
+	args = parser.parse_args(argv)
+
+	with test_database():
+		rng = random.Random(args.seed)
+		teacher = User.objects.create_user(username='bench-teacher', email='bench-teacher@example.com', password='x')
+		classroom = Classroom.objects.create(owner=teacher, name='Timeline Classroom')
+		students = User.objects.bulk_create(User(username=f'bench-{index}') for index in range(args.students))
+		cases = (
+			(f'{args.hours} h, ended', args.hours * 3600, True, (10, 60, 300)),
+			(f'{args.days} d, running', args.days * 86400, False, (300, 3600)),
+		)
+		table = []
+		for label, span, ended, bucket_sizes in cases:
+			session, now = seed(classroom, students, args.records, span, ended, rng)
+			intervals, bitmaps = _session_intervals(session, now)
+			rows = intervals.tolist()
+
+			def numpy_timeline(bucket_seconds):
+				starts = intervals[:, 1].clip(0, span)
+				ends = intervals[:, 2].clip(0, span)
+				visited = ends > starts
+				kept = [bitmaps[index] for index in visited.nonzero()[0]]
+				merged = merge_student_intervals(*cut_absences(intervals[:, 0][visited], starts[visited], ends[visited], kept))
+				return concurrency_series(*merged, span, bucket_seconds)
+
+			for bucket_seconds in bucket_sizes:
+				(series, peak, peak_offset), numpy_ms = timed(lambda: numpy_timeline(bucket_seconds), args.repeat)
+				expected, python_ms = timed(lambda: python_timeline(rows, bitmaps, span, bucket_seconds), max(1, args.repeat // 4))
+				same = (series.tolist(), peak, peak_offset) == expected
+				_, endpoint_ms = timed(lambda: session_timeline(session, bucket_seconds, now), args.repeat)
+				table.append((
+					label, bucket_seconds, len(series), peak, 'same' if same else 'differs',
+					f'{percentile(python_ms, 50):.1f}', f'{percentile(numpy_ms, 50):.2f}', f'{percentile(endpoint_ms, 50):.1f}',
+				))
+
+	print(f'{args.records} records a session, {args.students} students; median ms')
+	print_table(('session', 'bucket s', 'buckets', 'peak', 'vs loop', 'python loop', 'numpy', 'session_timeline'), table)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,81 @@
+"""Bytes on the wire and encode cost of classroom events as JSON text frames vs msgpack.
+
+Run from the backend directory:
+
+    python -m benchmarks.ws_encoding --iterations 20000
+
+Wire bytes include the WebSocket frame header a server sends (2, 4 or 10 bytes by length).
+Encode times are per event, as paid once per broadcast by the broadcaster.
+"""
+import argparse
+import time
+
+from benchmarks.common import print_table
+
+from classroom.events import encode_event, encode_event_binary
+
+
+def ws_frame_size(payload_length):
+	if payload_length < 126:
+		return payload_length + 2
+	if payload_length < 65536:
+		return payload_length + 4
+	return payload_length + 10
+
+
+def note_payload(content):
+	return {
+		'id': 1204,
+		'note_id': 311,
+		'index': 12,
+		'title': 'Photosynthesis',
+		'content': content,
+		'saved_date': '2026-10-17T09:00:00+00:00',
+		'displayed_date': '2026-10-17T09:05:00+00:00',
+	}
+
+
+CASES = [
+	('note_hidden', 'note_hidden', {'id': 1204, 'note_id': 311}),
+	('notification', 'notification_created', {
+		'id': 88, 'message': 'Quiz starts in 5 minutes', 'created_at': '2026-10-17T09:10:00+00:00', 'is_read': False,
+	}),
+	('note 2 KB', 'note_displayed', note_payload(('Light reactions convert light energy. ' * 60)[:2048])),
+	('note 20 KB', 'note_displayed', note_payload(('Light reactions convert light energy. ' * 600)[:20480])),
+	('note 2 KB non-ASCII', 'note_displayed', note_payload(('ፎቶሲንተሲስ የብርሃን ኃይልን ይቀይራል። ' * 100)[:700])),
+]
+
+
+def time_per_call(func, iterations):
+	started = time.perf_counter()
+	for _ in range(iterations):
+		func()
+	return (time.perf_counter() - started) / iterations
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument('--iterations', type=int, default=20000)
+	args = parser.parse_args(argv)
+
+	rows = []
+	for name, event_type, payload in CASES:
+		text = encode_event(event_type, payload).encode('utf-8')
+		binary = encode_event_binary(event_type, payload)
+		json_bytes, msgpack_bytes = ws_frame_size(len(text)), ws_frame_size(len(binary))
+		json_us = time_per_call(lambda: encode_event(event_type, payload), args.iterations) * 1e6
+		msgpack_us = time_per_call(lambda: encode_event_binary(event_type, payload), args.iterations) * 1e6
+		rows.append((
+			name,
+			json_bytes,
+			msgpack_bytes,
+			f'{(1 - msgpack_bytes / json_bytes) * 100:.1f}%',
+			f'{json_us:.2f}',
+			f'{msgpack_us:.2f}',
+		))
+
+	print_table(('event', 'json B', 'msgpack B', 'saved', 'json us', 'msgpack us'), rows)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,237 @@
+import json
+import logging
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+
+from authentication.auth_cache import LRUTTLCache
+from classroom.models import Classroom, Enrollment
+from classroom.redis_client import create_redis_connection, get_redis_client
+
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = 'lessonlive:classroom-access:invalidate'
+_CLASSROOM_KEY = 'lessonlive:classroom-access:class:{}'
+_MEMBERSHIP_KEY = 'lessonlive:classroom-access:member:{}:{}'
+
+# class_id -> (classroom pk, owner id)
+classroom_cache = LRUTTLCache(settings.CLASSROOM_ACCESS_CACHE_SIZE, settings.CLASSROOM_ACCESS_CACHE_TTL_SECONDS)
+# (classroom pk, user id) -> enrolled
+membership_cache = LRUTTLCache(settings.CLASSROOM_ACCESS_CACHE_SIZE, settings.CLASSROOM_ACCESS_CACHE_TTL_SECONDS)
+
+_listener_started = False
+_listener_lock = threading.Lock()
+
+
+def _redis():
+	client = get_redis_client()
+	if client is not None:
+		_ensure_invalidation_listener()
+	return client
+
+
+def _l2_get(key):
+	client = _redis()
+	if client is None:
+		return None
+	try:
+		value = client.get(key)
+	except Exception:
+		logger.warning('Classroom access L2 read failed for %s', key, exc_info=True)
+		return None
+	return value.decode('utf-8') if value is not None else None
+
+
+def _l2_set(key, value):
+	client = _redis()
+	if client is None:
+		return
+	try:
+		client.set(key, value, ex=settings.CLASSROOM_ACCESS_REDIS_TTL_SECONDS)
+	except Exception:
+		logger.warning('Classroom access L2 write failed for %s', key, exc_info=True)
+
+
+def get_classroom_entry(class_id):
+	entry = classroom_cache.get(class_id)
+	if entry is not None:
+		return entry
+
+	generation = classroom_cache.generation()
+	cached = _l2_get(_CLASSROOM_KEY.format(class_id))
+	if cached is not None:
+		classroom_pk, owner_id = cached.split(':')
+		entry = (int(classroom_pk), int(owner_id))
+	else:
+		row = Classroom.objects.filter(class_id=class_id).values_list('id', 'owner_id').first()
+		if row is None:
+			return None
+		entry = (row[0], row[1])
+		_l2_set(_CLASSROOM_KEY.format(class_id), f'{entry[0]}:{entry[1]}')
+
+	classroom_cache.set(class_id, entry, generation=generation)
+	return entry
+
+
+def is_enrolled(classroom_pk, user_id):
+	key = (int(classroom_pk), int(user_id))
+	enrolled = membership_cache.get(key)
+	if enrolled is not None:
+		return enrolled
+
+	generation = membership_cache.generation()
+	redis_key = _MEMBERSHIP_KEY.format(*key)
+	cached = _l2_get(redis_key)
+	if cached is not None:
+		enrolled = cached == '1'
+	else:
+		enrolled = Enrollment.objects.filter(classroom_id=key[0], student_id=key[1]).exists()
+		_l2_set(redis_key, '1' if enrolled else '0')
+
+	membership_cache.set(key, enrolled, generation=generation)
+	return enrolled
+
+
+def resolve_class_access(class_id, user_id):
+	# Returns (classroom pk, owner id, allowed), or None when the classroom does not exist.
+	entry = get_classroom_entry(class_id)
+	if entry is None:
+		return None
+
+	classroom_pk, owner_id = entry
+	if owner_id == user_id:
+		return classroom_pk, owner_id, True
+	return classroom_pk, owner_id, is_enrolled(classroom_pk, user_id)
+
+
+def peek_class_access(class_id, user_id):
+	# L1-only variant of resolve_class_access that never blocks, for use on the event loop.
+	entry = classroom_cache.get(class_id)
+	if entry is None:
+		return None
+
+	classroom_pk, owner_id = entry
+	if owner_id == user_id:
+		return classroom_pk, owner_id, True
+
+	enrolled = membership_cache.get((classroom_pk, int(user_id)))
+	if enrolled is None:
+		return None
+	return classroom_pk, owner_id, enrolled
+
+
+def access_cache_generations():
+	return classroom_cache.generation(), membership_cache.generation()
+
+
+def prime_class_access(class_id, classroom_pk, owner_id, user_id, enrolled, generations):
+	# Seeds L1 from a lookup done elsewhere; generations come from access_cache_generations()
+	# read before that lookup, so an invalidation in between wins.
+	classroom_cache.set(class_id, (classroom_pk, owner_id), generation=generations[0])
+	if owner_id != user_id:
+		membership_cache.set((classroom_pk, int(user_id)), enrolled, generation=generations[1])
+
+
+async def aresolve_class_access(class_id, user_id):
+	access = peek_class_access(class_id, user_id)
+	if access is not None:
+		return access
+	return await sync_to_async(resolve_class_access)(class_id, user_id)
+
+
+def _drop_local(message):
+	if 'user_id' in message:
+		membership_cache.invalidate((message['classroom_pk'], message['user_id']))
+		return
+
+	if message.get('class_id'):
+		classroom_cache.invalidate(message['class_id'])
+	if message.get('classroom_pk') is not None:
+		classroom_pk = message['classroom_pk']
+		membership_cache.invalidate_where(lambda key: key[0] == classroom_pk)
+
+
+def _invalidate(message, redis_keys):
+	_drop_local(message)
+
+	client = _redis()
+	if client is None:
+		return
+	try:
+		pipe = client.pipeline(transaction=False)
+		pipe.delete(*redis_keys)
+		pipe.publish(INVALIDATION_CHANNEL, json.dumps(message))
+		pipe.execute()
+	except Exception:
+		logger.warning('Classroom access invalidation could not reach Redis', exc_info=True)
+
+
+def _invalidate_now_and_on_commit(message, redis_keys):
+	# Invalidate immediately and again after commit, so a concurrent reader cannot
+	# re-cache the pre-commit state for a full TTL.
+	_invalidate(message, redis_keys)
+	transaction.on_commit(lambda: _invalidate(message, redis_keys))
+
+
+def invalidate_classroom(class_id, classroom_pk=None):
+	_invalidate_now_and_on_commit(
+		{'class_id': class_id, 'classroom_pk': classroom_pk},
+		[_CLASSROOM_KEY.format(class_id)],
+	)
+
+
+def invalidate_membership(classroom_pk, user_id):
+	_invalidate_now_and_on_commit(
+		{'classroom_pk': int(classroom_pk), 'user_id': int(user_id)},
+		[_MEMBERSHIP_KEY.format(int(classroom_pk), int(user_id))],
+	)
+
+
+def clear_access_cache():
+	classroom_cache.clear()
+	membership_cache.clear()
+
+
+def access_cache_stats():
+	return {
+		'classrooms': classroom_cache.stats(),
+		'memberships': membership_cache.stats(),
+	}
+
+
+def _ensure_invalidation_listener():
+	global _listener_started
+
+	if _listener_started:
+		return
+	with _listener_lock:
+		if _listener_started:
+			return
+		_listener_started = True
+		threading.Thread(
+			target=_listen_for_invalidations,
+			name='classroom-access-invalidation',
+			daemon=True,
+		).start()
+
+
+def _listen_for_invalidations():
+	while True:
+		try:
+			connection = create_redis_connection()
+			pubsub = connection.pubsub(ignore_subscribe_messages=True)
+			pubsub.subscribe(INVALIDATION_CHANNEL)
+			# Invalidations published while we were not subscribed are lost, so start clean.
+			clear_access_cache()
+			for message in pubsub.listen():
+				try:
+					_drop_local(json.loads(message['data']))
+				except (KeyError, TypeError, ValueError):
+					logger.warning('Ignoring malformed classroom access invalidation: %r', message)
+		except Exception:
+			logger.warning('Classroom access invalidation listener disconnected; retrying', exc_info=True)
+			time.sleep(1)
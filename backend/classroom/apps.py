@@ -3,3 +3,10 @@ from django.apps import AppConfig
 
 class ClassroomConfig(AppConfig):
     name = 'classroom'
+
+    def ready(self):
+        from authentication.jwt_auth import register_access_claims
+        from classroom import signals  # noqa: F401
+        from classroom.claims import MEMBERSHIP_CLAIMS, membership_claims
+
+        register_access_claims(MEMBERSHIP_CLAIMS, membership_claims)
@@ -0,0 +1,92 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import DateTimeField, F, Func, IntegerField, Q, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from classroom.background import PeriodicTask
+from classroom.bitmaps import extend_presence
+from classroom.models import StudentAttendanceRecord
+from classroom.rollups import refresh_attendance_rollups
+
+
+logger = logging.getLogger(__name__)
+
+
+class SecondsBetween(Func):
+	# Whole seconds from the second expression to the first, computed by the database.
+	arity = 2
+	output_field = IntegerField()
+	arg_joiner = ' - '
+	template = 'CAST(FLOOR(EXTRACT(EPOCH FROM (%(expressions)s))) AS integer)'
+
+	def as_sqlite(self, compiler, connection, **extra_context):
+		# julianday() is fractional days; rounding to milliseconds first keeps 60.0 from truncating to 59.
+		return super().as_sql(
+			compiler, connection,
+			template='CAST(ROUND((julianday(%(expressions)s)) * 86400, 3) AS integer)',
+			arg_joiner=') - julianday(',
+			**extra_context,
+		)
+
+
+def _last_counted_at():
+	# Heartbeat writes keep duration_seconds current as of last_seen_at (joined_at before the first one).
+	return Coalesce(F('last_seen_at'), F('joined_at'))
+
+
+def close_attendance_records(queryset, left_at=None):
+	"""
+	Close every active record in queryset with one UPDATE, then refresh the rollups of the
+	students it closed.
+
+	With left_at, durations are extended from each record's last heartbeat up to that
+	time; without it, records are closed at their last heartbeat.
+	"""
+	left_at_expression = Value(left_at, output_field=DateTimeField()) if left_at is not None else _last_counted_at()
+	with transaction.atomic(savepoint=False):
+		# Locked and listed first: once closed, the records no longer match queryset's filters.
+		closing = list(queryset.filter(status=StudentAttendanceRecord.STATUS_ACTIVE).select_for_update().values_list('id', flat=True))
+		if not closing:
+			return 0
+		# Read before the UPDATE moves last_seen_at: the minutes since then were spent in the room.
+		presence = {}
+		if left_at is not None:
+			presence = extend_presence(StudentAttendanceRecord.objects.filter(id__in=closing), dict.fromkeys(closing, left_at))
+		closed = StudentAttendanceRecord.objects.filter(id__in=closing).update(
+			status=StudentAttendanceRecord.STATUS_LEFT,
+			duration_seconds=F('duration_seconds') + Greatest(SecondsBetween(left_at_expression, _last_counted_at()), Value(0)),
+			left_at=left_at_expression,
+			last_seen_at=left_at_expression,
+		)
+		if presence:
+			StudentAttendanceRecord.objects.bulk_update(
+				[StudentAttendanceRecord(id=record_id, presence=bitmap) for record_id, bitmap in presence.items()], ['presence'], batch_size=500,
+			)
+		refresh_attendance_rollups(StudentAttendanceRecord.objects.filter(id__in=closing))
+	return closed
+
+
+def close_stale_attendance(now=None):
+	# Records whose connection died without running disconnect (e.g. a killed Daphne process).
+	cutoff = (now or timezone.now()) - timedelta(seconds=settings.ATTENDANCE_STALE_AFTER_SECONDS)
+	stale = StudentAttendanceRecord.objects.filter(
+		Q(last_seen_at__lt=cutoff) | Q(last_seen_at__isnull=True, joined_at__lt=cutoff),
+	)
+	closed = close_attendance_records(stale)
+	if closed:
+		logger.info('Closed %s stale attendance records', closed)
+	return closed
+
+
+stale_attendance_sweeper = PeriodicTask(
+	'attendance-sweep', settings.ATTENDANCE_SWEEP_INTERVAL_SECONDS, close_stale_attendance,
+)
+
+
+def start_stale_attendance_sweeper():
+	if settings.ATTENDANCE_SWEEP_INTERVAL_SECONDS > 0:
+		stale_attendance_sweeper.ensure_started()
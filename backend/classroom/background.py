@@ -0,0 +1,40 @@
+import asyncio
+import logging
+
+from classroom.db_pool import run_in_consumer_db_pool
+
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicTask:
+	# Calls func on the consumer DB pool every interval seconds, on the event loop that
+	# first starts it. Consumers call ensure_started(); it is a no-op once running.
+	def __init__(self, name, interval, func):
+		self.name = name
+		self.interval = interval
+		self.func = func
+		self._task = None
+		self._loop = None
+
+	def ensure_started(self):
+		loop = asyncio.get_running_loop()
+		if self._task is not None and self._loop is loop and not self._task.done():
+			return False
+		self._loop = loop
+		self._task = loop.create_task(self._run(), name=self.name)
+		return True
+
+	async def _run(self):
+		while True:
+			await asyncio.sleep(self.interval)
+			try:
+				await run_in_consumer_db_pool(self.func)
+			except Exception:
+				logger.exception('Periodic task %s failed', self.name)
+
+	def stop(self):
+		if self._task is not None:
+			self._task.cancel()
+		self._task = None
+		self._loop = None
@@ -0,0 +1,124 @@
+import numpy as np
+from django.conf import settings
+
+from classroom.models import StudentAttendanceRecord
+
+
+# Presence bitmaps (StudentAttendanceRecord.presence) run most significant bit first within
+# each byte, as np.packbits lays them out, so a session's bitmaps stack into a packed uint8
+# matrix that is ORed, ANDed and popcounted in bulk.
+
+
+def minute_of(session_started_at, moment):
+	return max(0, int((moment - session_started_at).total_seconds() // 60))
+
+
+def mark_minutes(bitmap, first, last):
+	"""bitmap with minutes first through last set, grown as needed."""
+	last = min(last, settings.ATTENDANCE_BITMAP_MAX_MINUTES - 1)
+	bitmap = bytes(bitmap)
+	if last < first:
+		return bitmap
+	bits = np.unpackbits(np.frombuffer(bitmap, dtype=np.uint8))
+	if len(bits) <= last:
+		bits = np.concatenate((bits, np.zeros(last + 1 - len(bits), dtype=np.uint8)))
+	bits[first:last + 1] = 1
+	return np.packbits(bits).tobytes()
+
+
+def mark_presence(bitmap, session_started_at, since, until):
+	return mark_minutes(bitmap, minute_of(session_started_at, since), minute_of(session_started_at, until))
+
+
+def extend_presence(records, until):
+	"""
+	Lock records and return {id: bitmap} with each one's minutes marked from its last
+	heartbeat (its join before the first) up to until[id]. Call it in the transaction
+	that writes the bitmaps back; records without a session have no bitmap.
+	"""
+	rows = (
+		records.filter(session__isnull=False)
+		.select_for_update(of=('self',))
+		.order_by('id')
+		.values_list('id', 'presence', 'joined_at', 'last_seen_at', 'session__started_at')
+	)
+	return {
+		record_id: mark_presence(presence, started_at, last_seen_at or joined_at, until[record_id])
+		for record_id, presence, joined_at, last_seen_at, started_at in rows
+		if record_id in until
+	}
+
+
+def pack_bitmaps(bitmaps, minutes=None):
+	"""Bitmaps as the rows of a uint8 matrix, cut or zero-padded to minutes (default: the longest)."""
+	bitmaps = [bytes(bitmap) for bitmap in bitmaps]
+	width = -(-minutes // 8) if minutes is not None else max(map(len, bitmaps), default=0)
+	packed = b''.join(bitmap[:width].ljust(width, b'\0') for bitmap in bitmaps)
+	return np.frombuffer(packed, dtype=np.uint8).reshape(len(bitmaps), width)
+
+
+def merge_bitmaps(*bitmaps):
+	# Minutes present in any of them, e.g. for records being merged into one.
+	return np.bitwise_or.reduce(pack_bitmaps(bitmaps), axis=0).tobytes()
+
+
+def minutes_mask(first, last, minutes):
+	"""A packed row with minutes first through last set, to AND with a matrix: a topic's slot, say."""
+	bits = np.zeros(-(-minutes // 8) * 8, dtype=np.uint8)
+	bits[max(0, first):last + 1] = 1
+	return np.packbits(bits)
+
+
+def popcount(matrix):
+	# Minutes set in each row.
+	return np.bitwise_count(matrix).sum(axis=-1, dtype=np.int64)
+
+
+def overlap_minutes(matrix, mask):
+	return popcount(matrix & mask)
+
+
+def attendance_percent(matrix, minutes):
+	# Share of the session's minutes each row was present for.
+	return np.round(popcount(matrix) * 100 / minutes, 1) if minutes else np.zeros(len(matrix))
+
+
+def presence_per_minute(matrix, minutes):
+	# How many rows were present in each minute.
+	return np.unpackbits(matrix, axis=1, count=minutes).sum(axis=0, dtype=np.int64)
+
+
+def has_gaps(bitmap):
+	# Whether gaps(bitmap) is non-empty, without unpacking: the set bits, shifted down to the
+	# lowest one, must form a single run.
+	value = int.from_bytes(bytes(bitmap), 'big')
+	if not value:
+		return False
+	value >>= (value & -value).bit_length() - 1
+	return bool(value & (value + 1))
+
+
+def gaps(bitmap):
+	"""(first, last) minutes of each absence between a student's first and last minute present."""
+	bits = np.unpackbits(np.frombuffer(bytes(bitmap), dtype=np.uint8))
+	present = np.flatnonzero(bits)
+	if not len(present):
+		return []
+	jumps = np.flatnonzero(np.diff(present) > 1)
+	return [(int(present[index]) + 1, int(present[index + 1]) - 1) for index in jumps]
+
+
+def session_presence(session, minutes=None):
+	"""
+	(student ids, matrix) for a session: one packed row per student, the OR of their
+	records' bitmaps, so reconnects and extra tabs count once.
+	"""
+	rows = list(
+		StudentAttendanceRecord.objects.filter(session=session).order_by('student_id').values_list('student_id', 'presence')
+	)
+	student_ids = np.array([student_id for student_id, _ in rows], dtype=np.int64)
+	matrix = pack_bitmaps([presence for _, presence in rows], minutes)
+	if not len(rows):
+		return student_ids, matrix
+	first = np.flatnonzero(np.r_[True, student_ids[1:] != student_ids[:-1]])
+	return student_ids[first], np.bitwise_or.reduceat(matrix, first, axis=0)
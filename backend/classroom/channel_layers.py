@@ -0,0 +1,247 @@
+import asyncio
+import logging
+import random
+import string
+import threading
+import time
+import uuid
+import weakref
+
+import msgpack
+from asgiref.sync import async_to_sync
+from channels.exceptions import ChannelFull
+from channels.layers import InMemoryChannelLayer
+
+
+logger = logging.getLogger(__name__)
+
+_PROCESS_NAME_LENGTH = 12
+
+
+class _LoopConnection:
+	# One event loop's Redis client, and its subscription once the loop has local channels.
+
+	def __init__(self, url):
+		import redis.asyncio as aioredis
+
+		self.redis = aioredis.Redis.from_url(url)
+		self.pubsub = None
+		self.ready = None
+		self.listener = None
+		self.subscribe_lock = asyncio.Lock()
+		self.subscribed = set()
+
+	async def aclose(self):
+		if self.listener is not None:
+			self.listener.cancel()
+		if self.pubsub is not None:
+			await self.pubsub.aclose()
+		await self.redis.aclose()
+
+
+class ProcessLocalGroupChannelLayer(InMemoryChannelLayer):
+	"""
+	Channel layer that fans group messages out in memory inside each process.
+
+	A group_send is a single Redis PUBLISH on the group's pub/sub channel; every process
+	with members in the group is subscribed once and hands the decoded message to its
+	local consumers. RedisChannelLayer instead writes one message per member channel.
+
+	Without hosts it behaves like InMemoryChannelLayer, minus the per-member deepcopy.
+	Group messages are shared between local consumers, so handlers must not mutate them.
+	"""
+
+	def __init__(self, hosts=None, prefix='lessonlive-layer', clean_interval=1.0, **kwargs):
+		super().__init__(**kwargs)
+		self.hosts = [host for host in (hosts or []) if host]
+		self.prefix = prefix
+		self.clean_interval = clean_interval
+		self.process_name = uuid.uuid4().hex[:_PROCESS_NAME_LENGTH]
+		self.publishes = 0
+		self._next_clean = 0.0
+		# Event loop -> _LoopConnection. Weak, so a loop that went away takes its entry with it.
+		self._connections = weakref.WeakKeyDictionary()
+		self._sync_redis = None
+		self._sync_lock = threading.Lock()
+
+	@property
+	def _process_key(self):
+		return f'{self.prefix}:process:{self.process_name}'
+
+	def _group_key(self, group):
+		return f'{self.prefix}:group:{group}'
+
+	@staticmethod
+	def _process_of(channel):
+		# Specific channels are named <prefix><process name>!<suffix>; others belong to no process.
+		process_part, separator, _ = channel.rpartition('!')
+		return process_part[-_PROCESS_NAME_LENGTH:] if separator else None
+
+	def _is_local(self, channel):
+		process_name = self._process_of(channel)
+		return process_name is None or process_name == self.process_name
+
+	def _connection(self):
+		"""The running loop's connection, or None without hosts. Enough for publishing."""
+		if not self.hosts:
+			return None
+		# Redis connections belong to one event loop, so each loop using the layer gets its own,
+		# as in channels_redis. Synchronous code publishes through group_send_sync instead of
+		# starting a loop per call.
+		loop = asyncio.get_running_loop()
+		connection = self._connections.get(loop)
+		if connection is None:
+			connection = self._connections[loop] = _LoopConnection(self.hosts[0])
+		return connection
+
+	async def _listening(self):
+		"""The running loop's connection, subscribed and delivering to local channels."""
+		connection = self._connection()
+		if connection is None:
+			return None
+		if connection.pubsub is None:
+			loop = asyncio.get_running_loop()
+			connection.pubsub = connection.redis.pubsub(ignore_subscribe_messages=True)
+			keys = [self._process_key] + [self._group_key(group) for group in self.groups]
+			connection.ready = loop.create_task(self._subscribe(connection, *keys))
+			connection.listener = loop.create_task(self._listen(connection))
+		await connection.ready
+		return connection
+
+	async def _subscribe(self, connection, *keys):
+		async with connection.subscribe_lock:
+			keys = [key for key in keys if key not in connection.subscribed]
+			if keys:
+				await connection.pubsub.subscribe(*keys)
+				connection.subscribed.update(keys)
+
+	async def _unsubscribe(self, connection, key):
+		async with connection.subscribe_lock:
+			if key in connection.subscribed:
+				connection.subscribed.discard(key)
+				await connection.pubsub.unsubscribe(key)
+
+	async def _listen(self, connection):
+		await connection.ready
+		pubsub = connection.pubsub
+		group_prefix = self._group_key('')
+		while True:
+			try:
+				message = await pubsub.get_message(timeout=1.0)
+			except asyncio.CancelledError:
+				raise
+			except Exception:
+				logger.warning('Channel layer pub/sub receive failed; retrying', exc_info=True)
+				await asyncio.sleep(1)
+				continue
+			if message is None or message.get('type') != 'message':
+				continue
+
+			name = message['channel'].decode('utf-8')
+			try:
+				payload = msgpack.unpackb(message['data'], raw=False)
+			except (ValueError, msgpack.UnpackException):
+				logger.warning('Ignoring undecodable channel layer message on %s', name)
+				continue
+			if name.startswith(group_prefix):
+				self._deliver_to_group(name[len(group_prefix):], payload)
+			elif name == self._process_key:
+				try:
+					await super().send(payload['channel'], payload['message'])
+				except ChannelFull:
+					pass
+
+	def _deliver_to_group(self, group, message):
+		expires = time.time() + self.expiry
+		for channel in list(self.groups.get(group, ())):
+			queue = self.channels.get(channel)
+			if queue is None:
+				queue = self.channels[channel] = asyncio.Queue(maxsize=self.get_capacity(channel))
+			try:
+				queue.put_nowait((expires, message))
+			except asyncio.QueueFull:
+				pass
+
+	def _clean_expired(self):
+		# The base class rescans every channel on every receive, which is quadratic per
+		# broadcast in large groups; expiry only needs to be noticed eventually.
+		now = time.monotonic()
+		if now < self._next_clean:
+			return
+		self._next_clean = now + self.clean_interval
+		super()._clean_expired()
+
+	async def new_channel(self, prefix='specific.'):
+		await self._listening()
+		suffix = ''.join(random.choice(string.ascii_letters) for _ in range(12))
+		return f'{prefix}{self.process_name}!{suffix}'
+
+	async def send(self, channel, message):
+		self.require_valid_channel_name(channel)
+		connection = None if self._is_local(channel) else self._connection()
+		if connection is None:
+			await super().send(channel, message)
+			return
+
+		self.publishes += 1
+		await connection.redis.publish(
+			f'{self.prefix}:process:{self._process_of(channel)}',
+			msgpack.packb({'channel': channel, 'message': message}, use_bin_type=True),
+		)
+
+	async def group_add(self, group, channel):
+		await super().group_add(group, channel)
+		connection = await self._listening()
+		if connection is not None:
+			await self._subscribe(connection, self._group_key(group))
+
+	async def group_discard(self, group, channel):
+		await super().group_discard(group, channel)
+		connection = self._connections.get(asyncio.get_running_loop())
+		if group not in self.groups and connection is not None and connection.pubsub is not None:
+			await self._unsubscribe(connection, self._group_key(group))
+
+	async def group_send(self, group, message):
+		assert isinstance(message, dict), 'Message is not a dict'
+		self.require_valid_group_name(group)
+		self._clean_expired()
+
+		connection = self._connection()
+		if connection is None:
+			self._deliver_to_group(group, message)
+			return
+		self.publishes += 1
+		await connection.redis.publish(self._group_key(group), msgpack.packb(message, use_bin_type=True))
+
+	def group_send_sync(self, group, message):
+		"""
+		group_send for synchronous code, such as views and worker threads. With hosts it is one
+		PUBLISH on a client shared by every thread; without, the message is delivered in memory.
+		"""
+		if not self.hosts:
+			async_to_sync(self.group_send)(group, message)
+			return
+		assert isinstance(message, dict), 'Message is not a dict'
+		self.require_valid_group_name(group)
+		if self._sync_redis is None:
+			with self._sync_lock:
+				if self._sync_redis is None:
+					import redis
+
+					self._sync_redis = redis.Redis.from_url(self.hosts[0])
+		self.publishes += 1
+		self._sync_redis.publish(self._group_key(group), msgpack.packb(message, use_bin_type=True))
+
+	async def flush(self):
+		await super().flush()
+		await self.close()
+
+	async def close(self):
+		# Connections of other loops still running can only be closed from those loops.
+		connection = self._connections.pop(asyncio.get_running_loop(), None)
+		if connection is not None:
+			await connection.aclose()
+		with self._sync_lock:
+			client, self._sync_redis = self._sync_redis, None
+		if client is not None:
+			client.close()
@@ -0,0 +1,39 @@
+from django.conf import settings
+
+from authentication.jwt_auth import aget_access_claims, get_claims_user
+from classroom.models import Classroom, Enrollment
+
+
+MEMBERSHIP_CLAIMS = ('owned', 'classes')
+
+
+def membership_claims(user):
+	# {class_id: pk} of owned and enrolled classrooms, or nothing for users in too many to embed.
+	limit = settings.JWT_MEMBERSHIP_CLAIMS_LIMIT
+	owned = list(Classroom.objects.filter(owner=user).values_list('class_id', 'id')[:limit + 1])
+	enrolled = list(
+		Enrollment.objects.filter(student=user).values_list('classroom__class_id', 'classroom_id')[:limit + 1]
+	)
+	if len(owned) + len(enrolled) > limit:
+		return {}
+	return {'owned': dict(owned), 'classes': dict(enrolled)}
+
+
+async def aget_class_member_from_claims(request, class_id):
+	return _class_member_from_claims(await aget_access_claims(request), class_id)
+
+
+def _class_member_from_claims(claims, class_id):
+	if claims is None or any(name not in claims for name in MEMBERSHIP_CLAIMS):
+		return None
+
+	if class_id in claims['owned']:
+		classroom_pk, is_owner = claims['owned'][class_id], True
+	elif class_id in claims['classes']:
+		classroom_pk, is_owner = claims['classes'][class_id], False
+	else:
+		return None
+
+	user = get_claims_user(claims)
+	classroom = Classroom.from_reference(classroom_pk, class_id, owner_id=user.id if is_owner else None)
+	return user, classroom, is_owner
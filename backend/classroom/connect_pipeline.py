@@ -0,0 +1,102 @@
+import logging
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models import Exists, OuterRef, Subquery
+
+from authentication.auth_cache import peek_cached_user
+from classroom.access_cache import access_cache_generations, peek_class_access, prime_class_access
+from classroom.db_pool import run_in_consumer_db_pool
+from classroom.metrics import LatencyStats
+from classroom.models import Classroom, ClassroomSession, Enrollment
+from classroom.sessions import active_session_cache
+
+
+logger = logging.getLogger(__name__)
+
+# session_id is None when the classroom has no active session yet.
+ConnectContext = namedtuple('ConnectContext', ('user_exists', 'classroom_pk', 'owner_id', 'allowed', 'session_id'))
+
+CONNECT_STAGES = ('token', 'resolve', 'group_add', 'accept', 'presence', 'session', 'attendance')
+connect_stage_stats = {stage: LatencyStats() for stage in CONNECT_STAGES + ('total',)}
+
+
+class ConnectTimer:
+	def __init__(self):
+		self.started = time.perf_counter()
+		self.stages = {}
+
+	@contextmanager
+	def stage(self, name):
+		started = time.perf_counter()
+		try:
+			yield
+		finally:
+			elapsed = time.perf_counter() - started
+			self.stages[name] = elapsed
+			connect_stage_stats[name].observe(elapsed)
+
+	def finish(self, class_id, outcome):
+		total = time.perf_counter() - self.started
+		connect_stage_stats['total'].observe(total)
+		if total * 1000 >= settings.CLASSROOM_CONNECT_SLOW_LOG_MS:
+			logger.warning(
+				'Slow classroom connect (%s, %s): %.1f ms [%s]',
+				class_id,
+				outcome,
+				total * 1000,
+				', '.join(f'{name}={seconds * 1000:.1f}' for name, seconds in self.stages.items()),
+			)
+		return total
+
+
+def connect_timing_stats():
+	return {stage: stats.snapshot() for stage, stats in connect_stage_stats.items()}
+
+
+def reset_connect_timing_stats():
+	for stats in connect_stage_stats.values():
+		stats.reset()
+
+
+def load_connect_context(class_id, user_id):
+	# User existence, classroom, ownership, enrollment and active session in one query.
+	generations = access_cache_generations()
+	session_generation = active_session_cache.generation()
+	row = (
+		Classroom.objects
+		.filter(class_id=class_id)
+		.annotate(
+			user_exists=Exists(User.objects.filter(id=user_id)),
+			enrolled=Exists(Enrollment.objects.filter(classroom=OuterRef('pk'), student_id=user_id)),
+			active_session_id=Subquery(
+				ClassroomSession.objects.filter(classroom=OuterRef('pk'), is_active=True).values('id')[:1]
+			),
+		)
+		.values_list('id', 'owner_id', 'user_exists', 'enrolled', 'active_session_id')
+		.first()
+	)
+	if row is None:
+		return None
+
+	classroom_pk, owner_id, user_exists, enrolled, session_id = row
+	if not user_exists:
+		return ConnectContext(False, classroom_pk, owner_id, False, None)
+
+	prime_class_access(class_id, classroom_pk, owner_id, user_id, enrolled, generations)
+	if session_id is not None:
+		active_session_cache.set(classroom_pk, session_id, generation=session_generation)
+	return ConnectContext(True, classroom_pk, owner_id, owner_id == user_id or enrolled, session_id)
+
+
+async def aresolve_connect_context(class_id, user_id):
+	# Everything cached means no database round-trip at all.
+	if peek_cached_user(user_id) is not None:
+		access = peek_class_access(class_id, user_id)
+		if access is not None:
+			classroom_pk, owner_id, allowed = access
+			return ConnectContext(True, classroom_pk, owner_id, allowed, active_session_cache.get(classroom_pk))
+	return await run_in_consumer_db_pool(load_connect_context, class_id, user_id)
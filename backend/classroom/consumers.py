@@ -1,149 +1,326 @@
+import asyncio
+import logging
+from datetime import timedelta
 from urllib.parse import parse_qs
 
-from channels.db import database_sync_to_async
+import msgpack
+
 from channels.generic.websocket import AsyncJsonWebsocketConsumer
-from django.contrib.auth.models import User
+from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
 from rest_framework_simplejwt.exceptions import TokenError
 from rest_framework_simplejwt.tokens import AccessToken
 
-from classroom.models import Classroom, Enrollment, ClassroomSession, StudentAttendanceRecord
+from classroom.attendance import start_stale_attendance_sweeper
+from classroom.bitmaps import extend_presence
+from classroom.connect_pipeline import ConnectTimer, aresolve_connect_context
+from classroom.db_pool import consumer_db_task
+from classroom.events import (
+	MSGPACK_SUBPROTOCOL,
+	areplay_events,
+	classroom_group_name,
+	encode_event,
+	encode_event_binary,
+	teacher_group_name,
+	text_frame_to_binary,
+)
+from classroom.heartbeats import buffer_heartbeat, discard_heartbeat, start_heartbeat_flusher
+from classroom.models import ClassroomSession, StudentAttendanceRecord
+from classroom.outbound import OutboundQueue, OutboundQueueFull
+from classroom.presence import mark_absent, mark_present
+from classroom.rollups import refresh_attendance_rollups
+from classroom.sessions import aget_or_create_active_session, end_session, get_or_create_active_session, invalidate_active_session
 
 
-@database_sync_to_async
-def record_student_join(class_id, user_id, joined_topic='Live Classroom'):
-	try:
-		classroom = Classroom.objects.get(class_id=class_id)
-		if classroom.owner_id == user_id:
-			return None  # Teacher connection
-
-		session = ClassroomSession.objects.filter(classroom=classroom, is_active=True).first()
-		if not session:
-			today_str = timezone.now().strftime('%B %d, %Y')
-			session = ClassroomSession.objects.create(
-				classroom=classroom,
-				title=f'Live Session — {today_str}',
-				is_active=True
-			)
+logger = logging.getLogger(__name__)
 
-		rec = StudentAttendanceRecord.objects.create(
-			classroom=classroom,
-			session=session,
+# Closed because the client fell too far behind; it should reconnect and resume from its last seq.
+RESYNC_CLOSE_CODE = 4009
+
+
+def reopen_recent_record(session_id, user_id, now):
+	# A reconnect shortly after leaving continues the previous record instead of adding a row.
+	grace = settings.ATTENDANCE_RECONNECT_GRACE_SECONDS
+	if grace <= 0 or session_id is None:
+		return None
+	previous = (
+		StudentAttendanceRecord.objects
+		.filter(
+			session_id=session_id,
 			student_id=user_id,
-			joined_at=timezone.now(),
-			status=StudentAttendanceRecord.STATUS_ACTIVE,
-			joined_topic=joined_topic
+			status=StudentAttendanceRecord.STATUS_LEFT,
+			left_at__gte=now - timedelta(seconds=grace),
 		)
-		return rec.id
-	except Exception:
+		.order_by('-left_at')
+		.only('id', 'duration_seconds')
+		.first()
+	)
+	if previous is None:
 		return None
+	# Conditional, so two tabs reconnecting at once cannot both reopen the same record.
+	reopened = StudentAttendanceRecord.objects.filter(id=previous.id, status=StudentAttendanceRecord.STATUS_LEFT).update(
+		status=StudentAttendanceRecord.STATUS_ACTIVE,
+		left_at=None,
+		last_seen_at=now,
+	)
+	return previous if reopened else None
 
 
-@database_sync_to_async
-def record_student_leave(record_id):
-	if not record_id:
-		return
+def _join_session(classroom_pk, session_id, user_id, joined_topic, now):
+	# Returns (record id, time the duration counts from), or None when session_id has already ended.
+	with transaction.atomic(savepoint=False):
+		# end_session updates this row before closing the session's records, so with it locked
+		# an end either waits and then closes this join's record, or has already happened.
+		if not ClassroomSession.objects.select_for_update(no_key=True).filter(id=session_id, is_active=True).values_list('id').first():
+			return None
+		previous = reopen_recent_record(session_id, user_id, now)
+		if previous is not None:
+			joined = previous.id, now - timedelta(seconds=previous.duration_seconds)
+		else:
+			rec = StudentAttendanceRecord.objects.create(
+				classroom_id=classroom_pk,
+				session_id=session_id,
+				student_id=user_id,
+				joined_at=now,
+				status=StudentAttendanceRecord.STATUS_ACTIVE,
+				joined_topic=joined_topic
+			)
+			joined = rec.id, rec.joined_at
+		refresh_attendance_rollups(StudentAttendanceRecord.objects.filter(id=joined[0]))
+	return joined
+
+
+@consumer_db_task
+def record_student_join(classroom_pk, session_id, user_id, joined_topic='Live Classroom'):
+	# Returns (record id, time the duration counts from, session id), or None.
+	now = timezone.now()
 	try:
-		rec = StudentAttendanceRecord.objects.get(id=record_id)
-		rec.left_at = timezone.now()
-		rec.update_duration(rec.left_at)
-		rec.status = StudentAttendanceRecord.STATUS_LEFT
-		rec.save()
-	except StudentAttendanceRecord.DoesNotExist:
-		pass
+		joined = _join_session(classroom_pk, session_id, user_id, joined_topic, now)
+		if joined is None:
+			# Ended by another process, whose invalidation only reached its own cache.
+			invalidate_active_session(classroom_pk)
+			session_id = get_or_create_active_session(classroom_pk)
+			joined = _join_session(classroom_pk, session_id, user_id, joined_topic, now)
+		return (*joined, session_id) if joined is not None else None
+	except Exception:
+		return None
 
 
-@database_sync_to_async
-def update_student_heartbeat(record_id, topic=None):
+@consumer_db_task
+def record_student_leave(record_id, counted_from, topic=None):
 	if not record_id:
 		return
-	try:
-		rec = StudentAttendanceRecord.objects.get(id=record_id)
-		now = timezone.now()
-		rec.update_duration(now)
-		if topic:
-			rec.joined_topic = topic
-		rec.save()
-	except StudentAttendanceRecord.DoesNotExist:
-		pass
+	left_at = timezone.now()
+	fields = {
+		'left_at': left_at,
+		'last_seen_at': left_at,
+		'duration_seconds': max(0, int((left_at - counted_from).total_seconds())),
+		'status': StudentAttendanceRecord.STATUS_LEFT,
+	}
+	if topic:
+		fields['joined_topic'] = topic
+	# A record already closed by end_session or the stale sweeper keeps the time it was closed at.
+	record = StudentAttendanceRecord.objects.filter(id=record_id)
+	active = record.filter(status=StudentAttendanceRecord.STATUS_ACTIVE)
+	with transaction.atomic(savepoint=False):
+		presence = extend_presence(active, {record_id: left_at})
+		if record_id in presence:
+			fields['presence'] = presence[record_id]
+		if active.update(**fields):
+			refresh_attendance_rollups(record)
+
+
+@consumer_db_task
+def end_session_if_empty(session_id, class_id):
+	return end_session(session_id, class_id, only_if_empty=True)
 
 
 class ClassroomNoteConsumer(AsyncJsonWebsocketConsumer):
 	async def connect(self):
 		self.class_id = self.scope['url_route']['kwargs']['class_id']
-		self.group_name = f'classroom_{self.class_id}_notes'
+		self.group_name = classroom_group_name(self.class_id)
+		self.teacher_group_name = None
 		self.attendance_record_id = None
+		self.attendance_counted_from = None
+		self.session_id = None
+		self.tracks_presence = False
+		self.use_msgpack = MSGPACK_SUBPROTOCOL in self.scope.get('subprotocols', ())
+		self.outbound = None
+		self.outbound_writer = None
+		self.connect_timer = ConnectTimer()
 
-		query_string = self.scope.get('query_string', b'').decode('utf-8')
-		access_token = parse_qs(query_string).get('token', [''])[0]
-		if not access_token:
-			await self.close(code=4001)
+		with self.connect_timer.stage('token'):
+			query = parse_qs(self.scope.get('query_string', b'').decode('utf-8'), keep_blank_values=True)
+			access_token = query.get('token', [''])[0]
+			user_id = self._get_user_id_from_access_token(access_token) if access_token else None
+		if user_id is None:
+			await self._reject(4001)
 			return
 
-		user = await self._get_user_from_access_token(access_token)
-		if user is None:
-			await self.close(code=4001)
+		with self.connect_timer.stage('resolve'):
+			context = await aresolve_connect_context(self.class_id, user_id)
+		if context is not None and not context.user_exists:
+			await self._reject(4001)
 			return
+		if context is None or not context.allowed:
+			await self._reject(4003)
+			return
+
+		self.user_id = user_id
+		self.classroom_pk = context.classroom_pk
+		with self.connect_timer.stage('group_add'):
+			await self.channel_layer.group_add(self.group_name, self.channel_name)
+		with self.connect_timer.stage('accept'):
+			await self.accept(subprotocol=MSGPACK_SUBPROTOCOL if self.use_msgpack else None)
+		self.outbound = OutboundQueue(settings.CLASSROOM_OUTBOUND_QUEUE_SIZE)
+		self.outbound_writer = asyncio.ensure_future(self._write_outbound(self.outbound))
+		if 'last_seq' in query:
+			# Replayed here rather than on a resume message: the channel layer's messages are only
+			# handled once connect returns, so no live frame can overtake the missed ones.
+			last_seq = query['last_seq'][0]
+			await self._resume(int(last_seq) if last_seq.isdigit() else None)
 
-		allowed = await self._user_has_classroom_access(user.id)
-		if not allowed:
-			await self.close(code=4003)
+		if context.owner_id == user_id:
+			self.teacher_group_name = teacher_group_name(self.class_id)
+			await self.channel_layer.group_add(self.teacher_group_name, self.channel_name)
+			self.connect_timer.finish(self.class_id, 'teacher')
 			return
 
-		self.user = user
-		await self.channel_layer.group_add(self.group_name, self.channel_name)
-		await self.accept()
+		with self.connect_timer.stage('presence'):
+			await mark_present(self.classroom_pk, user_id, connected=True)
+		self.tracks_presence = True
 
 		# Record attendance join for students
-		self.attendance_record_id = await record_student_join(self.class_id, self.user.id)
+		session_id = context.session_id
+		if session_id is None:
+			with self.connect_timer.stage('session'):
+				session_id = await aget_or_create_active_session(self.classroom_pk)
+		with self.connect_timer.stage('attendance'):
+			joined = await record_student_join(self.classroom_pk, session_id, user_id)
+		if joined is not None:
+			# For a reopened record the duration counts from before this connect, so that
+			# heartbeats and the final leave add this connection's time to what was recorded.
+			self.attendance_record_id, self.attendance_counted_from, self.session_id = joined
+			start_heartbeat_flusher()
+			start_stale_attendance_sweeper()
+		self.connect_timer.finish(self.class_id, 'student')
+
+	async def _reject(self, code):
+		await self.close(code=code)
+		self.connect_timer.finish(self.class_id, f'rejected {code}')
 
 	async def disconnect(self, close_code):
+		if self.outbound_writer is not None:
+			self.outbound_writer.cancel()
+		if self.tracks_presence:
+			await mark_absent(self.classroom_pk, self.user_id)
 		if self.attendance_record_id:
-			await record_student_leave(self.attendance_record_id)
+			# Leave computes the final duration itself; only a buffered topic change needs carrying over.
+			pending = await discard_heartbeat(self.attendance_record_id)
+			await record_student_leave(
+				self.attendance_record_id, self.attendance_counted_from, topic=pending.topic if pending else None
+			)
+			if settings.CLASSROOM_AUTO_END_SESSION:
+				await end_session_if_empty(self.session_id, self.class_id)
 		await self.channel_layer.group_discard(self.group_name, self.channel_name)
+		if self.teacher_group_name:
+			await self.channel_layer.group_discard(self.teacher_group_name, self.channel_name)
+
+	async def receive(self, text_data=None, bytes_data=None, **kwargs):
+		# msgpack clients may send binary frames; JSON text is accepted from everyone.
+		if bytes_data is not None and text_data is None:
+			try:
+				content = msgpack.unpackb(bytes_data, raw=False)
+			except (ValueError, msgpack.UnpackException):
+				return
+			if isinstance(content, dict):
+				await self.receive_json(content, **kwargs)
+			return
+		await super().receive(text_data=text_data, bytes_data=bytes_data, **kwargs)
 
 	async def receive_json(self, content, **kwargs):
 		msg_type = content.get('type')
 		if msg_type == 'heartbeat' or msg_type == 'ping':
 			topic = content.get('topic')
+			if self.tracks_presence:
+				await mark_present(self.classroom_pk, self.user_id)
 			if self.attendance_record_id:
-				await update_student_heartbeat(self.attendance_record_id, topic=topic)
-		return
+				await buffer_heartbeat(self.attendance_record_id, self.attendance_counted_from, timezone.now(), topic=topic)
+			return
+		# Clients from before last_seq moved to the query string; live frames may precede the replay.
+		if msg_type == 'resume':
+			await self._resume(content.get('last_seq'))
+
+	async def _resume(self, last_seq):
+		# Without a usable last_seq the client only learns the current seq to resume from later.
+		if isinstance(last_seq, bool) or not isinstance(last_seq, int) or last_seq < 0:
+			last_seq = None
+		try:
+			current, frames = await areplay_events(self.class_id, last_seq)
+		except Exception:
+			logger.warning('Event replay failed for classroom %s', self.class_id, exc_info=True)
+			current, frames = None, None
+		if frames is None:
+			await self._queue_frame(encode_event('resync_required', {'seq': current}))
+			return
+		for text in frames:
+			await self._queue_frame(text)
+		await self._queue_frame(encode_event('replay_complete', {'seq': current}))
+
+	async def _queue_frame(self, text, binary=None, event=None):
+		# Handlers only queue frames; _write_outbound sends them at the client's pace.
+		if self.outbound is None:
+			return
+		try:
+			self.outbound.put(text, binary, *(event or (None, None)))
+		except OutboundQueueFull:
+			logger.info('Closing slow connection to classroom %s: %s frames queued', self.class_id, self.outbound.depth)
+			self.outbound.clear()
+			self.outbound = None
+			await self.close(code=RESYNC_CLOSE_CODE)
+
+	async def _write_outbound(self, queue):
+		while True:
+			text, binary = await queue.get()
+			try:
+				await self._send_frame(text, binary)
+			except Exception:
+				logger.warning('WebSocket send failed for classroom %s', self.class_id, exc_info=True)
+				return
+
+	async def _send_frame(self, text, binary=None):
+		if self.use_msgpack:
+			await self.send(bytes_data=binary if binary is not None else text_frame_to_binary(text))
+		else:
+			await self.send(text_data=text)
 
+	async def note_frame(self, event):
+		# Pre-encoded by the broadcaster, so a group of N encodes the event once rather than N times.
+		await self._queue_frame(event['text'], event.get('bytes'), event.get('event'))
+
+	async def note_batch(self, event):
+		frames = event['frames']
+		binary_frames = event.get('binary_frames') or [None] * len(frames)
+		targets = event.get('events') or [None] * len(frames)
+		for text, binary, target in zip(frames, binary_frames, targets):
+			await self._queue_frame(text, binary, target)
+
+	# Unencoded events, as sent by processes still running code from before note_frame existed.
 	async def note_event(self, event):
-		await self.send_json(
-			{
-				'type': event['event_type'],
-				'payload': event['payload'],
-			}
-		)
+		event_type, payload = event['event_type'], event['payload']
+		binary = encode_event_binary(event_type, payload) if self.use_msgpack else None
+		target = payload.get('id') if isinstance(payload, dict) else None
+		await self._queue_frame(encode_event(event_type, payload), binary, (event_type, target))
 
 	@staticmethod
-	async def _get_user_from_access_token(raw_token):
+	def _get_user_id_from_access_token(raw_token):
 		try:
 			token = AccessToken(raw_token)
 		except TokenError:
 			return None
 
-		user_id = token.get('user_id')
-		if not user_id:
-			return None
-
 		try:
-			return await User.objects.aget(id=user_id)
-		except User.DoesNotExist:
+			return int(token.get('user_id'))
+		except (TypeError, ValueError):
 			return None
-
-	async def _user_has_classroom_access(self, user_id):
-		try:
-			classroom = await Classroom.objects.aget(class_id=self.class_id)
-		except Classroom.DoesNotExist:
-			return False
-
-		if classroom.owner_id == user_id:
-			return True
-
-		return await Enrollment.objects.filter(classroom=classroom, student_id=user_id).aexists()
-
-
-		
\ No newline at end of file
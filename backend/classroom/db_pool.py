@@ -0,0 +1,115 @@
+import asyncio
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+from classroom.metrics import LatencyStats
+
+
+class DatabaseWorkerPool:
+	# A fixed number of worker threads for blocking ORM calls made from the event loop.
+	# Unlike database_sync_to_async, calls are not pinned to the one thread-sensitive
+	# executor, so connections do not queue behind each other's queries.
+	def __init__(self, max_workers, name='classroom-db'):
+		self.max_workers = max_workers
+		self.name = name
+		self.wait_time = LatencyStats()
+		self.run_time = LatencyStats()
+		self._executor = None
+		self._lock = threading.Lock()
+		self._queued = 0
+		self._running = 0
+		self._peak_queue_depth = 0
+		self._completed = 0
+
+	def _get_executor(self):
+		if self._executor is None:
+			with self._lock:
+				if self._executor is None:
+					self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=self.name)
+		return self._executor
+
+	def _call(self, enqueued_at, func, args, kwargs):
+		started = time.perf_counter()
+		with self._lock:
+			self._queued -= 1
+			self._running += 1
+		self.wait_time.observe(started - enqueued_at)
+
+		close_old_connections()
+		try:
+			return func(*args, **kwargs)
+		finally:
+			close_old_connections()
+			self.run_time.observe(time.perf_counter() - started)
+			with self._lock:
+				self._running -= 1
+				self._completed += 1
+
+	async def run(self, func, *args, **kwargs):
+		if self.max_workers <= 0:
+			return await database_sync_to_async(func)(*args, **kwargs)
+
+		executor = self._get_executor()
+		with self._lock:
+			self._queued += 1
+			self._peak_queue_depth = max(self._peak_queue_depth, self._queued)
+		future = executor.submit(self._call, time.perf_counter(), func, args, kwargs)
+		try:
+			return await asyncio.wrap_future(future)
+		except asyncio.CancelledError:
+			# A call cancelled before it started never reaches _call.
+			if future.cancel():
+				with self._lock:
+					self._queued -= 1
+			raise
+
+	def stats(self):
+		with self._lock:
+			counters = {
+				'workers': self.max_workers,
+				'queue_depth': self._queued,
+				'peak_queue_depth': self._peak_queue_depth,
+				'running': self._running,
+				'completed': self._completed,
+			}
+		counters['wait'] = self.wait_time.snapshot()
+		counters['run'] = self.run_time.snapshot()
+		return counters
+
+	def reset_stats(self):
+		with self._lock:
+			self._peak_queue_depth = self._queued
+			self._completed = 0
+		self.wait_time.reset()
+		self.run_time.reset()
+
+	def shutdown(self, wait=True):
+		with self._lock:
+			executor, self._executor = self._executor, None
+		if executor is not None:
+			executor.shutdown(wait=wait)
+
+
+consumer_db_pool = DatabaseWorkerPool(settings.CLASSROOM_DB_POOL_SIZE)
+
+
+async def run_in_consumer_db_pool(func, *args, **kwargs):
+	return await consumer_db_pool.run(func, *args, **kwargs)
+
+
+def consumer_db_task(func):
+	# Drop-in replacement for @database_sync_to_async that runs on consumer_db_pool.
+	@functools.wraps(func)
+	async def wrapper(*args, **kwargs):
+		return await consumer_db_pool.run(func, *args, **kwargs)
+	return wrapper
+
+
+def consumer_db_pool_stats():
+	return consumer_db_pool.stats()
@@ -0,0 +1,163 @@
+import json
+import logging
+
+import msgpack
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+from classroom.channel_layers import ProcessLocalGroupChannelLayer
+from classroom.db_pool import run_in_consumer_db_pool
+from classroom.replay import get_event_log
+
+
+logger = logging.getLogger(__name__)
+
+MSGPACK_SUBPROTOCOL = 'msgpack'
+
+
+def classroom_group_name(class_id):
+	return f'classroom_{class_id}_notes'
+
+
+def teacher_group_name(class_id):
+	# The owner's sockets only, for events students should not see.
+	return f'classroom_{class_id}_teacher'
+
+
+def _event_body(event_type, payload, seq):
+	body = {'type': event_type, 'payload': payload}
+	if seq is not None:
+		body['seq'] = seq
+	return body
+
+
+def encode_event(event_type, payload, seq=None):
+	# The exact text frame every consumer in the group forwards; encoded once per broadcast.
+	return json.dumps(_event_body(event_type, payload, seq), separators=(',', ':'))
+
+
+def encode_event_binary(event_type, payload, seq=None):
+	return msgpack.packb(_event_body(event_type, payload, seq), use_bin_type=True)
+
+
+def text_frame_to_binary(text):
+	# For frames broadcast without a binary encoding (older processes or the setting off).
+	return msgpack.packb(json.loads(text), use_bin_type=True)
+
+
+def _event_target(event_type, payload, seq=None):
+	# What an event is about, so consumers can coalesce superseded frames without decoding them.
+	return [event_type, payload.get('id') if isinstance(payload, dict) else None, seq]
+
+
+def event_frame_message(event_type, payload, seq=None):
+	message = {
+		'type': 'note.frame',
+		'text': encode_event(event_type, payload, seq),
+		'event': _event_target(event_type, payload, seq),
+	}
+	if settings.CLASSROOM_WEBSOCKET_MSGPACK:
+		message['bytes'] = encode_event_binary(event_type, payload, seq)
+	return message
+
+
+def event_batch_message(events, first_seq=None):
+	# Several events in one channel-layer message; consumers send each frame in order.
+	if len(events) == 1:
+		return event_frame_message(*events[0], seq=first_seq)
+	seqs = range(first_seq, first_seq + len(events)) if first_seq is not None else [None] * len(events)
+	message = {
+		'type': 'note.batch',
+		'frames': [encode_event(event_type, payload, seq) for (event_type, payload), seq in zip(events, seqs)],
+		'events': [_event_target(event_type, payload, seq) for (event_type, payload), seq in zip(events, seqs)],
+	}
+	if settings.CLASSROOM_WEBSOCKET_MSGPACK:
+		message['binary_frames'] = [
+			encode_event_binary(event_type, payload, seq) for (event_type, payload), seq in zip(events, seqs)
+		]
+	return message
+
+
+def message_frames(message):
+	return message['frames'] if message['type'] == 'note.batch' else [message['text']]
+
+
+def sequenced_batch_message(class_id, events):
+	# Numbers the events from the classroom's counter and keeps their frames for replay.
+	built = {}
+
+	def encode_frames(first_seq):
+		built['message'] = event_batch_message(events, first_seq)
+		return message_frames(built['message'])
+
+	try:
+		get_event_log().append(class_id, encode_frames, len(events))
+	except Exception:
+		logger.warning('Event log append failed for classroom %s; broadcasting without seq', class_id, exc_info=True)
+		return event_batch_message(events)
+	return built['message']
+
+
+async def abroadcast_events(class_id, events):
+	events = list(events)
+	channel_layer = get_channel_layer()
+	if channel_layer is None or not events:
+		return
+	if get_event_log().blocking:
+		message = await run_in_consumer_db_pool(sequenced_batch_message, class_id, events)
+	else:
+		message = sequenced_batch_message(class_id, events)
+	await channel_layer.group_send(classroom_group_name(class_id), message)
+
+
+def replay_events(class_id, last_seq):
+	# (current seq, frames after last_seq), or (current seq, None) once the gap has left the buffer.
+	log = get_event_log()
+	if last_seq is None:
+		return log.current(class_id), []
+	return log.since(class_id, last_seq)
+
+
+async def areplay_events(class_id, last_seq):
+	if get_event_log().blocking:
+		return await run_in_consumer_db_pool(replay_events, class_id, last_seq)
+	return replay_events(class_id, last_seq)
+
+
+async def abroadcast_event(class_id, event_type, payload):
+	await abroadcast_events(class_id, [(event_type, payload)])
+
+
+def _group_send_sync(channel_layer, group, message):
+	if isinstance(channel_layer, ProcessLocalGroupChannelLayer):
+		channel_layer.group_send_sync(group, message)
+	else:
+		async_to_sync(channel_layer.group_send)(group, message)
+
+
+def broadcast_events(class_id, events):
+	events = list(events)
+	channel_layer = get_channel_layer()
+	if channel_layer is None or not events:
+		return
+	_group_send_sync(channel_layer, classroom_group_name(class_id), sequenced_batch_message(class_id, events))
+
+
+def broadcast_event(class_id, event_type, payload):
+	broadcast_events(class_id, [(event_type, payload)])
+
+
+async def anotify_teacher(class_id, event_type, payload):
+	# Unsequenced and not kept for replay: a teacher who missed it can still poll for the state.
+	channel_layer = get_channel_layer()
+	if channel_layer is None:
+		return
+	await channel_layer.group_send(teacher_group_name(class_id), event_frame_message(event_type, payload))
+
+
+def notify_teacher(class_id, event_type, payload):
+	channel_layer = get_channel_layer()
+	if channel_layer is None:
+		return
+	_group_send_sync(channel_layer, teacher_group_name(class_id), event_frame_message(event_type, payload))
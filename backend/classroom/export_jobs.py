@@ -0,0 +1,176 @@
+import logging
+import os
+import secrets
+import time
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.urls import reverse
+from django.utils import timezone
+
+from classroom.events import notify_teacher
+from classroom.exports import attendance_export_queryset, gzip_chunks, iter_attendance_csv, parse_export_filters
+from classroom.models import ExportJob
+from examination.exports import exam_results_queryset, iter_exam_results_csv
+
+
+logger = logging.getLogger(__name__)
+
+_FILTER_PARAMS = ('session_id', 'from', 'to')
+
+
+def enqueue_export(classroom, user, kind, params):
+	"""
+	Queue an export of kind with the session_id/from/to filters in params.
+
+	Raises ValueError with a message for the client when kind or a filter is invalid.
+	"""
+	if kind not in dict(ExportJob.KIND_CHOICES):
+		raise ValueError(f"kind must be one of: {', '.join(dict(ExportJob.KIND_CHOICES))}")
+	filters = {name: str(params[name]) for name in _FILTER_PARAMS if params.get(name)}
+	parse_export_filters(filters)
+	if kind == ExportJob.KIND_EXAM_RESULTS and 'session_id' in filters:
+		raise ValueError('session_id only applies to attendance exports')
+	return ExportJob.objects.create(classroom=classroom, requested_by=user, kind=kind, filters=filters)
+
+
+def artifact_filename(job):
+	# What the download is saved as, rather than the name on disk.
+	return f'{job.kind}_{job.classroom.class_id}.csv.gz'
+
+
+def artifact_path(job):
+	return Path(settings.EXPORT_ARTIFACT_DIR) / job.artifact_name
+
+
+def serialize_export_job(job):
+	class_id = job.classroom.class_id
+	return {
+		'id': job.id,
+		'kind': job.kind,
+		'filters': job.filters,
+		'status': job.status,
+		'error': job.error,
+		'size': job.artifact_size,
+		'created_at': job.created_at.isoformat(),
+		'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+		'download_url': (
+			reverse('download-export', args=[class_id, job.id]) if job.status == ExportJob.STATUS_DONE else None
+		),
+	}
+
+
+def _export_chunks(job):
+	filters = parse_export_filters(job.filters)
+	if job.kind == ExportJob.KIND_EXAM_RESULTS:
+		return iter_exam_results_csv(exam_results_queryset(job.classroom, **filters))
+	return iter_attendance_csv(attendance_export_queryset(job.classroom, **filters))
+
+
+def claim_next_export(now=None):
+	"""
+	Mark the oldest runnable job as running and return it, or None when there is none.
+
+	Runnable means pending, or running with no heartbeat for EXPORT_JOB_STALE_SECONDS (its
+	worker died); those are given up on after EXPORT_JOB_MAX_ATTEMPTS. The claim is a
+	conditional UPDATE, so two workers never run the same job.
+	"""
+	now = now or timezone.now()
+	stale = Q(status=ExportJob.STATUS_RUNNING, heartbeat_at__lt=now - timedelta(seconds=settings.EXPORT_JOB_STALE_SECONDS))
+	ExportJob.objects.filter(stale, attempts__gte=settings.EXPORT_JOB_MAX_ATTEMPTS).update(
+		status=ExportJob.STATUS_FAILED, error='The export worker stopped before finishing', finished_at=now,
+	)
+	runnable = Q(status=ExportJob.STATUS_PENDING) | stale
+	while True:
+		job_id = ExportJob.objects.filter(runnable).order_by('created_at', 'id').values_list('id', flat=True).first()
+		if job_id is None:
+			return None
+		claimed = ExportJob.objects.filter(runnable, id=job_id).update(
+			status=ExportJob.STATUS_RUNNING, started_at=now, heartbeat_at=now, attempts=F('attempts') + 1,
+		)
+		if claimed:
+			return ExportJob.objects.select_related('classroom').get(id=job_id)
+
+
+def _finish(job, **fields):
+	# Fenced on attempts: a worker that was presumed dead and replaced must not overwrite its successor.
+	fields['finished_at'] = timezone.now()
+	finished = ExportJob.objects.filter(id=job.id, status=ExportJob.STATUS_RUNNING, attempts=job.attempts).update(**fields)
+	if finished:
+		for name, value in fields.items():
+			setattr(job, name, value)
+	return finished
+
+
+def _write_artifact(job, directory, name):
+	partial = directory / f'{name}.part'
+	size = 0
+	beat_every = settings.EXPORT_JOB_STALE_SECONDS / 4
+	last_beat = time.monotonic()
+	try:
+		with open(partial, 'wb') as artifact:
+			for data in gzip_chunks(_export_chunks(job)):
+				artifact.write(data)
+				size += len(data)
+				if time.monotonic() - last_beat >= beat_every:
+					ExportJob.objects.filter(id=job.id, attempts=job.attempts).update(heartbeat_at=timezone.now())
+					last_beat = time.monotonic()
+		# Renamed into place only once complete, so a download never sees a partial file.
+		os.replace(partial, directory / name)
+	except BaseException:
+		partial.unlink(missing_ok=True)
+		raise
+	return size
+
+
+def run_export(job):
+	"""Write job's gzipped CSV to EXPORT_ARTIFACT_DIR, record the outcome and tell the teacher."""
+	directory = Path(settings.EXPORT_ARTIFACT_DIR)
+	directory.mkdir(parents=True, exist_ok=True)
+	name = f'{job.kind}-{job.id}-{secrets.token_hex(8)}.csv.gz'
+	try:
+		size = _write_artifact(job, directory, name)
+	except Exception as exc:
+		logger.exception('Export job %s failed', job.id)
+		finished = _finish(job, status=ExportJob.STATUS_FAILED, error=str(exc)[:500] or exc.__class__.__name__)
+	else:
+		finished = _finish(job, status=ExportJob.STATUS_DONE, artifact_name=name, artifact_size=size)
+		if not finished:
+			(directory / name).unlink(missing_ok=True)
+	if not finished:
+		logger.warning('Export job %s was taken over by another worker; discarding this run', job.id)
+		return job
+
+	try:
+		event_type = 'export_ready' if job.status == ExportJob.STATUS_DONE else 'export_failed'
+		notify_teacher(job.classroom.class_id, event_type, serialize_export_job(job))
+	except Exception:
+		logger.warning('Could not notify classroom %s about export job %s', job.classroom.class_id, job.id, exc_info=True)
+	return job
+
+
+def run_pending_exports(limit=None):
+	ran = 0
+	while limit is None or ran < limit:
+		job = claim_next_export()
+		if job is None:
+			break
+		run_export(job)
+		ran += 1
+	return ran
+
+
+def expire_exports(now=None):
+	"""Delete artifacts finished more than EXPORT_ARTIFACT_TTL_SECONDS ago and mark their jobs expired."""
+	now = now or timezone.now()
+	expired = ExportJob.objects.filter(
+		status=ExportJob.STATUS_DONE,
+		finished_at__lt=now - timedelta(seconds=settings.EXPORT_ARTIFACT_TTL_SECONDS),
+	)
+	count = 0
+	for job in expired.only('id', 'artifact_name'):
+		artifact_path(job).unlink(missing_ok=True)
+		count += ExportJob.objects.filter(id=job.id, status=ExportJob.STATUS_DONE).update(status=ExportJob.STATUS_EXPIRED)
+	return count
@@ -0,0 +1,258 @@
+import atexit
+import json
+import logging
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+
+from django.conf import settings
+from django.db import transaction
+
+from classroom.background import PeriodicTask
+from classroom.bitmaps import mark_presence
+from classroom.db_pool import run_in_consumer_db_pool
+from classroom.models import StudentAttendanceRecord
+from classroom.redis_client import get_redis_client
+from classroom.rollups import add_to_rollups
+
+
+logger = logging.getLogger(__name__)
+
+# buffered_at is wall-clock seconds so entries age the same way in every process.
+PendingHeartbeat = namedtuple('PendingHeartbeat', ('buffered_at', 'joined_at', 'seen_at', 'topic'))
+
+
+class MemoryHeartbeatBuffer:
+	blocking = False
+
+	def __init__(self):
+		self._pending = {}
+		self._lock = threading.Lock()
+
+	def __len__(self):
+		return len(self._pending)
+
+	def record(self, record_id, joined_at, seen_at, topic=None):
+		with self._lock:
+			entry = self._pending.get(record_id)
+			if entry is None:
+				self._pending[record_id] = PendingHeartbeat(time.time(), joined_at, seen_at, topic)
+			else:
+				self._pending[record_id] = entry._replace(seen_at=seen_at, topic=topic or entry.topic)
+
+	def pop(self, record_id):
+		with self._lock:
+			return self._pending.pop(record_id, None)
+
+	def take(self, buffered_before=None):
+		with self._lock:
+			if buffered_before is None:
+				taken, self._pending = self._pending, {}
+				return list(taken.items())
+			taken = [(record_id, entry) for record_id, entry in self._pending.items() if entry.buffered_at <= buffered_before]
+			for record_id, _ in taken:
+				del self._pending[record_id]
+			return taken
+
+	def restore(self, entries):
+		# Puts back entries from a failed flush unless a newer heartbeat replaced them.
+		with self._lock:
+			for record_id, entry in entries:
+				current = self._pending.get(record_id)
+				if current is None:
+					self._pending[record_id] = entry
+				else:
+					self._pending[record_id] = current._replace(
+						buffered_at=min(current.buffered_at, entry.buffered_at),
+						topic=current.topic or entry.topic,
+					)
+
+
+class RedisHeartbeatBuffer:
+	# Heartbeats live in a hash keyed by record id; a sorted set orders records by when
+	# they were first buffered so every process can flush the ones that are due.
+	blocking = True
+
+	DATA_KEY = 'lessonlive:heartbeats:data'
+	TOPIC_KEY = 'lessonlive:heartbeats:topic'
+	QUEUE_KEY = 'lessonlive:heartbeats:queue'
+
+	def __init__(self, client):
+		self.client = client
+
+	def __len__(self):
+		return self.client.zcard(self.QUEUE_KEY)
+
+	def record(self, record_id, joined_at, seen_at, topic=None, buffered_at=None):
+		pipe = self.client.pipeline(transaction=False)
+		pipe.hset(self.DATA_KEY, record_id, json.dumps([joined_at.isoformat(), seen_at.isoformat()]))
+		if topic:
+			pipe.hset(self.TOPIC_KEY, record_id, topic)
+		pipe.zadd(self.QUEUE_KEY, {record_id: buffered_at or time.time()}, nx=True)
+		pipe.execute()
+
+	def _take_ids(self, record_ids):
+		if not record_ids:
+			return []
+		pipe = self.client.pipeline(transaction=True)
+		pipe.zmscore(self.QUEUE_KEY, record_ids)
+		pipe.hmget(self.DATA_KEY, record_ids)
+		pipe.hmget(self.TOPIC_KEY, record_ids)
+		pipe.hdel(self.DATA_KEY, *record_ids)
+		pipe.hdel(self.TOPIC_KEY, *record_ids)
+		pipe.zrem(self.QUEUE_KEY, *record_ids)
+		scores, data, topics = pipe.execute()[:3]
+
+		entries = []
+		for record_id, buffered_at, raw, topic in zip(record_ids, scores, data, topics):
+			# Another process may have flushed the record between the range read and the transaction.
+			if raw is None:
+				continue
+			joined_at, seen_at = json.loads(raw)
+			entries.append((int(record_id), PendingHeartbeat(
+				buffered_at or time.time(),
+				datetime.fromisoformat(joined_at),
+				datetime.fromisoformat(seen_at),
+				topic.decode('utf-8') if topic else None,
+			)))
+		return entries
+
+	def pop(self, record_id):
+		entries = self._take_ids([record_id])
+		return entries[0][1] if entries else None
+
+	def take(self, buffered_before=None):
+		max_score = '+inf' if buffered_before is None else buffered_before
+		return self._take_ids(self.client.zrangebyscore(self.QUEUE_KEY, '-inf', max_score))
+
+	def restore(self, entries):
+		for record_id, entry in entries:
+			self.client.hsetnx(self.DATA_KEY, record_id, json.dumps([entry.joined_at.isoformat(), entry.seen_at.isoformat()]))
+			if entry.topic:
+				self.client.hsetnx(self.TOPIC_KEY, record_id, entry.topic)
+			self.client.zadd(self.QUEUE_KEY, {record_id: entry.buffered_at}, nx=True)
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_heartbeat_buffer():
+	global _buffer
+
+	if _buffer is None:
+		with _buffer_lock:
+			if _buffer is None:
+				client = get_redis_client() if settings.HEARTBEAT_BUFFER_BACKEND == 'redis' else None
+				if settings.HEARTBEAT_BUFFER_BACKEND == 'redis' and client is None:
+					logger.warning('HEARTBEAT_BUFFER_BACKEND is redis but Redis is unavailable; buffering in memory')
+				_buffer = RedisHeartbeatBuffer(client) if client is not None else MemoryHeartbeatBuffer()
+	return _buffer
+
+
+def write_heartbeats(entries):
+	# Records that already left have their final values; a late flush must not rewind them.
+	active = StudentAttendanceRecord.objects.filter(status=StudentAttendanceRecord.STATUS_ACTIVE)
+	pending = dict(entries)
+	updated = 0
+	with transaction.atomic(savepoint=False):
+		# Locked, so the durations the rollups move on from are the ones being replaced.
+		rows = (
+			active.filter(id__in=list(pending))
+			.select_for_update(of=('self',))
+			.order_by('id')
+			.values_list('id', 'session_id', 'student_id', 'joined_at', 'last_seen_at', 'duration_seconds', 'presence', 'session__started_at')
+		)
+		plain, with_topic, changes = [], [], []
+		for record_id, session_id, student_id, joined_at, last_seen_at, duration_seconds, presence, started_at in rows:
+			entry = pending[record_id]
+			record = StudentAttendanceRecord(
+				id=record_id,
+				duration_seconds=max(0, int((entry.seen_at - entry.joined_at).total_seconds())),
+				last_seen_at=entry.seen_at,
+				presence=presence,
+			)
+			if started_at is not None:
+				# Marked from the last heartbeat (the join before the first one) up to this one.
+				record.presence = mark_presence(presence, started_at, last_seen_at or joined_at, entry.seen_at)
+				changes.append((session_id, student_id, joined_at, record.duration_seconds - duration_seconds, entry.topic))
+			if entry.topic:
+				record.joined_topic = entry.topic
+				with_topic.append(record)
+			else:
+				plain.append(record)
+
+		if plain:
+			updated += active.bulk_update(plain, ['duration_seconds', 'last_seen_at', 'presence'], batch_size=500)
+		if with_topic:
+			updated += active.bulk_update(with_topic, ['duration_seconds', 'last_seen_at', 'presence', 'joined_topic'], batch_size=500)
+		if updated:
+			add_to_rollups(changes, StudentAttendanceRecord.objects.filter(id__in=list(pending)))
+	return updated
+
+
+def flush_heartbeats(force=False):
+	# Writes heartbeats that would exceed the staleness bound before the next tick.
+	buffer = get_heartbeat_buffer()
+	if force:
+		buffered_before = None
+	else:
+		slack = max(0.0, settings.HEARTBEAT_MAX_STALENESS_SECONDS - settings.HEARTBEAT_FLUSH_INTERVAL_SECONDS)
+		buffered_before = time.time() - slack
+
+	entries = buffer.take(buffered_before)
+	if not entries:
+		return 0
+	try:
+		write_heartbeats(entries)
+	except Exception:
+		buffer.restore(entries)
+		raise
+	return len(entries)
+
+
+_exit_hook_registered = False
+
+heartbeat_flusher = PeriodicTask('heartbeat-flush', settings.HEARTBEAT_FLUSH_INTERVAL_SECONDS, flush_heartbeats)
+
+
+def _flush_on_exit():
+	try:
+		flushed = flush_heartbeats(force=True)
+	except Exception:
+		logger.exception('Could not flush buffered heartbeats at shutdown')
+		return
+	if flushed:
+		logger.info('Flushed %s buffered heartbeats at shutdown', flushed)
+
+
+def start_heartbeat_flusher():
+	global _exit_hook_registered
+
+	if heartbeat_flusher.ensure_started() and not _exit_hook_registered:
+		_exit_hook_registered = True
+		atexit.register(_flush_on_exit)
+
+
+async def buffer_heartbeat(record_id, joined_at, seen_at, topic=None):
+	buffer = get_heartbeat_buffer()
+	try:
+		if buffer.blocking:
+			await run_in_consumer_db_pool(buffer.record, record_id, joined_at, seen_at, topic)
+		else:
+			buffer.record(record_id, joined_at, seen_at, topic)
+	except Exception:
+		logger.warning('Could not buffer heartbeat for attendance record %s', record_id, exc_info=True)
+
+
+async def discard_heartbeat(record_id):
+	# Removes and returns the pending heartbeat so the leave write can carry its topic.
+	buffer = get_heartbeat_buffer()
+	try:
+		if buffer.blocking:
+			return await run_in_consumer_db_pool(buffer.pop, record_id)
+		return buffer.pop(record_id)
+	except Exception:
+		logger.warning('Could not discard buffered heartbeat for attendance record %s', record_id, exc_info=True)
+		return None
@@ -0,0 +1,135 @@
+from django.contrib.auth.models import User
+from django.db.models import BooleanField, Case, Count, FilteredRelation, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+from classroom.models import AttendanceRollup
+
+
+def duration_tenths(seconds_expression):
+	# Minutes to one decimal as integer tenths, for ordering in SQL. The value shown is still
+	# Python's round(seconds / 60, 1); the two only disagree on exact half tenths (e.g. 9 s).
+	return (seconds_expression + Value(3)) / Value(6)
+
+
+def _engagement(minutes):
+	if minutes >= 15:
+		return 'High'
+	if minutes >= 5:
+		return 'Moderate'
+	return 'Low'
+
+
+def _serialize_student(row):
+	base = {
+		'student_id': row['id'],
+		'username': row['username'],
+		'email': row['email'],
+		'full_name': f"{row['first_name']} {row['last_name']}".strip() or row['username'],
+	}
+	if not row['visits']:
+		return {
+			**base,
+			'status': 'Absent',
+			'total_duration_minutes': 0,
+			'joined_at': None,
+			'left_at': None,
+			'joined_topic': 'N/A',
+			'engagement': 'None',
+			'sessions_attended_count': 0,
+		}
+	minutes = round(row['total_seconds'] / 60, 1)
+	return {
+		**base,
+		'status': 'Active Now' if row['is_live'] else 'Left',
+		'total_duration_minutes': minutes,
+		'joined_at': row['latest_joined_at'].isoformat() if row['latest_joined_at'] else None,
+		'left_at': row['latest_left_at'].isoformat() if row['latest_left_at'] else None,
+		'joined_topic': row['latest_topic'],
+		'engagement': _engagement(minutes),
+		'sessions_attended_count': row['visits'],
+	}
+
+
+def attendance_insights(classroom, session_id=None, present_ids=(), offset=0, limit=None):
+	"""
+	Per-student attendance totals for a classroom, read from the attendance rollups.
+
+	Enrolled students are LEFT JOINed to their per-session rollups and grouped, so a
+	student costs one row per session attended rather than one per visit; ordering (online
+	first, then longest attendance) and the offset/limit page are applied in SQL.
+	"""
+	rollups = AttendanceRollup.objects.filter(classroom=classroom)
+	rollup_condition = Q(attendance_rollups__classroom=classroom)
+	if session_id:
+		rollups = rollups.filter(session_id=session_id)
+		rollup_condition &= Q(attendance_rollups__session_id=session_id)
+	present_ids = list(present_ids)
+
+	students = (
+		User.objects
+		.filter(class_enrollments__classroom=classroom)
+		.alias(attended=FilteredRelation('attendance_rollups', condition=rollup_condition))
+		.annotate(
+			total_seconds=Coalesce(Sum('attended__total_duration_seconds'), Value(0)),
+			visits=Coalesce(Sum('attended__visit_count'), Value(0)),
+			open_visits=Coalesce(Sum('attended__open_visit_count'), Value(0)),
+		)
+		.annotate(
+			# Rows left 'active' by a process that died before disconnect ran must not count as
+			# online, so a live record also needs the student in the presence index.
+			is_live=Case(
+				When(Q(id__in=present_ids, open_visits__gt=0), then=Value(True)),
+				default=Value(False),
+				output_field=BooleanField(),
+			),
+			tenths=duration_tenths(Coalesce(Sum('attended__total_duration_seconds'), Value(0))),
+		)
+	)
+
+	# The session with the latest visit is an index seek per student on (classroom, student, latest_joined_at).
+	latest = rollups.filter(student=OuterRef('pk')).order_by('-latest_joined_at', '-id')
+	page = (
+		students
+		.order_by('-is_live', '-tenths', 'id')
+		.annotate(
+			latest_joined_at=Subquery(latest.values('latest_joined_at')[:1]),
+			latest_left_at=Subquery(latest.values('latest_left_at')[:1]),
+			latest_topic=Subquery(latest.values('latest_topic')[:1]),
+		)
+		.values(
+			'id', 'username', 'email', 'first_name', 'last_name', 'total_seconds', 'visits', 'tenths', 'is_live',
+			'latest_joined_at', 'latest_left_at', 'latest_topic',
+		)
+	)
+	if limit is None and not offset:
+		page = list(page)
+		# Already nearly in order; this settles half-tenth ties exactly as the shown minutes do.
+		page.sort(key=lambda row: (not row['is_live'], -round(row['total_seconds'] / 60, 1), row['id']))
+		summary = {
+			'total_enrolled': len(page),
+			'attended_seconds': sum(row['total_seconds'] for row in page),
+			'active_now': sum(1 for row in page if row['is_live']),
+		}
+	else:
+		page = page[offset:offset + limit] if limit is not None else page[offset:]
+		summary = students.aggregate(
+			total_enrolled=Count('id'),
+			attended_seconds=Coalesce(Sum('total_seconds'), Value(0)),
+			active_now=Count('id', filter=Q(is_live=True)),
+		)
+	# Counts every student with records, enrolled or not, as the dashboard always has.
+	total_attended = rollups.values('student_id').distinct().count()
+
+	total_enrolled = summary['total_enrolled']
+	return {
+		'summary': {
+			'total_enrolled': total_enrolled,
+			'total_attended': total_attended,
+			'active_now': summary['active_now'],
+			'attendance_rate': round((total_attended / total_enrolled * 100), 1) if total_enrolled > 0 else 0,
+			'avg_duration_minutes': (
+				round((summary['attended_seconds'] / total_attended / 60), 1) if total_attended > 0 else 0
+			),
+		},
+		'students': [_serialize_student(row) for row in page],
+	}
@@ -0,0 +1,81 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from classroom.bitmaps import merge_bitmaps
+from classroom.models import StudentAttendanceRecord
+from classroom.rollups import refresh_attendance_rollups
+
+
+class Command(BaseCommand):
+	help = (
+		'Merge attendance records left by reconnects: consecutive closed records of the same '
+		'student and session, separated by at most the grace window, become one record. Their '
+		'presence bitmaps are combined, so the gaps between them stay on record.'
+	)
+
+	def add_arguments(self, parser):
+		parser.add_argument('--grace-seconds', type=int, default=None)
+		parser.add_argument('--batch-size', type=int, default=1000)
+		parser.add_argument('--dry-run', action='store_true')
+
+	def handle(self, *args, grace_seconds=None, batch_size=1000, dry_run=False, **options):
+		if grace_seconds is None:
+			grace_seconds = settings.ATTENDANCE_RECONNECT_GRACE_SECONDS
+		grace = timedelta(seconds=max(0, grace_seconds))
+
+		# Still-active records are left alone: a live connection holds their id.
+		records = (
+			StudentAttendanceRecord.objects
+			.filter(session__isnull=False, status=StudentAttendanceRecord.STATUS_LEFT, left_at__isnull=False)
+			.order_by('session_id', 'student_id', 'joined_at', 'id')
+			.only('id', 'session_id', 'student_id', 'joined_at', 'left_at', 'last_seen_at', 'duration_seconds', 'joined_topic', 'presence')
+		)
+
+		changed, deleted, survivors = {}, [], set()
+		merged = scanned = 0
+		current = None
+		for record in records.iterator(chunk_size=batch_size):
+			scanned += 1
+			if (
+				current is not None
+				and (current.session_id, current.student_id) == (record.session_id, record.student_id)
+				and record.joined_at - current.left_at <= grace
+			):
+				current.left_at = max(current.left_at, record.left_at)
+				current.last_seen_at = max(filter(None, (current.last_seen_at, record.last_seen_at)), default=None)
+				current.duration_seconds += record.duration_seconds
+				current.joined_topic = record.joined_topic
+				current.presence = merge_bitmaps(current.presence, record.presence)
+				changed[current.id] = current
+				survivors.add(current.id)
+				deleted.append(record.id)
+				merged += 1
+				if len(deleted) >= batch_size and not dry_run:
+					self._apply(changed, deleted, current, batch_size)
+				continue
+			current = record
+
+		if not dry_run:
+			self._apply(changed, deleted, None, batch_size)
+
+		verb = 'Would merge' if dry_run else 'Merged'
+		self.stdout.write(
+			f'{verb} {merged} of {scanned} closed attendance records into {len(survivors)} earlier records.'
+		)
+
+	def _apply(self, changed, deleted, keep, batch_size):
+		# The record still being extended is written again once it stops growing.
+		pending = {keep.id: keep} if keep is not None else {}
+		with transaction.atomic():
+			StudentAttendanceRecord.objects.bulk_update(
+				changed.values(), ['left_at', 'last_seen_at', 'duration_seconds', 'joined_topic', 'presence'], batch_size=batch_size
+			)
+			StudentAttendanceRecord.objects.filter(id__in=deleted).delete()
+			# Totals are unchanged, but each merge is one visit fewer.
+			refresh_attendance_rollups(StudentAttendanceRecord.objects.filter(id__in=list(changed)))
+		changed.clear()
+		changed.update(pending)
+		deleted.clear()
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from classroom.models import Classroom, ClassroomSession
+from classroom.rollups import rebuild_attendance_rollups
+
+
+class Command(BaseCommand):
+	help = 'Regenerate the attendance rollups that back the insights dashboard from the raw attendance records.'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--classroom', help='class_id of a single classroom to rebuild')
+		parser.add_argument('--batch-size', type=int, default=50, help='sessions rebuilt per transaction')
+
+	def handle(self, *args, classroom=None, batch_size=50, **options):
+		sessions = ClassroomSession.objects.order_by('id')
+		if classroom:
+			if not Classroom.objects.filter(class_id=classroom).exists():
+				raise CommandError(f'Classroom {classroom} not found')
+			sessions = sessions.filter(classroom__class_id=classroom)
+		session_ids = list(sessions.values_list('id', flat=True))
+
+		batch_size = max(1, batch_size)
+		rebuilt = 0
+		for start in range(0, len(session_ids), batch_size):
+			rebuilt += rebuild_attendance_rollups(session_ids[start:start + batch_size])
+		self.stdout.write(f'Rebuilt {rebuilt} attendance rollups for {len(session_ids)} sessions.')
@@ -0,0 +1,31 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from classroom.export_jobs import expire_exports, run_pending_exports
+
+
+class Command(BaseCommand):
+	help = (
+		'Run queued CSV export jobs, polling the database for new ones. Needs no queue service; '
+		'any number of workers can run side by side.'
+	)
+
+	def add_arguments(self, parser):
+		parser.add_argument('--once', action='store_true', help='run the jobs queued now, then exit')
+		parser.add_argument('--poll-seconds', type=float, help='idle wait between polls (default EXPORT_JOB_POLL_SECONDS)')
+
+	def handle(self, *args, once=False, poll_seconds=None, **options):
+		poll_seconds = settings.EXPORT_JOB_POLL_SECONDS if poll_seconds is None else poll_seconds
+		while True:
+			close_old_connections()
+			ran = run_pending_exports()
+			expired = expire_exports()
+			if ran or expired or once:
+				self.stdout.write(f'Ran {ran} export jobs; expired {expired} artifacts.')
+			if once:
+				return
+			if not ran:
+				time.sleep(poll_seconds)
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from classroom.attendance import close_stale_attendance
+
+
+class Command(BaseCommand):
+	help = 'Close active attendance records that have not sent a heartbeat within ATTENDANCE_STALE_AFTER_SECONDS.'
+
+	def handle(self, *args, **options):
+		closed = close_stale_attendance()
+		self.stdout.write(f'Closed {closed} stale attendance records.')
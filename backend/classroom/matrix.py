@@ -0,0 +1,110 @@
+import numpy as np
+from django.contrib.auth.models import User
+
+from classroom.models import AttendanceRollup, ClassroomSession
+
+
+ORDER_NAME = 'name'
+ORDER_MOST_ENGAGED = 'most_engaged'
+ORDER_LEAST_ENGAGED = 'least_engaged'
+ORDER_CLUSTER = 'cluster'
+ORDERS = (ORDER_NAME, ORDER_MOST_ENGAGED, ORDER_LEAST_ENGAGED, ORDER_CLUSTER)
+
+
+def _positions(labels, values):
+	# Index of each value in labels, or -1 for values not in it.
+	if not len(labels):
+		return np.full(len(values), -1)
+	order = np.argsort(labels)
+	found = order[np.minimum(np.searchsorted(labels[order], values), len(labels) - 1)]
+	return np.where(labels[found] == values, found, -1)
+
+
+def _minutes(seconds):
+	# round(seconds / 60, 1), as the insights dashboard shows durations. Only exact half
+	# tenths (seconds % 6 == 3) depend on the float error round() sees, so only those go through it.
+	minutes = ((seconds + 3) // 6) / 10
+	halves = np.flatnonzero(seconds % 6 == 3)
+	minutes[halves] = [round(value / 60, 1) for value in seconds[halves].tolist()]
+	return minutes
+
+
+def _cluster_order(seconds):
+	"""
+	Rows ordered along the leading principal axis of their attendance pattern, so students
+	who came to the same sessions end up next to each other, most engaged group first.
+	"""
+	rows = np.arange(len(seconds))
+	if not seconds.size:
+		return rows
+	# Each session scaled by its longest attendance, so long sessions don't dominate the pattern.
+	shares = seconds / np.maximum(seconds.max(axis=0), 1)
+	centered = shares - shares.mean(axis=0)
+	if not centered.any():
+		return rows
+	_, _, axes = np.linalg.svd(centered, full_matrices=False)
+	scores = centered @ axes[0]
+	# A singular vector's sign is arbitrary; point it towards the students who attended more.
+	if scores @ shares.sum(axis=1) < 0:
+		scores = -scores
+	return np.lexsort((rows, -scores.round(9)))
+
+
+def attendance_matrix(classroom, order=ORDER_NAME):
+	"""
+	Minutes each enrolled student attended each of the classroom's sessions.
+
+	Returns row labels (students), column labels (sessions, oldest first) and the
+	matrix as a flat row-major list, filled from one query over the attendance rollups.
+	"""
+	students = list(
+		User.objects.filter(class_enrollments__classroom=classroom)
+		.order_by('username', 'id')
+		.values_list('id', 'username', 'first_name', 'last_name')
+	)
+	sessions = list(
+		ClassroomSession.objects.filter(classroom=classroom)
+		.order_by('started_at', 'id')
+		.values_list('id', 'title', 'started_at')
+	)
+	cells = np.array(
+		list(
+			AttendanceRollup.objects.filter(classroom=classroom)
+			.values_list('student_id', 'session_id', 'total_duration_seconds')
+		),
+		dtype=np.int64,
+	).reshape(-1, 3)
+
+	student_ids = np.array([student[0] for student in students], dtype=np.int64)
+	session_ids = np.array([session[0] for session in sessions], dtype=np.int64)
+	rows = _positions(student_ids, cells[:, 0])
+	columns = _positions(session_ids, cells[:, 1])
+	known = (rows >= 0) & (columns >= 0)
+	seconds = np.zeros((len(students), len(sessions)), dtype=np.int64)
+	seconds[rows[known], columns[known]] = cells[known, 2]
+
+	if order == ORDER_CLUSTER:
+		row_order = _cluster_order(seconds)
+	elif order in (ORDER_MOST_ENGAGED, ORDER_LEAST_ENGAGED):
+		totals = seconds.sum(axis=1)
+		# Stable, so equally engaged students stay in name order.
+		row_order = np.argsort(-totals if order == ORDER_MOST_ENGAGED else totals, kind='stable')
+	else:
+		row_order = np.arange(len(students))
+	seconds = seconds[row_order]
+	students = [students[index] for index in row_order.tolist()]
+
+	return {
+		'shape': [len(students), len(sessions)],
+		'students': {
+			'ids': [student[0] for student in students],
+			'usernames': [student[1] for student in students],
+			'full_names': [f'{student[2]} {student[3]}'.strip() or student[1] for student in students],
+		},
+		'sessions': {
+			'ids': [session[0] for session in sessions],
+			'titles': [session[1] for session in sessions],
+			'started_at': [session[2].isoformat() for session in sessions],
+		},
+		'minutes': _minutes(seconds.ravel()).tolist(),
+	}
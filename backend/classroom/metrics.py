@@ -0,0 +1,45 @@
+import threading
+from collections import deque
+
+
+class LatencyStats:
+	# Thread-safe counters plus a bounded window of recent samples for percentiles.
+	def __init__(self, max_samples=4096):
+		self._samples = deque(maxlen=max_samples)
+		self._lock = threading.Lock()
+		self._count = 0
+		self._total = 0.0
+		self._max = 0.0
+
+	def observe(self, seconds):
+		with self._lock:
+			self._samples.append(seconds)
+			self._count += 1
+			self._total += seconds
+			if seconds > self._max:
+				self._max = seconds
+
+	def reset(self):
+		with self._lock:
+			self._samples.clear()
+			self._count = 0
+			self._total = 0.0
+			self._max = 0.0
+
+	def snapshot(self):
+		with self._lock:
+			samples = sorted(self._samples)
+			count, total, maximum = self._count, self._total, self._max
+
+		def percentile(pct):
+			if not samples:
+				return 0.0
+			return samples[min(len(samples) - 1, int(round(pct / 100 * (len(samples) - 1))))]
+
+		return {
+			'count': count,
+			'mean_ms': round(total / count * 1000, 3) if count else 0.0,
+			'p50_ms': round(percentile(50) * 1000, 3),
+			'p99_ms': round(percentile(99) * 1000, 3),
+			'max_ms': round(maximum * 1000, 3),
+		}
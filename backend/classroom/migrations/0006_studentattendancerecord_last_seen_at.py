@@ -0,0 +1,18 @@
+# Generated by Django 6.0.2 on 2026-10-17 02:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('classroom', '0005_classroomsession_studentattendancerecord'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='studentattendancerecord',
+            name='last_seen_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
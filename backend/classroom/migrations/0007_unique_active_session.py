@@ -0,0 +1,37 @@
+# Generated by Django 6.0.2 on 2026-10-17 02:20
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def close_duplicate_active_sessions(apps, schema_editor):
+    # Concurrent joins could create several active sessions per classroom; keep the
+    # newest one open so the constraint below can be created.
+    ClassroomSession = apps.get_model('classroom', 'ClassroomSession')
+    seen = set()
+    duplicates = []
+    for session_id, classroom_id in (
+        ClassroomSession.objects.filter(is_active=True)
+        .order_by('classroom_id', '-started_at', '-id')
+        .values_list('id', 'classroom_id')
+    ):
+        if classroom_id in seen:
+            duplicates.append(session_id)
+        seen.add(classroom_id)
+    if duplicates:
+        ClassroomSession.objects.filter(id__in=duplicates).update(is_active=False, ended_at=timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('classroom', '0006_studentattendancerecord_last_seen_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(close_duplicate_active_sessions, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='classroomsession',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_active', True)), fields=('classroom',), name='unique_active_session_per_classroom'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 6.0.2 on 2026-10-17 09:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('classroom', '0007_unique_active_session'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='studentattendancerecord',
+            index=models.Index(fields=['classroom', 'student', 'joined_at'], name='attendance_class_student_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='studentattendancerecord',
+            index=models.Index(fields=['session', 'student', 'joined_at'], name='attendance_session_student_idx'),
+        ),
+    ]
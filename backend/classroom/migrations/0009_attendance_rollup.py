@@ -0,0 +1,62 @@
+# Generated by Django 6.0.2 on 2026-10-17 11:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, Min, OuterRef, Q, Subquery, Sum
+
+
+def build_rollups(apps, schema_editor):
+    StudentAttendanceRecord = apps.get_model('classroom', 'StudentAttendanceRecord')
+    AttendanceRollup = apps.get_model('classroom', 'AttendanceRollup')
+    latest = StudentAttendanceRecord.objects.filter(
+        session_id=OuterRef('session_id'), student_id=OuterRef('student_id'),
+    ).order_by('-joined_at', '-id')
+    rows = (
+        StudentAttendanceRecord.objects
+        .filter(session__isnull=False)
+        .values('classroom_id', 'session_id', 'student_id')
+        .annotate(
+            total_duration_seconds=Sum('duration_seconds'),
+            visit_count=Count('id'),
+            open_visit_count=Count('id', filter=Q(status='active')),
+            first_joined_at=Min('joined_at'),
+            latest_joined_at=Max('joined_at'),
+            latest_left_at=Subquery(latest.values('left_at')[:1]),
+            latest_topic=Subquery(latest.values('joined_topic')[:1]),
+        )
+        .order_by()
+    )
+    AttendanceRollup.objects.bulk_create((AttendanceRollup(**row) for row in rows.iterator()), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('classroom', '0008_attendance_insight_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttendanceRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_duration_seconds', models.PositiveIntegerField(default=0)),
+                ('visit_count', models.PositiveIntegerField(default=0)),
+                ('open_visit_count', models.PositiveIntegerField(default=0)),
+                ('first_joined_at', models.DateTimeField(blank=True, null=True)),
+                ('latest_joined_at', models.DateTimeField(blank=True, null=True)),
+                ('latest_left_at', models.DateTimeField(blank=True, null=True)),
+                ('latest_topic', models.CharField(default='Live Classroom', max_length=255)),
+                ('classroom', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attendance_rollups', to='classroom.classroom')),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attendance_rollups', to='classroom.classroomsession')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attendance_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['classroom', 'student', 'latest_joined_at'], name='attendance_rollup_class_idx')],
+                'constraints': [models.UniqueConstraint(fields=('session', 'student'), name='unique_attendance_rollup')],
+            },
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
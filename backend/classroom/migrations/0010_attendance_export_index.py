@@ -0,0 +1,23 @@
+# Generated by Django 6.0.2 on 2026-10-17 13:20
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('classroom', '0009_attendance_rollup'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='studentattendancerecord',
+            name='attendance_class_student_idx',
+        ),
+        migrations.AddIndex(
+            model_name='studentattendancerecord',
+            index=models.Index(fields=['classroom', 'joined_at'], name='attendance_class_joined_idx'),
+        ),
+    ]
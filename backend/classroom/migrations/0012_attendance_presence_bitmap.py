@@ -0,0 +1,47 @@
+# Generated by Django 6.0.2 on 2026-10-17 16:40
+
+from django.db import migrations, models
+
+
+def _minutes_bitmap(first, last):
+    # Minutes first through last set, most significant bit first.
+    length = last // 8 + 1
+    return (((1 << (last - first + 1)) - 1) << (length * 8 - 1 - last)).to_bytes(length, 'big')
+
+
+def backfill_presence(apps, schema_editor):
+    # Closed records were present throughout [joined_at, left_at]; open ones up to their last heartbeat.
+    StudentAttendanceRecord = apps.get_model('classroom', 'StudentAttendanceRecord')
+    records = (
+        StudentAttendanceRecord.objects
+        .filter(session__isnull=False)
+        .order_by('id')
+        .values_list('id', 'joined_at', 'left_at', 'last_seen_at', 'session__started_at')
+    )
+    batch = []
+    for record_id, joined_at, left_at, last_seen_at, started_at in records.iterator(chunk_size=2000):
+        until = left_at or last_seen_at or joined_at
+        first = max(0, int((joined_at - started_at).total_seconds() // 60))
+        last = min(int((until - started_at).total_seconds() // 60), 7 * 24 * 60 - 1)
+        if last >= first:
+            batch.append(StudentAttendanceRecord(id=record_id, presence=_minutes_bitmap(first, last)))
+        if len(batch) >= 2000:
+            StudentAttendanceRecord.objects.bulk_update(batch, ['presence'])
+            batch = []
+    StudentAttendanceRecord.objects.bulk_update(batch, ['presence'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('classroom', '0011_export_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='studentattendancerecord',
+            name='presence',
+            field=models.BinaryField(blank=True, default=bytes),
+        ),
+        migrations.RunPython(backfill_presence, migrations.RunPython.noop),
+    ]
@@ -15,6 +15,13 @@ class Classroom(models.Model):
 	class_id = models.CharField(max_length=40, unique=True, default=generate_class_id)
 	created_at = models.DateTimeField(auto_now_add=True)
 
+	@classmethod
+	def from_reference(cls, pk, class_id, owner_id=None):
+		# Unloaded stand-in for filters and FK assignment when only the key is known.
+		classroom = cls(id=pk, class_id=class_id, owner_id=owner_id)
+		classroom._state.adding = False
+		return classroom
+
 	def __str__(self):
 		return f'{self.name} ({self.class_id})'
 
@@ -130,6 +137,13 @@ class ClassroomSession(models.Model):
 
 	class Meta:
 		ordering = ['-started_at']
+		constraints = [
+			models.UniqueConstraint(
+				fields=['classroom'],
+				condition=models.Q(is_active=True),
+				name='unique_active_session_per_classroom',
+			),
+		]
 
 	def __str__(self):
 		return f'Session: {self.title} ({self.classroom.class_id})'
@@ -151,10 +165,19 @@ class StudentAttendanceRecord(models.Model):
 	duration_seconds = models.PositiveIntegerField(default=0)
 	status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_ACTIVE)
 	joined_topic = models.CharField(max_length=255, default='Live Classroom')
+	last_seen_at = models.DateTimeField(null=True, blank=True)
+	# Bit i set: present during minute i since the session started. Filled by classroom.bitmaps.
+	presence = models.BinaryField(default=bytes, blank=True)
 	created_at = models.DateTimeField(auto_now_add=True)
 
 	class Meta:
 		ordering = ['-joined_at']
+		indexes = [
+			# A classroom's history newest first, for CSV exports.
+			models.Index(fields=['classroom', 'joined_at'], name='attendance_class_joined_idx'),
+			# One student's visits in a session, for rollups and reconnects.
+			models.Index(fields=['session', 'student', 'joined_at'], name='attendance_session_student_idx'),
+		]
 
 	def update_duration(self, current_time=None):
 		if current_time is None:
@@ -166,3 +189,76 @@ class StudentAttendanceRecord(models.Model):
 	def __str__(self):
 		return f'{self.student.username} - {self.classroom.class_id} ({self.status})'
 
+
+class AttendanceRollup(models.Model):
+	# Totals of one student's attendance records in one session, kept current by classroom.rollups.
+	classroom = models.ForeignKey(Classroom, on_delete=models.CASCADE, related_name='attendance_rollups')
+	session = models.ForeignKey(ClassroomSession, on_delete=models.CASCADE, related_name='attendance_rollups')
+	student = models.ForeignKey(User, on_delete=models.CASCADE, related_name='attendance_rollups')
+	total_duration_seconds = models.PositiveIntegerField(default=0)
+	visit_count = models.PositiveIntegerField(default=0)
+	open_visit_count = models.PositiveIntegerField(default=0)
+	first_joined_at = models.DateTimeField(null=True, blank=True)
+	# The latest visit: when it started, when it ended (None while open) and its topic.
+	latest_joined_at = models.DateTimeField(null=True, blank=True)
+	latest_left_at = models.DateTimeField(null=True, blank=True)
+	latest_topic = models.CharField(max_length=255, default='Live Classroom')
+
+	class Meta:
+		constraints = [
+			models.UniqueConstraint(fields=['session', 'student'], name='unique_attendance_rollup'),
+		]
+		indexes = [
+			models.Index(fields=['classroom', 'student', 'latest_joined_at'], name='attendance_rollup_class_idx'),
+		]
+
+	def __str__(self):
+		return f'{self.student_id} in session {self.session_id}: {self.total_duration_seconds}s over {self.visit_count} visits'
+
+
+class ExportJob(models.Model):
+	# A CSV export built in the background by "manage.py run_export_jobs"; see classroom.export_jobs.
+	KIND_ATTENDANCE = 'attendance'
+	KIND_EXAM_RESULTS = 'exam_results'
+	KIND_CHOICES = (
+		(KIND_ATTENDANCE, 'Attendance'),
+		(KIND_EXAM_RESULTS, 'Exam results'),
+	)
+
+	STATUS_PENDING = 'pending'
+	STATUS_RUNNING = 'running'
+	STATUS_DONE = 'done'
+	STATUS_FAILED = 'failed'
+	STATUS_EXPIRED = 'expired'
+	STATUS_CHOICES = (
+		(STATUS_PENDING, 'Pending'),
+		(STATUS_RUNNING, 'Running'),
+		(STATUS_DONE, 'Done'),
+		(STATUS_FAILED, 'Failed'),
+		(STATUS_EXPIRED, 'Expired'),
+	)
+
+	classroom = models.ForeignKey(Classroom, on_delete=models.CASCADE, related_name='export_jobs')
+	requested_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='export_jobs')
+	kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+	# The request's filter parameters as given (session_id, from, to), re-parsed by the worker.
+	filters = models.JSONField(default=dict, blank=True)
+	status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+	attempts = models.PositiveIntegerField(default=0)
+	artifact_name = models.CharField(max_length=255, blank=True)
+	artifact_size = models.PositiveBigIntegerField(null=True, blank=True)
+	error = models.CharField(max_length=500, blank=True)
+	created_at = models.DateTimeField(auto_now_add=True)
+	started_at = models.DateTimeField(null=True, blank=True)
+	# Refreshed by the worker while it writes, so a job whose worker died can be picked up again.
+	heartbeat_at = models.DateTimeField(null=True, blank=True)
+	finished_at = models.DateTimeField(null=True, blank=True)
+
+	class Meta:
+		ordering = ['-created_at', '-id']
+		indexes = [
+			models.Index(fields=['status', 'created_at'], name='export_job_queue_idx'),
+		]
+
+	def __str__(self):
+		return f'{self.kind} export #{self.id} ({self.classroom.class_id}, {self.status})'
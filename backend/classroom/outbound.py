@@ -0,0 +1,115 @@
+import asyncio
+import weakref
+from collections import Counter, deque
+
+from classroom.events import encode_event
+
+
+# Totals across every connection in this process, since start-up.
+outbound_counters = Counter()
+_queues = weakref.WeakSet()
+
+
+class OutboundQueueFull(Exception):
+	pass
+
+
+class OutboundQueue:
+	"""
+	Frames waiting to be written to one WebSocket connection.
+
+	Superseded events are dropped while still queued: a note_displayed followed by a
+	note_removed for the same displayed note cancels out, and a newer notification_sent
+	replaces an older one. Dropped frames that carry seqs leave a skip frame listing them,
+	so clients can still advance their last seq. put() raises OutboundQueueFull once
+	maxsize frames are waiting.
+	"""
+
+	def __init__(self, maxsize):
+		self.maxsize = maxsize
+		self.depth = 0
+		self.max_depth = 0
+		self.coalesced = 0
+		self._entries = deque()
+		self._displayed = {}
+		self._notification = None
+		self._ready = asyncio.Event()
+		_queues.add(self)
+
+	def _count_dropped(self):
+		self.coalesced += 1
+		outbound_counters['coalesced'] += 1
+
+	def _cancel(self, entry):
+		entry[2] = True
+		self.depth -= 1
+		self._count_dropped()
+
+	def _supersede(self, entry, seq=None):
+		# seq is that of the frame superseding entry, when it is dropped as well.
+		seqs = entry[5] + ([seq] if seq is not None else [])
+		if not seqs:
+			self._cancel(entry)
+			return
+		entry[0], entry[1], entry[5] = encode_event('skip', {'seqs': seqs}), None, seqs
+		self._count_dropped()
+
+	def put(self, text, binary=None, event_type=None, target=None, seq=None):
+		if event_type == 'note_removed' and target in self._displayed:
+			self._supersede(self._displayed.pop(target), seq)
+			self._count_dropped()
+			return
+		if event_type == 'notification_sent' and self._notification is not None:
+			self._supersede(self._notification)
+			self._notification = None
+
+		if self.depth >= self.maxsize:
+			outbound_counters['overflows'] += 1
+			raise OutboundQueueFull()
+
+		# [text, binary, cancelled, event_type, target, seqs]
+		entry = [text, binary, False, event_type, target, [seq] if seq is not None else []]
+		self._entries.append(entry)
+		if event_type == 'note_displayed' and target is not None:
+			self._displayed[target] = entry
+		elif event_type == 'notification_sent':
+			self._notification = entry
+		self.depth += 1
+		self.max_depth = max(self.max_depth, self.depth)
+		self._ready.set()
+
+	async def get(self):
+		while True:
+			while self._entries:
+				entry = self._entries.popleft()
+				if entry[2]:
+					continue
+				if self._displayed.get(entry[4]) is entry:
+					del self._displayed[entry[4]]
+				elif self._notification is entry:
+					self._notification = None
+				self.depth -= 1
+				outbound_counters['sent'] += 1
+				return entry[0], entry[1]
+			self._ready.clear()
+			await self._ready.wait()
+
+	def clear(self):
+		self._entries.clear()
+		self._displayed.clear()
+		self._notification = None
+		self.depth = 0
+
+
+def outbound_queue_stats():
+	queues = list(_queues)
+	return {
+		'connections': len(queues),
+		'depth': sum(queue.depth for queue in queues),
+		'max_depth': max((queue.max_depth for queue in queues), default=0),
+		**{key: outbound_counters[key] for key in ('sent', 'coalesced', 'overflows')},
+	}
+
+
+def reset_outbound_queue_stats():
+	outbound_counters.clear()
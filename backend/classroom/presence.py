@@ -0,0 +1,151 @@
+import heapq
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+
+from classroom.db_pool import run_in_consumer_db_pool
+from classroom.redis_client import get_redis_client
+
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryPresenceIndex:
+	# Per classroom: user id -> expiry, plus a heap of expiries so pruning stays amortised O(log n).
+	blocking = False
+
+	def __init__(self):
+		self._expiries = {}
+		self._heaps = {}
+		self._lock = threading.Lock()
+
+	def _prune(self, classroom_pk, now):
+		expiries = self._expiries.get(classroom_pk)
+		heap = self._heaps.get(classroom_pk)
+		if expiries is None:
+			return
+		while heap and heap[0][0] <= now:
+			expires_at, user_id = heapq.heappop(heap)
+			if expiries.get(user_id) == expires_at:
+				del expiries[user_id]
+		if not expiries:
+			del self._expiries[classroom_pk]
+			del self._heaps[classroom_pk]
+
+	def touch(self, classroom_pk, user_id, ttl):
+		now = time.time()
+		expires_at = now + ttl
+		with self._lock:
+			self._expiries.setdefault(classroom_pk, {})[user_id] = expires_at
+			heapq.heappush(self._heaps.setdefault(classroom_pk, []), (expires_at, user_id))
+			self._prune(classroom_pk, now)
+
+	def leave(self, classroom_pk, user_id):
+		# The stale heap entry is skipped when it surfaces in _prune.
+		with self._lock:
+			self._expiries.get(classroom_pk, {}).pop(user_id, None)
+			self._prune(classroom_pk, time.time())
+
+	def count(self, classroom_pk):
+		with self._lock:
+			self._prune(classroom_pk, time.time())
+			return len(self._expiries.get(classroom_pk, ()))
+
+	def members(self, classroom_pk):
+		with self._lock:
+			self._prune(classroom_pk, time.time())
+			return dict(self._expiries.get(classroom_pk, {}))
+
+	def clear(self):
+		with self._lock:
+			self._expiries.clear()
+			self._heaps.clear()
+
+
+class RedisPresenceIndex:
+	# One sorted set per classroom: member = user id, score = expiry timestamp.
+	blocking = True
+
+	KEY = 'lessonlive:presence:{}'
+
+	def __init__(self, client):
+		self.client = client
+
+	def touch(self, classroom_pk, user_id, ttl):
+		now = time.time()
+		key = self.KEY.format(classroom_pk)
+		pipe = self.client.pipeline(transaction=False)
+		pipe.zadd(key, {user_id: now + ttl})
+		pipe.zremrangebyscore(key, '-inf', now)
+		# The whole set disappears once a classroom has been idle for a while.
+		pipe.expire(key, max(1, int(ttl * 2) + 1))
+		pipe.execute()
+
+	def leave(self, classroom_pk, user_id):
+		self.client.zrem(self.KEY.format(classroom_pk), user_id)
+
+	def count(self, classroom_pk):
+		return self.client.zcount(self.KEY.format(classroom_pk), f'({time.time()}', '+inf')
+
+	def members(self, classroom_pk):
+		entries = self.client.zrangebyscore(self.KEY.format(classroom_pk), f'({time.time()}', '+inf', withscores=True)
+		return {int(user_id): expires_at for user_id, expires_at in entries}
+
+	def clear(self):
+		for key in self.client.scan_iter(self.KEY.format('*')):
+			self.client.delete(key)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+# (classroom pk, user id) -> open connections in this process, so closing one tab
+# does not mark a student offline while another tab is still connected.
+_local_connections = Counter()
+
+
+def get_presence_index():
+	global _index
+
+	if _index is None:
+		with _index_lock:
+			if _index is None:
+				client = get_redis_client()
+				_index = RedisPresenceIndex(client) if client is not None else MemoryPresenceIndex()
+	return _index
+
+
+def active_student_count(classroom_pk):
+	return get_presence_index().count(classroom_pk)
+
+
+def active_student_ids(classroom_pk):
+	return get_presence_index().members(classroom_pk)
+
+
+async def _call(method, *args):
+	index = get_presence_index()
+	try:
+		if index.blocking:
+			return await run_in_consumer_db_pool(getattr(index, method), *args)
+		return getattr(index, method)(*args)
+	except Exception:
+		logger.warning('Presence %s failed for classroom %s', method, args[0], exc_info=True)
+
+
+async def mark_present(classroom_pk, user_id, connected=False):
+	if connected:
+		_local_connections[(classroom_pk, user_id)] += 1
+	await _call('touch', classroom_pk, user_id, settings.CLASSROOM_PRESENCE_TTL_SECONDS)
+
+
+async def mark_absent(classroom_pk, user_id):
+	key = (classroom_pk, user_id)
+	_local_connections[key] -= 1
+	if _local_connections[key] > 0:
+		return
+	del _local_connections[key]
+	await _call('leave', classroom_pk, user_id)
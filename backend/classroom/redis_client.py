@@ -0,0 +1,43 @@
+import logging
+import threading
+
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_redis_client():
+	# Shared synchronous client for caches and buffers; None when REDIS_URL is not set.
+	global _client
+
+	redis_url = getattr(settings, 'REDIS_URL', '')
+	if not redis_url:
+		return None
+
+	if _client is None:
+		with _client_lock:
+			if _client is None:
+				try:
+					import redis
+				except ImportError:
+					logger.warning('REDIS_URL is set but the redis package is not installed')
+					return None
+				_client = redis.Redis.from_url(redis_url, socket_timeout=2, socket_connect_timeout=2)
+	return _client
+
+
+def create_redis_connection():
+	# Dedicated connection for blocking consumers such as pub/sub listeners.
+	redis_url = getattr(settings, 'REDIS_URL', '')
+	if not redis_url:
+		return None
+
+	try:
+		import redis
+	except ImportError:
+		return None
+	return redis.Redis.from_url(redis_url, health_check_interval=30)
@@ -0,0 +1,113 @@
+import threading
+from collections import deque
+
+from django.conf import settings
+
+from classroom.redis_client import get_redis_client
+
+
+class MemoryEventLog:
+	# Per classroom: the last assigned sequence number and a ring of (seq, frame).
+	blocking = False
+
+	def __init__(self, size):
+		self.size = size
+		self._last_seq = {}
+		self._frames = {}
+		self._lock = threading.Lock()
+
+	def append(self, class_id, encode_frames, count):
+		with self._lock:
+			first_seq = self._last_seq.get(class_id, 0) + 1
+			frames = encode_frames(first_seq)
+			ring = self._frames.get(class_id)
+			if ring is None:
+				ring = self._frames[class_id] = deque(maxlen=self.size)
+			ring.extend(zip(range(first_seq, first_seq + count), frames))
+			self._last_seq[class_id] = first_seq + count - 1
+		return frames
+
+	def current(self, class_id):
+		return self._last_seq.get(class_id, 0)
+
+	def since(self, class_id, last_seq):
+		with self._lock:
+			current = self._last_seq.get(class_id, 0)
+			ring = self._frames.get(class_id, ())
+			oldest = ring[0][0] if ring else current + 1
+			if last_seq > current or last_seq + 1 < oldest:
+				return current, None
+			return current, [frame for seq, frame in ring if seq > last_seq]
+
+	def clear(self):
+		with self._lock:
+			self._last_seq.clear()
+			self._frames.clear()
+
+
+class RedisEventLog:
+	# A counter per classroom, plus a sorted set of encoded frames scored by sequence number.
+	blocking = True
+
+	SEQ_KEY = 'lessonlive:events:seq:{}'
+	FRAMES_KEY = 'lessonlive:events:frames:{}'
+
+	def __init__(self, client, size, ttl):
+		self.client = client
+		self.size = size
+		self.ttl = ttl
+
+	def append(self, class_id, encode_frames, count):
+		seq_key, frames_key = self.SEQ_KEY.format(class_id), self.FRAMES_KEY.format(class_id)
+		# INCRBY reserves the numbers atomically across processes; a concurrent broadcast may
+		# store and send its frames first, so clients only advance their last seq over
+		# contiguous numbers and still accept a lower one that arrives late.
+		first_seq = self.client.incrby(seq_key, count) - count + 1
+		frames = encode_frames(first_seq)
+		pipe = self.client.pipeline(transaction=False)
+		pipe.zadd(frames_key, {frame: first_seq + offset for offset, frame in enumerate(frames)})
+		pipe.zremrangebyrank(frames_key, 0, -self.size - 1)
+		pipe.expire(seq_key, self.ttl)
+		pipe.expire(frames_key, self.ttl)
+		pipe.execute()
+		return frames
+
+	def current(self, class_id):
+		return int(self.client.get(self.SEQ_KEY.format(class_id)) or 0)
+
+	def since(self, class_id, last_seq):
+		frames_key = self.FRAMES_KEY.format(class_id)
+		pipe = self.client.pipeline(transaction=False)
+		pipe.get(self.SEQ_KEY.format(class_id))
+		pipe.zrange(frames_key, 0, 0, withscores=True)
+		pipe.zrangebyscore(frames_key, f'({last_seq}', '+inf')
+		current, oldest, frames = pipe.execute()
+		current = int(current or 0)
+		oldest = int(oldest[0][1]) if oldest else current + 1
+		if last_seq > current or last_seq + 1 < oldest:
+			return current, None
+		return current, [frame.decode('utf-8') for frame in frames]
+
+	def clear(self):
+		for pattern in (self.SEQ_KEY, self.FRAMES_KEY):
+			for key in self.client.scan_iter(pattern.format('*')):
+				self.client.delete(key)
+
+
+_log = None
+_log_lock = threading.Lock()
+
+
+def get_event_log():
+	global _log
+
+	if _log is None:
+		with _log_lock:
+			if _log is None:
+				client = get_redis_client()
+				size = settings.CLASSROOM_EVENT_REPLAY_SIZE
+				if client is not None:
+					_log = RedisEventLog(client, size, settings.CLASSROOM_EVENT_REPLAY_TTL_SECONDS)
+				else:
+					_log = MemoryEventLog(size)
+	return _log
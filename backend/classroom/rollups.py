@@ -0,0 +1,116 @@
+import operator
+from functools import reduce
+
+from django.db import transaction
+from django.db.models import Case, Count, F, Max, Min, OuterRef, Q, Subquery, Sum, Value, When
+
+from classroom.models import AttendanceRollup, StudentAttendanceRecord
+
+
+ROLLUP_FIELDS = (
+	'total_duration_seconds',
+	'visit_count',
+	'open_visit_count',
+	'first_joined_at',
+	'latest_joined_at',
+	'latest_left_at',
+	'latest_topic',
+)
+
+
+def aggregate_rollups(records):
+	# One row of rollup fields per (session, student) in records; records without a session are not rolled up.
+	latest = StudentAttendanceRecord.objects.filter(
+		session_id=OuterRef('session_id'), student_id=OuterRef('student_id'),
+	).order_by('-joined_at', '-id')
+	return (
+		records.filter(session__isnull=False)
+		.values('classroom_id', 'session_id', 'student_id')
+		.annotate(
+			total_duration_seconds=Sum('duration_seconds'),
+			visit_count=Count('id'),
+			open_visit_count=Count('id', filter=Q(status=StudentAttendanceRecord.STATUS_ACTIVE)),
+			first_joined_at=Min('joined_at'),
+			latest_joined_at=Max('joined_at'),
+			latest_left_at=Subquery(latest.values('left_at')[:1]),
+			latest_topic=Subquery(latest.values('joined_topic')[:1]),
+		)
+		.order_by()
+	)
+
+
+def _upsert_rollups(rows):
+	return AttendanceRollup.objects.bulk_create(
+		[AttendanceRollup(**row) for row in rows],
+		batch_size=500,
+		update_conflicts=True,
+		unique_fields=['session', 'student'],
+		update_fields=ROLLUP_FIELDS,
+	)
+
+
+def refresh_attendance_rollups(records):
+	"""
+	Recompute the rollups of the students and sessions that records belong to.
+
+	Call it in the transaction that changed those records. Only the affected students'
+	records are read, through the (session, student, joined_at) index.
+	"""
+	changed = records.order_by()
+	scope = {
+		'session_id__in': Subquery(changed.values('session_id')),
+		'student_id__in': Subquery(changed.values('student_id')),
+	}
+	with transaction.atomic(savepoint=False):
+		# Locked before aggregating, so a concurrent refresh of the same student (another tab,
+		# the heartbeat flusher) waits for this transaction and then sees its records.
+		list(AttendanceRollup.objects.select_for_update().filter(**scope).order_by('session_id', 'student_id').values_list('id'))
+		rows = list(aggregate_rollups(StudentAttendanceRecord.objects.filter(**scope)))
+		_upsert_rollups(rows)
+	return len(rows)
+
+
+def add_to_rollups(changes, records):
+	"""
+	Move rollups on by heartbeat writes with one UPDATE, rather than re-aggregating.
+
+	changes holds (session id, student id, joined_at, seconds added, topic or None) for
+	each record in records that a heartbeat lengthened. Heartbeats neither add nor close
+	visits, so only the totals move, and a topic only becomes latest_topic when its
+	visit is the student's latest. Call it in the transaction that wrote the records.
+	"""
+	seconds, topics = {}, {}
+	for session_id, student_id, joined_at, added, topic in changes:
+		seconds[session_id, student_id] = seconds.get((session_id, student_id), 0) + added
+		if topic:
+			topics[session_id, student_id, joined_at] = topic
+	if not seconds:
+		return 0
+	fields = {
+		'total_duration_seconds': F('total_duration_seconds') + Case(
+			*[When(session_id=session_id, student_id=student_id, then=Value(added)) for (session_id, student_id), added in seconds.items()],
+			default=Value(0),
+		),
+	}
+	if topics:
+		fields['latest_topic'] = Case(
+			*[
+				When(session_id=session_id, student_id=student_id, latest_joined_at=joined_at, then=Value(topic))
+				for (session_id, student_id, joined_at), topic in topics.items()
+			],
+			default=F('latest_topic'),
+		)
+	pairs = reduce(operator.or_, (Q(session_id=session_id, student_id=student_id) for session_id, student_id in seconds))
+	updated = AttendanceRollup.objects.filter(pairs).update(**fields)
+	if updated < len(seconds):
+		# Some records have no rollup yet (written before rollups existed, say): aggregate theirs.
+		refresh_attendance_rollups(records)
+	return updated
+
+
+def rebuild_attendance_rollups(session_ids):
+	"""Replace the rollups of the given sessions with ones aggregated from scratch."""
+	with transaction.atomic():
+		AttendanceRollup.objects.filter(session_id__in=session_ids).delete()
+		# Upserted, as a student reconnecting mid-rebuild may already have put their row back.
+		return len(_upsert_rollups(aggregate_rollups(StudentAttendanceRecord.objects.filter(session_id__in=session_ids))))
@@ -0,0 +1,102 @@
+import asyncio
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from authentication.auth_cache import LRUTTLCache
+from classroom.attendance import close_attendance_records
+from classroom.db_pool import run_in_consumer_db_pool
+from classroom.events import broadcast_event
+from classroom.models import ClassroomSession, StudentAttendanceRecord
+
+
+# classroom pk -> active session id
+active_session_cache = LRUTTLCache(settings.CLASSROOM_ACCESS_CACHE_SIZE, settings.CLASSROOM_ACTIVE_SESSION_CACHE_TTL_SECONDS)
+
+# (event loop, classroom pk) -> task resolving that classroom's active session
+_inflight = {}
+
+
+def _active_session_id(classroom_pk):
+	return ClassroomSession.objects.filter(classroom_id=classroom_pk, is_active=True).values_list('id', flat=True).first()
+
+
+def load_or_create_active_session(classroom_pk):
+	session_id = _active_session_id(classroom_pk)
+	if session_id is not None:
+		return session_id
+
+	today_str = timezone.now().strftime('%B %d, %Y')
+	try:
+		with transaction.atomic():
+			return ClassroomSession.objects.create(
+				classroom_id=classroom_pk,
+				title=f'Live Session — {today_str}',
+				is_active=True,
+			).id
+	except IntegrityError:
+		# Another process won the race; unique_active_session_per_classroom guarantees its row is the only one.
+		return _active_session_id(classroom_pk)
+
+
+def get_or_create_active_session(classroom_pk):
+	session_id = active_session_cache.get(classroom_pk)
+	if session_id is not None:
+		return session_id
+
+	generation = active_session_cache.generation()
+	session_id = load_or_create_active_session(classroom_pk)
+	if session_id is not None:
+		active_session_cache.set(classroom_pk, session_id, generation=generation)
+	return session_id
+
+
+async def aget_or_create_active_session(classroom_pk):
+	# Single-flight: concurrent joiners of one classroom share a single lookup/creation.
+	session_id = active_session_cache.get(classroom_pk)
+	if session_id is not None:
+		return session_id
+
+	loop = asyncio.get_running_loop()
+	key = (loop, classroom_pk)
+	task = _inflight.get(key)
+	if task is None:
+		task = loop.create_task(run_in_consumer_db_pool(get_or_create_active_session, classroom_pk))
+		_inflight[key] = task
+		task.add_done_callback(lambda _: _inflight.pop(key, None))
+	# One cancelled joiner must not cancel the lookup for everyone else.
+	return await asyncio.shield(task)
+
+
+def invalidate_active_session(classroom_pk):
+	active_session_cache.invalidate(classroom_pk)
+
+
+def end_session(session_id, class_id, only_if_empty=False):
+	"""
+	End a session and close its open attendance records in one transaction.
+
+	Returns (session, closed record count), or None if it was already ended (or, with only_if_empty,
+	still has active attendance records). session_ended is broadcast after commit.
+	"""
+	now = timezone.now()
+	with transaction.atomic():
+		sessions = ClassroomSession.objects.filter(id=session_id, is_active=True)
+		if only_if_empty:
+			sessions = sessions.exclude(
+				attendance_records__status=StudentAttendanceRecord.STATUS_ACTIVE,
+			)
+		# Conditional, so two concurrent requests cannot both end (and report) the same session.
+		if not sessions.update(is_active=False, ended_at=now):
+			return None
+		closed = close_attendance_records(StudentAttendanceRecord.objects.filter(session_id=session_id), left_at=now)
+		session = ClassroomSession.objects.get(id=session_id)
+
+	invalidate_active_session(session.classroom_id)
+	broadcast_event(class_id, 'session_ended', {
+		'session_id': session.id,
+		'ended_at': now.isoformat(),
+		'closed_records': closed,
+	})
+	return session, closed
@@ -0,0 +1,58 @@
+from django.contrib.auth.models import User
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from authentication.auth_cache import bump_auth_epoch
+from classroom.access_cache import invalidate_classroom, invalidate_membership
+from classroom.models import Classroom, ClassroomSession, Enrollment
+from classroom.sessions import invalidate_active_session
+
+
+def _deleting_user(origin):
+	# Cascades from a user deletion must not recreate that user's epoch row.
+	if isinstance(origin, QuerySet):
+		return origin.model is User
+	return isinstance(origin, User)
+
+
+@receiver(post_save, sender=Enrollment)
+def enrollment_saved(sender, instance, created, **kwargs):
+	invalidate_membership(instance.classroom_id, instance.student_id)
+	if created:
+		bump_auth_epoch(instance.student_id)
+
+
+@receiver(post_delete, sender=Enrollment)
+def enrollment_deleted(sender, instance, origin=None, **kwargs):
+	invalidate_membership(instance.classroom_id, instance.student_id)
+	if not _deleting_user(origin):
+		bump_auth_epoch(instance.student_id)
+
+
+@receiver(post_save, sender=Classroom)
+def classroom_saved(sender, instance, created, **kwargs):
+	invalidate_classroom(instance.class_id, instance.pk)
+	if created:
+		bump_auth_epoch(instance.owner_id)
+
+
+@receiver(post_delete, sender=Classroom)
+def classroom_deleted(sender, instance, origin=None, **kwargs):
+	invalidate_classroom(instance.class_id, instance.pk)
+	if not _deleting_user(origin):
+		bump_auth_epoch(instance.owner_id)
+
+
+@receiver(post_save, sender=ClassroomSession)
+def classroom_session_saved(sender, instance, **kwargs):
+	# Only sessions saved through the model. end_session ends them with update() and clears
+	# its own process's cache; other processes may hand out the ended id until the cache TTL
+	# passes, which record_student_join catches by checking the session under lock.
+	if not instance.is_active:
+		invalidate_active_session(instance.classroom_id)
+
+
+@receiver(post_delete, sender=ClassroomSession)
+def classroom_session_deleted(sender, instance, **kwargs):
+	invalidate_active_session(instance.classroom_id)
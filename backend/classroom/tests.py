@@ -1,11 +1,48 @@
-from unittest.mock import patch
+import asyncio
+import csv
+import gzip
+import io
+import json
+import shutil
+import tempfile
+import threading
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import StringIO
+from pathlib import Path
+from unittest.mock import AsyncMock, Mock, patch
+
+import numpy as np
+from asgiref.sync import async_to_sync
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
 
 from django.contrib.auth.models import User
-from django.test import TestCase, override_settings
+from django.core.management import call_command
+from django.db import IntegrityError
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone
 
-from authentication.jwt_auth import issue_tokens_for_user
+from authentication.auth_cache import epoch_cache, user_cache
+from authentication.jwt_auth import get_access_claims, issue_tokens_for_user
 from authentication.models import UserProfile
-from classroom.models import Classroom, Enrollment
+from classroom.access_cache import clear_access_cache, membership_cache
+from classroom.attendance import close_attendance_records, close_stale_attendance
+from classroom.bitmaps import attendance_percent, gaps, mark_minutes, minutes_mask, overlap_minutes, popcount, presence_per_minute, session_presence
+from classroom.channel_layers import ProcessLocalGroupChannelLayer
+from classroom.connect_pipeline import connect_stage_stats
+from classroom.consumers import record_student_join, record_student_leave
+from classroom.db_pool import DatabaseWorkerPool
+from classroom.export_jobs import claim_next_export, expire_exports
+from classroom.events import abroadcast_event, abroadcast_events, encode_event, encode_event_binary
+from classroom.heartbeats import MemoryHeartbeatBuffer, PendingHeartbeat, flush_heartbeats, write_heartbeats
+from classroom.models import AttendanceRollup, Classroom, ClassroomNote, ClassroomSession, DisplayedClassroomNote, Enrollment, ExportJob, StudentAttendanceRecord
+from classroom.outbound import OutboundQueue, OutboundQueueFull
+from classroom.presence import MemoryPresenceIndex
+from classroom.replay import MemoryEventLog
+from classroom.rollups import ROLLUP_FIELDS, refresh_attendance_rollups
+from classroom.routing import websocket_urlpatterns
+from classroom.sessions import active_session_cache, aget_or_create_active_session
+from examination.models import ExamAttempt
 
 
 class ClassroomNotesIsolationTests(TestCase):
@@ -116,3 +153,1134 @@ class LivekitTokenConfigurationTests(TestCase):
 			)
 
 		self.assertEqual(response.status_code, 503)
+
+
+class AccessTokenClaimsTests(TestCase):
+	def setUp(self):
+		user_cache.clear()
+		epoch_cache.clear()
+		self.teacher = User.objects.create_user(username='teacher3', email='teacher3@example.com', password='pass12345')
+		UserProfile.objects.create(user=self.teacher, role=UserProfile.ROLE_TEACHER)
+		self.student = User.objects.create_user(username='student3', email='student3@example.com', password='pass12345')
+		UserProfile.objects.create(user=self.student, role=UserProfile.ROLE_STUDENT)
+
+		self.classroom = Classroom.objects.create(owner=self.teacher, name='Claims Classroom')
+		self.enrollment = Enrollment.objects.create(classroom=self.classroom, student=self.student)
+		self.student_access_token = issue_tokens_for_user(self.student, include_claims=True)['access']
+
+	def _get_notes(self):
+		return self.client.get(
+			f'/api/classrooms/{self.classroom.class_id}/notes/',
+			HTTP_AUTHORIZATION=f'Bearer {self.student_access_token}',
+		)
+
+	def test_notes_are_authorized_from_claims_without_auth_queries(self):
+		self._get_notes()
+
+		# Only the notes query itself should reach the database.
+		with self.assertNumQueries(1):
+			response = self._get_notes()
+		self.assertEqual(response.status_code, 200)
+
+	def test_unenrolling_revokes_membership_claims(self):
+		self.assertEqual(self._get_notes().status_code, 200)
+
+		self.enrollment.delete()
+
+		self.assertEqual(self._get_notes().status_code, 403)
+
+	def test_email_change_invalidates_claims(self):
+		request = RequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {self.student_access_token}')
+		self.assertEqual(get_access_claims(request)['email'], 'student3@example.com')
+
+		self.student.email = 'renamed3@example.com'
+		self.student.save()
+
+		request = RequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {self.student_access_token}')
+		self.assertIsNone(get_access_claims(request))
+
+
+class ClassroomAccessCacheTests(TestCase):
+	def setUp(self):
+		user_cache.clear()
+		clear_access_cache()
+		self.teacher = User.objects.create_user(username='teacher4', email='teacher4@example.com', password='pass12345')
+		UserProfile.objects.create(user=self.teacher, role=UserProfile.ROLE_TEACHER)
+		self.student = User.objects.create_user(username='student4', email='student4@example.com', password='pass12345')
+		UserProfile.objects.create(user=self.student, role=UserProfile.ROLE_STUDENT)
+
+		self.classroom = Classroom.objects.create(owner=self.teacher, name='Cached Classroom')
+		self.enrollment = Enrollment.objects.create(classroom=self.classroom, student=self.student)
+		self.student_access_token = issue_tokens_for_user(self.student)['access']
+
+	def _get_displayed_notes(self):
+		return self.client.get(
+			f'/api/classrooms/{self.classroom.class_id}/displayed-notes/',
+			HTTP_AUTHORIZATION=f'Bearer {self.student_access_token}',
+		)
+
+	def test_membership_checks_are_served_from_cache(self):
+		self._get_displayed_notes()
+		hits_before = membership_cache.hits
+
+		with self.assertNumQueries(1):
+			response = self._get_displayed_notes()
+
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(membership_cache.hits, hits_before + 1)
+
+	def test_enrollment_signals_invalidate_cached_membership(self):
+		self.assertEqual(self._get_displayed_notes().status_code, 200)
+
+		self.enrollment.delete()
+		self.assertEqual(self._get_displayed_notes().status_code, 403)
+
+		Enrollment.objects.create(classroom=self.classroom, student=self.student)
+		self.assertEqual(self._get_displayed_notes().status_code, 200)
+
+
+class ConsumerDatabasePoolTests(TestCase):
+	def setUp(self):
+		self.pool = DatabaseWorkerPool(2, name='test-db-pool')
+		self.addCleanup(self.pool.shutdown)
+
+	def test_calls_run_concurrently_and_are_measured(self):
+		# Both calls must be inside the barrier at once, which a single shared thread cannot do.
+		barrier = threading.Barrier(2, timeout=5)
+
+		async def run_pair():
+			return await asyncio.gather(
+				self.pool.run(barrier.wait),
+				self.pool.run(barrier.wait),
+			)
+
+		self.assertEqual(sorted(async_to_sync(run_pair)()), [0, 1])
+
+		stats = self.pool.stats()
+		self.assertEqual(stats['completed'], 2)
+		self.assertEqual(stats['queue_depth'], 0)
+		self.assertEqual(stats['running'], 0)
+		self.assertEqual(stats['wait']['count'], 2)
+
+
+class HeartbeatBufferTests(TestCase):
+	def setUp(self):
+		teacher = User.objects.create_user(username='teacher5', email='teacher5@example.com', password='pass12345')
+		student = User.objects.create_user(username='student5', email='student5@example.com', password='pass12345')
+		classroom = Classroom.objects.create(owner=teacher, name='Heartbeat Classroom')
+		session = ClassroomSession.objects.create(classroom=classroom)
+		self.joined_at = timezone.now() - timedelta(minutes=10)
+		self.record = StudentAttendanceRecord.objects.create(
+			classroom=classroom, session=session, student=student, joined_at=self.joined_at,
+		)
+		refresh_attendance_rollups(StudentAttendanceRecord.objects.filter(id=self.record.id))
+
+		self.buffer = MemoryHeartbeatBuffer()
+		buffer_patch = patch('classroom.heartbeats._buffer', self.buffer)
+		buffer_patch.start()
+		self.addCleanup(buffer_patch.stop)
+
+	def test_heartbeats_are_coalesced_into_one_write(self):
+		for seconds, topic in ((60, None), (120, 'Fractions'), (180, None)):
+			self.buffer.record(self.record.id, self.joined_at, self.joined_at + timedelta(seconds=seconds), topic)
+
+		# Records read under lock, one record write, then one rollup update.
+		with self.assertNumQueries(3):
+			self.assertEqual(flush_heartbeats(force=True), 1)
+
+		self.record.refresh_from_db()
+		self.assertEqual(self.record.duration_seconds, 180)
+		self.assertEqual(self.record.joined_topic, 'Fractions')
+		self.assertEqual(self.record.last_seen_at, self.joined_at + timedelta(seconds=180))
+		self.assertEqual(len(self.buffer), 0)
+		rollup = AttendanceRollup.objects.get(student_id=self.record.student_id)
+		self.assertEqual((rollup.total_duration_seconds, rollup.latest_topic), (180, 'Fractions'))
+
+		self.buffer.record(self.record.id, self.joined_at, self.joined_at + timedelta(seconds=240))
+		flush_heartbeats(force=True)
+		rollup.refresh_from_db()
+		self.assertEqual((rollup.total_duration_seconds, rollup.latest_topic), (240, 'Fractions'))
+
+	def test_records_without_a_rollup_get_one_aggregated(self):
+		AttendanceRollup.objects.all().delete()
+		self.buffer.record(self.record.id, self.joined_at, self.joined_at + timedelta(seconds=90))
+		flush_heartbeats(force=True)
+
+		rollup = AttendanceRollup.objects.get(student_id=self.record.student_id)
+		self.assertEqual((rollup.total_duration_seconds, rollup.visit_count, rollup.open_visit_count), (90, 1, 1))
+
+	@override_settings(HEARTBEAT_FLUSH_INTERVAL_SECONDS=5, HEARTBEAT_MAX_STALENESS_SECONDS=60)
+	def test_fresh_heartbeats_wait_and_left_records_are_not_rewound(self):
+		self.buffer.record(self.record.id, self.joined_at, self.joined_at + timedelta(seconds=30), 'Decimals')
+		self.assertEqual(flush_heartbeats(), 0)
+
+		StudentAttendanceRecord.objects.filter(id=self.record.id).update(
+			status=StudentAttendanceRecord.STATUS_LEFT, duration_seconds=600,
+		)
+		flush_heartbeats(force=True)
+
+		self.record.refresh_from_db()
+		self.assertEqual(self.record.duration_seconds, 600)
+		self.assertIsNone(self.buffer.pop(self.record.id))
+
+
+@override_settings(ATTENDANCE_RECONNECT_GRACE_SECONDS=120)
+class AttendanceReconnectTests(TestCase):
+	def setUp(self):
+		teacher = User.objects.create_user(username='teacher9', email='teacher9@example.com', password='pass12345')
+		self.student = User.objects.create_user(username='student9', email='student9@example.com', password='pass12345')
+		self.classroom = Classroom.objects.create(owner=teacher, name='Reconnect Classroom')
+		self.session = ClassroomSession.objects.create(classroom=self.classroom)
+		pool_patch = patch('classroom.db_pool.consumer_db_pool', DatabaseWorkerPool(0))
+		pool_patch.start()
+		self.addCleanup(pool_patch.stop)
+
+	def _left_record(self, left_seconds_ago, duration_seconds):
+		left_at = timezone.now() - timedelta(seconds=left_seconds_ago)
+		return StudentAttendanceRecord.objects.create(
+			classroom=self.classroom, session=self.session, student=self.student,
+			joined_at=left_at - timedelta(seconds=duration_seconds), left_at=left_at,
+			duration_seconds=duration_seconds, status=StudentAttendanceRecord.STATUS_LEFT,
+		)
+
+	def _join(self):
+		return async_to_sync(record_student_join)(self.classroom.pk, self.session.id, self.student.id)
+
+	def test_reconnect_within_grace_window_continues_the_record(self):
+		previous = self._left_record(left_seconds_ago=30, duration_seconds=600)
+
+		record_id, counted_from, _ = self._join()
+		async_to_sync(record_student_leave)(record_id, counted_from)
+
+		self.assertEqual(record_id, previous.id)
+		self.assertEqual(StudentAttendanceRecord.objects.count(), 1)
+		previous.refresh_from_db()
+		self.assertEqual(previous.status, StudentAttendanceRecord.STATUS_LEFT)
+		self.assertEqual(previous.duration_seconds, 600)
+
+	def test_reconnect_after_grace_window_starts_a_new_record(self):
+		previous = self._left_record(left_seconds_ago=600, duration_seconds=600)
+
+		record_id, _, _ = self._join()
+
+		self.assertNotEqual(record_id, previous.id)
+		self.assertEqual(StudentAttendanceRecord.objects.count(), 2)
+
+	def test_join_with_an_ended_session_moves_to_the_active_one(self):
+		# Another process ended the session; this one still has its id cached.
+		ClassroomSession.objects.filter(id=self.session.id).update(is_active=False, ended_at=timezone.now())
+
+		record_id, _, session_id = self._join()
+
+		self.assertNotEqual(session_id, self.session.id)
+		self.assertTrue(ClassroomSession.objects.get(id=session_id).is_active)
+		self.assertEqual(StudentAttendanceRecord.objects.get(id=record_id).session_id, session_id)
+		self.assertFalse(StudentAttendanceRecord.objects.filter(session=self.session).exists())
+
+	def test_compact_attendance_merges_fragmented_records(self):
+		first = self._left_record(left_seconds_ago=1000, duration_seconds=100)
+		second = self._left_record(left_seconds_ago=900, duration_seconds=60)
+		later = self._left_record(left_seconds_ago=100, duration_seconds=50)
+
+		call_command('compact_attendance', grace_seconds=120, stdout=StringIO())
+
+		self.assertEqual(
+			list(StudentAttendanceRecord.objects.order_by('joined_at').values_list('id', 'duration_seconds')),
+			[(first.id, 160), (later.id, 50)],
+		)
+		first.refresh_from_db()
+		self.assertEqual(first.left_at, second.left_at)
+
+
+class PresenceBitmapTests(TestCase):
+	def setUp(self):
+		teacher = User.objects.create_user(username='teacher17', email='teacher17@example.com', password='pass12345')
+		self.students = [
+			User.objects.create_user(username=f'student17{index}', email=f'student17{index}@example.com', password='pass12345')
+			for index in range(2)
+		]
+		self.classroom = Classroom.objects.create(owner=teacher, name='Bitmap Classroom')
+		self.session = ClassroomSession.objects.create(classroom=self.classroom)
+		self.started = timezone.now() - timedelta(hours=1)
+		ClassroomSession.objects.filter(id=self.session.id).update(started_at=self.started)
+
+	def _at(self, minutes, seconds=0):
+		return self.started + timedelta(minutes=minutes, seconds=seconds)
+
+	def _record(self, student, joined_minute):
+		return StudentAttendanceRecord.objects.create(
+			classroom=self.classroom, session=self.session, student=student, joined_at=self._at(joined_minute),
+		)
+
+	def _heartbeat(self, record, seen_at):
+		write_heartbeats([(record.id, PendingHeartbeat(0, record.joined_at, seen_at, None))])
+
+	def test_heartbeats_and_leaves_mark_minutes_and_keep_reconnect_gaps(self):
+		record = self._record(self.students[0], 0)
+		self._heartbeat(record, self._at(3, 30))
+		close_attendance_records(StudentAttendanceRecord.objects.filter(id=record.id), left_at=self._at(5, 10))
+		# Reopened by a reconnect at minute 12, as reopen_recent_record does.
+		StudentAttendanceRecord.objects.filter(id=record.id).update(
+			status=StudentAttendanceRecord.STATUS_ACTIVE, left_at=None, last_seen_at=self._at(12),
+		)
+		self._heartbeat(record, self._at(14, 5))
+
+		record.refresh_from_db()
+		self.assertEqual(gaps(record.presence), [(6, 11)])
+		self.assertEqual(popcount(np.frombuffer(bytes(record.presence), dtype=np.uint8)), 9)
+
+	def test_session_helpers_combine_students_in_bulk(self):
+		first = self._record(self.students[0], 0)
+		second_tab = self._record(self.students[0], 2)
+		other = self._record(self.students[1], 4)
+		self._heartbeat(first, self._at(5))
+		self._heartbeat(second_tab, self._at(7))
+		self._heartbeat(other, self._at(9))
+
+		student_ids, matrix = session_presence(self.session, minutes=10)
+		self.assertEqual(student_ids.tolist(), [student.id for student in self.students])
+		self.assertEqual(presence_per_minute(matrix, 10).tolist(), [1, 1, 1, 1, 2, 2, 2, 2, 1, 1])
+		self.assertEqual(attendance_percent(matrix, 10).tolist(), [80.0, 60.0])
+		self.assertEqual(overlap_minutes(matrix, minutes_mask(6, 9, 10)).tolist(), [2, 4])
+
+	def test_compaction_merges_bitmaps(self):
+		# Minutes 0-3, then 6-8.
+		for joined, left, presence in ((0, 3, b'\xf0'), (6, 8, b'\x03\x80')):
+			StudentAttendanceRecord.objects.create(
+				classroom=self.classroom, session=self.session, student=self.students[0], joined_at=self._at(joined),
+				left_at=self._at(left), status=StudentAttendanceRecord.STATUS_LEFT, presence=presence,
+			)
+
+		call_command('compact_attendance', grace_seconds=3600, stdout=StringIO())
+
+		record = StudentAttendanceRecord.objects.get()
+		self.assertEqual(gaps(record.presence), [(4, 5)])
+
+
+@override_settings(ATTENDANCE_RECONNECT_GRACE_SECONDS=0)
+class AttendanceRollupTests(TestCase):
+	def setUp(self):
+		teacher = User.objects.create_user(username='teacher12', email='teacher12@example.com', password='pass12345')
+		self.student = User.objects.create_user(username='student12', email='student12@example.com', password='pass12345')
+		self.classroom = Classroom.objects.create(owner=teacher, name='Rollup Classroom')
+		self.session = ClassroomSession.objects.create(classroom=self.classroom)
+		pool_patch = patch('classroom.db_pool.consumer_db_pool', DatabaseWorkerPool(0))
+		pool_patch.start()
+		self.addCleanup(pool_patch.stop)
+
+	def _rollup(self):
+		return AttendanceRollup.objects.values(*ROLLUP_FIELDS).get(session=self.session, student=self.student)
+
+	def test_join_and_leave_keep_the_rollup_current(self):
+		join = async_to_sync(record_student_join)
+		first_id, first_from, _ = join(self.classroom.pk, self.session.id, self.student.id)
+		second_id, second_from, _ = join(self.classroom.pk, self.session.id, self.student.id, joined_topic='Fractions')
+		self.assertEqual((self._rollup()['visit_count'], self._rollup()['open_visit_count']), (2, 2))
+
+		async_to_sync(record_student_leave)(first_id, first_from - timedelta(seconds=300))
+		async_to_sync(record_student_leave)(second_id, second_from, topic='Decimals')
+
+		rollup = self._rollup()
+		second = StudentAttendanceRecord.objects.get(id=second_id)
+		self.assertEqual(rollup['open_visit_count'], 0)
+		self.assertGreaterEqual(rollup['total_duration_seconds'], 300)
+		self.assertEqual((rollup['latest_left_at'], rollup['latest_topic']), (second.left_at, 'Decimals'))
+
+		AttendanceRollup.objects.update(total_duration_seconds=0, visit_count=0)
+		call_command('rebuild_attendance_rollups', stdout=StringIO())
+		self.assertEqual(self._rollup(), rollup)
+
+
+@override_settings(ATTENDANCE_STALE_AFTER_SECONDS=120)
+class StaleAttendanceTests(TestCase):
+	def setUp(self):
+		teacher = User.objects.create_user(username='teacher10', email='teacher10@example.com', password='pass12345')
+		self.student = User.objects.create_user(username='student10', email='student10@example.com', password='pass12345')
+		self.classroom = Classroom.objects.create(owner=teacher, name='Sweep Classroom')
+		self.session = ClassroomSession.objects.create(classroom=self.classroom)
+		self.now = timezone.now().replace(microsecond=0)
+
+	def _active_record(self, joined_ago, last_seen_ago=None, duration_seconds=0):
+		return StudentAttendanceRecord.objects.create(
+			classroom=self.classroom, session=self.session, student=self.student,
+			joined_at=self.now - timedelta(seconds=joined_ago),
+			last_seen_at=self.now - timedelta(seconds=last_seen_ago) if last_seen_ago is not None else None,
+			duration_seconds=duration_seconds,
+		)
+
+	def test_sweeper_closes_silent_records_at_their_last_heartbeat(self):
+		stale = self._active_record(joined_ago=900, last_seen_ago=600, duration_seconds=300)
+		never_heard = self._active_record(joined_ago=600)
+		fresh = self._active_record(joined_ago=900, last_seen_ago=10, duration_seconds=890)
+
+		# Lock and close the stale records, then lock, aggregate and upsert their rollup.
+		with self.assertNumQueries(5):
+			self.assertEqual(close_stale_attendance(now=self.now), 2)
+
+		for record in (stale, never_heard, fresh):
+			record.refresh_from_db()
+		self.assertEqual((stale.status, stale.left_at, stale.duration_seconds), ('left', self.now - timedelta(seconds=600), 300))
+		self.assertEqual((never_heard.left_at, never_heard.duration_seconds), (never_heard.joined_at, 0))
+		self.assertEqual(fresh.status, StudentAttendanceRecord.STATUS_ACTIVE)
+		rollup = AttendanceRollup.objects.get(session=self.session, student=self.student)
+		self.assertEqual((rollup.visit_count, rollup.open_visit_count, rollup.total_duration_seconds), (3, 1, 1190))
+
+	def test_closing_at_a_time_extends_durations_in_the_database(self):
+		record = self._active_record(joined_ago=900, last_seen_ago=60, duration_seconds=840)
+
+		close_attendance_records(StudentAttendanceRecord.objects.all(), left_at=self.now)
+
+		record.refresh_from_db()
+		self.assertEqual((record.status, record.left_at, record.duration_seconds), ('left', self.now, 900))
+
+
+class AttendanceExportTests(TestCase):
+	def setUp(self):
+		self.teacher = User.objects.create_user(username='teacher13', email='teacher13@example.com', password='pass12345')
+		UserProfile.objects.create(user=self.teacher, role=UserProfile.ROLE_TEACHER)
+		self.student = User.objects.create_user(username='student13', email='student13@example.com', password='pass12345')
+		self.classroom = Classroom.objects.create(owner=self.teacher, name='Export Classroom')
+		self.session = ClassroomSession.objects.create(classroom=self.classroom, title='Fractions Live')
+		self.joined = datetime(2026, 3, 2, 9, 30, tzinfo=dt_timezone.utc)
+		for day in range(5):
+			joined_at = self.joined + timedelta(days=day)
+			StudentAttendanceRecord.objects.create(
+				classroom=self.classroom, session=self.session if day % 2 else None, student=self.student,
+				joined_at=joined_at, left_at=joined_at + timedelta(seconds=370), duration_seconds=370,
+				status=StudentAttendanceRecord.STATUS_LEFT, joined_topic='Halves',
+			)
+		StudentAttendanceRecord.objects.create(
+			classroom=self.classroom, session=self.session, student=self.student, joined_at=self.joined + timedelta(days=9),
+		)
+		self.headers = {'HTTP_AUTHORIZATION': f'Bearer {issue_tokens_for_user(self.teacher)["access"]}'}
+
+	def _export(self, query='', **extra):
+		return self.client.get(f'/api/classrooms/{self.classroom.class_id}/attendance/export/{query}', **self.headers, **extra)
+
+	def _rows(self, body):
+		return list(csv.reader(io.StringIO(body.decode('utf-8'))))
+
+	@override_settings(EXPORT_CHUNK_SIZE=2)
+	def test_export_streams_every_record_newest_first(self):
+		response = self._export()
+
+		self.assertTrue(response.streaming)
+		rows = self._rows(b''.join(response.streaming_content))
+		self.assertEqual(rows[0][0], 'Student Username')
+		self.assertEqual(len(rows), 7)
+		self.assertEqual(rows[1], ['student13', 'student13@example.com', 'Fractions Live', 'Live Classroom', '2026-03-11 09:30:00', 'Active', '0.0', 'Active'])
+		self.assertEqual(rows[2], ['student13', 'student13@example.com', 'General Session', 'Halves', '2026-03-06 09:30:00', '2026-03-06 09:36:10', '6.2', 'Left'])
+		self.assertEqual([row[4][:10] for row in rows[3:]], ['2026-03-05', '2026-03-04', '2026-03-03', '2026-03-02'])
+
+	def test_export_filters_and_gzip(self):
+		response = self._export(f'?session_id={self.session.id}&from=2026-03-03&to=2026-03-04', HTTP_ACCEPT_ENCODING='gzip, deflate')
+
+		self.assertEqual(response['Content-Encoding'], 'gzip')
+		rows = self._rows(gzip.decompress(b''.join(response.streaming_content)))
+		self.assertEqual([row[4] for row in rows[1:]], ['2026-03-03 09:30:00'])
+		self.assertEqual(self._export('?from=March').status_code, 400)
+
+	def test_export_streams_asynchronously_under_asgi(self):
+		async def run():
+			response = await self.async_client.get(
+				f'/api/classrooms/{self.classroom.class_id}/attendance/export/', headers={'Authorization': self.headers['HTTP_AUTHORIZATION']},
+			)
+			return response, [chunk async for chunk in response.streaming_content]
+
+		response, chunks = async_to_sync(run)()
+		self.assertTrue(response.is_async)
+		self.assertEqual(len(self._rows(b''.join(chunks))), 7)
+
+
+class ExportJobTests(TestCase):
+	def setUp(self):
+		self.artifact_dir = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, self.artifact_dir, ignore_errors=True)
+		settings_override = override_settings(EXPORT_ARTIFACT_DIR=self.artifact_dir)
+		settings_override.enable()
+		self.addCleanup(settings_override.disable)
+
+		self.teacher = User.objects.create_user(username='teacher14', email='teacher14@example.com', password='pass12345')
+		UserProfile.objects.create(user=self.teacher, role=UserProfile.ROLE_TEACHER)
+		self.student = User.objects.create_user(username='student14', email='student14@example.com', password='pass12345')
+		self.classroom = Classroom.objects.create(owner=self.teacher, name='Jobs Classroom')
+		joined = timezone.now() - timedelta(hours=1)
+		StudentAttendanceRecord.objects.bulk_create(
+			StudentAttendanceRecord(
+				classroom=self.classroom, student=self.student, joined_at=joined + timedelta(seconds=index),
+				left_at=joined + timedelta(seconds=index + 60), duration_seconds=60, status=StudentAttendanceRecord.STATUS_LEFT,
+			)
+			for index in range(300)
+		)
+		self.url = f'/api/classrooms/{self.classroom.class_id}/exports/'
+		self.headers = {'HTTP_AUTHORIZATION': f'Bearer {issue_tokens_for_user(self.teacher)["access"]}'}
+
+	def _enqueue(self, **data):
+		return self.client.post(self.url, data=json.dumps(data), content_type='application/json', **self.headers)
+
+	def _run_worker(self):
+		with patch('classroom.export_jobs.notify_teacher') as notify:
+			call_command('run_export_jobs', '--once', stdout=StringIO())
+		return notify
+
+	def test_job_runs_and_downloads_with_ranges(self):
+		response = self._enqueue(kind='attendance')
+		self.assertEqual(response.status_code, 202)
+		job = response.json()['job']
+		self.assertEqual((job['status'], job['download_url']), ('pending', None))
+
+		notify = self._run_worker()
+		job = self.client.get(f'{self.url}{job["id"]}/', **self.headers).json()['job']
+		self.assertEqual(job['status'], 'done')
+		notify.assert_called_once()
+		self.assertEqual(notify.call_args.args[:2], (self.classroom.class_id, 'export_ready'))
+
+		full = self.client.get(job['download_url'], **self.headers)
+		self.assertEqual(full.status_code, 200)
+		self.assertEqual(full['Accept-Ranges'], 'bytes')
+		self.assertIn(f'attendance_{self.classroom.class_id}.csv.gz', full['Content-Disposition'])
+		body = b''.join(full.streaming_content)
+		self.assertEqual(len(body), job['size'])
+		self.assertEqual(len(list(csv.reader(io.StringIO(gzip.decompress(body).decode('utf-8'))))), 301)
+
+		part = self.client.get(job['download_url'], HTTP_RANGE='bytes=10-99', **self.headers)
+		self.assertEqual(part.status_code, 206)
+		self.assertEqual(part['Content-Range'], f'bytes 10-99/{len(body)}')
+		self.assertEqual(b''.join(part.streaming_content), body[10:100])
+		tail = self.client.get(job['download_url'], HTTP_RANGE='bytes=-20', **self.headers)
+		self.assertEqual(b''.join(tail.streaming_content), body[-20:])
+		stale = self.client.get(job['download_url'], HTTP_RANGE='bytes=10-99', HTTP_IF_RANGE='"other"', **self.headers)
+		self.assertEqual(stale.status_code, 200)
+		self.assertEqual(self.client.get(job['download_url'], HTTP_RANGE=f'bytes={len(body)}-', **self.headers).status_code, 416)
+
+	def test_exam_results_export(self):
+		ExamAttempt.objects.create(classroom=self.classroom, student=self.student, total_questions=3, answered_count=3, correct_count=2)
+		job_id = self._enqueue(kind='exam_results').json()['job']['id']
+		self._run_worker()
+
+		job = ExportJob.objects.get(id=job_id)
+		with open(f'{self.artifact_dir}/{job.artifact_name}', 'rb') as artifact:
+			rows = list(csv.reader(io.StringIO(gzip.decompress(artifact.read()).decode('utf-8'))))
+		self.assertEqual(rows[0][-1], 'Score (%)')
+		self.assertEqual(rows[1][:2] + rows[1][3:], ['student14', 'student14@example.com', '3', '3', '2', '66.67'])
+
+	def test_invalid_requests_are_rejected(self):
+		self.assertEqual(self._enqueue(kind='grades').status_code, 400)
+		self.assertEqual(self._enqueue(kind='attendance', **{'from': 'March'}).status_code, 400)
+		self.assertEqual(self._enqueue(kind='exam_results', session_id=1).status_code, 400)
+		self.assertFalse(ExportJob.objects.exists())
+
+		job_id = self._enqueue(kind='attendance').json()['job']['id']
+		self.assertEqual(self.client.get(f'{self.url}{job_id}/download/', **self.headers).status_code, 409)
+
+	@override_settings(EXPORT_JOB_STALE_SECONDS=60, EXPORT_JOB_MAX_ATTEMPTS=2)
+	def test_stale_running_jobs_are_retried_then_failed(self):
+		job = ExportJob.objects.create(classroom=self.classroom, requested_by=self.teacher, kind=ExportJob.KIND_ATTENDANCE)
+		now = timezone.now()
+		self.assertEqual(claim_next_export(now).id, job.id)
+		self.assertIsNone(claim_next_export(now + timedelta(seconds=30)))
+		self.assertEqual(claim_next_export(now + timedelta(seconds=90)).attempts, 2)
+
+		self.assertIsNone(claim_next_export(now + timedelta(seconds=180)))
+		job.refresh_from_db()
+		self.assertEqual(job.status, ExportJob.STATUS_FAILED)
+
+	@override_settings(EXPORT_ARTIFACT_TTL_SECONDS=60)
+	def test_expired_artifacts_are_deleted(self):
+		job_id = self._enqueue(kind='attendance').json()['job']['id']
+		self._run_worker()
+		job = ExportJob.objects.get(id=job_id)
+
+		self.assertEqual(expire_exports(job.finished_at + timedelta(seconds=30)), 0)
+		self.assertEqual(expire_exports(job.finished_at + timedelta(seconds=90)), 1)
+		self.assertEqual(ExportJob.objects.get(id=job_id).status, ExportJob.STATUS_EXPIRED)
+		self.assertEqual(list(Path(self.artifact_dir).iterdir()), [])
+		self.assertEqual(self.client.get(f'{self.url}{job_id}/download/', **self.headers).status_code, 410)
+
+
+class SessionTimelineTests(TestCase):
+	def setUp(self):
+		self.teacher = User.objects.create_user(username='teacher15', email='teacher15@example.com', password='pass12345')
+		UserProfile.objects.create(user=self.teacher, role=UserProfile.ROLE_TEACHER)
+		self.classroom = Classroom.objects.create(owner=self.teacher, name='Timeline Classroom')
+		self.started = datetime(2026, 3, 2, 9, 0, tzinfo=dt_timezone.utc)
+		self.session = ClassroomSession.objects.create(classroom=self.classroom, title='Timeline', is_active=False)
+		ClassroomSession.objects.filter(id=self.session.id).update(started_at=self.started, ended_at=self.started + timedelta(seconds=600))
+		amy, ben, cal = (
+			User.objects.create_user(username=name, email=f'{name}@example.com', password='pass12345') for name in ('amy', 'ben', 'cal')
+		)
+		# amy has two tabs open at first and comes back near the end; cal never disconnects.
+		for student, joined, left in ((amy, 0, 120), (amy, 60, 180), (ben, 120, 300), (cal, 300, None), (amy, 500, 700)):
+			StudentAttendanceRecord.objects.create(
+				classroom=self.classroom, session=self.session, student=student, joined_at=self.started + timedelta(seconds=joined),
+				left_at=self.started + timedelta(seconds=left) if left is not None else None,
+				status=StudentAttendanceRecord.STATUS_LEFT if left is not None else StudentAttendanceRecord.STATUS_ACTIVE,
+			)
+		self.headers = {'HTTP_AUTHORIZATION': f'Bearer {issue_tokens_for_user(self.teacher)["access"]}'}
+
+	def _timeline(self, query=''):
+		return self.client.get(f'/api/classrooms/{self.classroom.class_id}/sessions/{self.session.id}/timeline/{query}', **self.headers)
+
+	def test_counts_students_present_per_bucket(self):
+		with self.assertNumQueries(4):
+			response = self._timeline()
+		self.assertEqual(response.status_code, 200)
+		timeline = response.json()
+		self.assertEqual(timeline['students'], [1, 1, 2, 1, 1, 1, 1, 1, 2, 2])
+		self.assertEqual(timeline['total_students'], 3)
+		self.assertEqual(timeline['peak'], {'students': 2, 'offset_seconds': 120, 'at': '2026-03-02T09:02:00+00:00'})
+		self.assertEqual(self._timeline('?bucket_seconds=300').json()['students'], [2, 2])
+
+	def test_reopened_record_does_not_count_the_minutes_away(self):
+		dan = User.objects.create_user(username='dan', email='dan@example.com', password='pass12345')
+		# Reconnected into the same record: present for minutes 0-2 and 7-8, away in between.
+		StudentAttendanceRecord.objects.create(
+			classroom=self.classroom, session=self.session, student=dan, joined_at=self.started,
+			left_at=self.started + timedelta(seconds=540), status=StudentAttendanceRecord.STATUS_LEFT,
+			presence=mark_minutes(mark_minutes(b'', 0, 2), 7, 8),
+		)
+
+		timeline = self._timeline().json()
+		self.assertEqual(timeline['students'], [2, 2, 3, 1, 1, 1, 1, 2, 3, 2])
+		self.assertEqual(timeline['total_students'], 4)
+		self.assertEqual(timeline['peak']['offset_seconds'], 120)
+
+	def test_rejects_bad_buckets_and_other_sessions(self):
+		self.assertEqual(self._timeline('?bucket_seconds=0').status_code, 400)
+		with override_settings(SESSION_TIMELINE_MAX_BUCKETS=5):
+			self.assertEqual(self._timeline('?bucket_seconds=60').status_code, 400)
+		other = Classroom.objects.create(owner=self.teacher, name='Other Classroom')
+		response = self.client.get(f'/api/classrooms/{other.class_id}/sessions/{self.session.id}/timeline/', **self.headers)
+		self.assertEqual(response.status_code, 404)
+
+
+class AttendanceMatrixTests(TestCase):
+	def setUp(self):
+		self.teacher = User.objects.create_user(username='teacher16', email='teacher16@example.com', password='pass12345')
+		UserProfile.objects.create(user=self.teacher, role=UserProfile.ROLE_TEACHER)
+		self.classroom = Classroom.objects.create(owner=self.teacher, name='Matrix Classroom')
+		self.sessions = [
+			ClassroomSession.objects.create(classroom=self.classroom, title=f'Week {week}', is_active=False) for week in range(3)
+		]
+		students = {
+			name: User.objects.create_user(username=name, email=f'{name}@example.com', password='pass12345')
+			for name in ('amy', 'ben', 'cal', 'dan', 'eve')
+		}
+		for name in ('amy', 'ben', 'cal', 'dan'):
+			Enrollment.objects.create(classroom=self.classroom, student=students[name])
+		# eve has history but has left the class.
+		visits = (('amy', 0, 600), ('amy', 1, 600), ('ben', 0, 540), ('ben', 1, 660), ('cal', 2, 900), ('eve', 2, 60))
+		for name, week, seconds in visits:
+			StudentAttendanceRecord.objects.create(
+				classroom=self.classroom, session=self.sessions[week], student=students[name], duration_seconds=seconds,
+				left_at=timezone.now(), status=StudentAttendanceRecord.STATUS_LEFT,
+			)
+		refresh_attendance_rollups(StudentAttendanceRecord.objects.all())
+		self.headers = {'HTTP_AUTHORIZATION': f'Bearer {issue_tokens_for_user(self.teacher)["access"]}'}
+
+	def _matrix(self, query=''):
+		return self.client.get(f'/api/classrooms/{self.classroom.class_id}/attendance/matrix/{query}', **self.headers)
+
+	def test_matrix_is_flat_minutes_with_labels(self):
+		matrix = self._matrix().json()
+
+		self.assertEqual(matrix['shape'], [4, 3])
+		self.assertEqual(matrix['students']['usernames'], ['amy', 'ben', 'cal', 'dan'])
+		self.assertEqual(matrix['sessions']['ids'], [session.id for session in self.sessions])
+		self.assertEqual(matrix['minutes'], [10.0, 10.0, 0.0, 9.0, 11.0, 0.0, 0.0, 0.0, 15.0, 0.0, 0.0, 0.0])
+
+	def test_matrix_orders(self):
+		self.assertEqual(self._matrix('?order=most_engaged').json()['students']['usernames'], ['amy', 'ben', 'cal', 'dan'])
+		self.assertEqual(self._matrix('?order=least_engaged').json()['students']['usernames'], ['dan', 'cal', 'amy', 'ben'])
+		# amy and ben came to the same two sessions, so they are kept together.
+		self.assertEqual(self._matrix('?order=cluster').json()['students']['usernames'][:2], ['amy', 'ben'])
+		self.assertEqual(self._matrix('?order=random').status_code, 400)
+
+
+class EndSessionTests(TestCase):
+	def setUp(self):
+		self.teacher = User.objects.create_user(username='teacher11', email='teacher11@example.com', password='pass12345')
+		UserProfile.objects.create(user=self.teacher, role=UserProfile.ROLE_TEACHER)
+		self.classroom = Classroom.objects.create(owner=self.teacher, name='Ending Classroom')
+		self.session = ClassroomSession.objects.create(classroom=self.classroom, is_active=True)
+		self.channel_layer = Mock(group_send=AsyncMock())
+		for target, value in (
+			('classroom.events.get_channel_layer', Mock(return_value=self.channel_layer)),
+			('classroom.replay._log', MemoryEventLog(50)),
+		):
+			patcher = patch(target, value)
+			patcher.start()
+			self.addCleanup(patcher.stop)
+
+	def _end(self, user):
+		return self.client.post(
+			f'/api/classrooms/{self.classroom.class_id}/session/end/',
+			HTTP_AUTHORIZATION=f'Bearer {issue_tokens_for_user(user)["access"]}',
+		)
+
+	def test_teacher_ends_session_and_open_records_are_closed(self):
+		students = [
+			User.objects.create_user(username=f'ending{index}', email=f'ending{index}@example.com', password='pass12345')
+			for index in range(3)
+		]
+		now = timezone.now()
+		for student in students:
+			StudentAttendanceRecord.objects.create(
+				classroom=self.classroom, session=self.session, student=student,
+				joined_at=now - timedelta(minutes=10), last_seen_at=now - timedelta(minutes=1), duration_seconds=540,
+			)
+
+		response = self._end(self.teacher)
+
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(response.json()['closed_records'], 3)
+		self.session.refresh_from_db()
+		self.assertFalse(self.session.is_active)
+		self.assertIsNotNone(self.session.ended_at)
+		for record in StudentAttendanceRecord.objects.all():
+			self.assertEqual(record.status, StudentAttendanceRecord.STATUS_LEFT)
+			self.assertEqual(record.left_at, self.session.ended_at)
+			self.assertIn(record.duration_seconds, (599, 600, 601))
+		group, message = self.channel_layer.group_send.await_args.args
+		self.assertEqual(json.loads(message['text'])['type'], 'session_ended')
+
+		self.assertEqual(self._end(self.teacher).status_code, 404)
+
+	def test_only_the_owner_can_end_the_session(self):
+		other = User.objects.create_user(username='teacher12', email='teacher12@example.com', password='pass12345')
+		UserProfile.objects.create(user=other, role=UserProfile.ROLE_TEACHER)
+
+		self.assertEqual(self._end(other).status_code, 404)
+		self.session.refresh_from_db()
+		self.assertTrue(self.session.is_active)
+
+class ActiveSessionResolutionTests(TestCase):
+	def setUp(self):
+		active_session_cache.clear()
+		teacher = User.objects.create_user(username='teacher6', email='teacher6@example.com', password='pass12345')
+		self.classroom = Classroom.objects.create(owner=teacher, name='Session Classroom')
+		# Run pool calls on this thread so they share the test transaction.
+		pool_patch = patch('classroom.db_pool.consumer_db_pool', DatabaseWorkerPool(0))
+		pool_patch.start()
+		self.addCleanup(pool_patch.stop)
+
+	def test_concurrent_joiners_share_one_session_creation(self):
+		async def join_burst():
+			return await asyncio.gather(*(aget_or_create_active_session(self.classroom.pk) for _ in range(50)))
+
+		# One lookup, then savepoint + insert + release for the creation.
+		with self.assertNumQueries(4):
+			session_ids = async_to_sync(join_burst)()
+
+		self.assertEqual(len(set(session_ids)), 1)
+		self.assertEqual(ClassroomSession.objects.filter(classroom=self.classroom, is_active=True).count(), 1)
+
+		with self.assertNumQueries(0):
+			self.assertEqual(async_to_sync(aget_or_create_active_session)(self.classroom.pk), session_ids[0])
+
+	def test_ending_a_session_resolves_a_new_one(self):
+		first_id = async_to_sync(aget_or_create_active_session)(self.classroom.pk)
+		session = ClassroomSession.objects.get(id=first_id)
+		session.is_active = False
+		session.save()
+
+		second_id = async_to_sync(aget_or_create_active_session)(self.classroom.pk)
+		self.assertNotEqual(first_id, second_id)
+
+	def test_database_allows_one_active_session_per_classroom(self):
+		ClassroomSession.objects.create(classroom=self.classroom, is_active=True)
+		ClassroomSession.objects.create(classroom=self.classroom, is_active=False)
+		with self.assertRaises(IntegrityError):
+			ClassroomSession.objects.create(classroom=self.classroom, is_active=True)
+
+
+class ClassroomConnectPipelineTests(TestCase):
+	def setUp(self):
+		user_cache.clear()
+		clear_access_cache()
+		active_session_cache.clear()
+		self.teacher = User.objects.create_user(username='teacher7', email='teacher7@example.com', password='pass12345')
+		self.student = User.objects.create_user(username='student7', email='student7@example.com', password='pass12345')
+		self.outsider = User.objects.create_user(username='outsider7', email='outsider7@example.com', password='pass12345')
+		self.classroom = Classroom.objects.create(owner=self.teacher, name='Connect Classroom')
+		Enrollment.objects.create(classroom=self.classroom, student=self.student)
+		self.session = ClassroomSession.objects.create(classroom=self.classroom, is_active=True)
+
+		for target, value in (
+			('classroom.db_pool.consumer_db_pool', DatabaseWorkerPool(0)),
+			('classroom.consumers.start_heartbeat_flusher', lambda: None),
+			('classroom.presence._index', MemoryPresenceIndex()),
+			('classroom.replay._log', MemoryEventLog(50)),
+		):
+			patcher = patch(target, value)
+			patcher.start()
+			self.addCleanup(patcher.stop)
+
+	def _connect(self, user, while_connected=None, subprotocols=None, query=''):
+		token = issue_tokens_for_user(user)['access']
+
+		async def run():
+			communicator = WebsocketCommunicator(
+				URLRouter(websocket_urlpatterns),
+				f'/ws/classrooms/{self.classroom.class_id}/notes/?token={token}{query}',
+				subprotocols=subprotocols,
+			)
+			connected, code = await communicator.connect()
+			if connected:
+				if while_connected is not None:
+					await while_connected(communicator)
+				await communicator.disconnect()
+			return connected, code
+
+		return async_to_sync(run)()
+
+	def test_student_connect_resolves_context_in_one_query(self):
+		resolves_before = connect_stage_stats['resolve'].snapshot()['count']
+
+		# Connect: context, session check, reconnect lookup, attendance insert. Disconnect: presence bitmap
+		# read, one leave update. Join and leave each refresh the student's rollup: lock, aggregate, upsert.
+		with self.assertNumQueries(12):
+			connected, _ = self._connect(self.student)
+
+		self.assertTrue(connected)
+		record = StudentAttendanceRecord.objects.get(student=self.student)
+		self.assertEqual(record.session_id, self.session.id)
+		self.assertEqual(record.status, StudentAttendanceRecord.STATUS_LEFT)
+		self.assertEqual(connect_stage_stats['resolve'].snapshot()['count'], resolves_before + 1)
+
+	def test_non_member_is_rejected(self):
+		connected, code = self._connect(self.outsider)
+
+		self.assertFalse(connected)
+		self.assertEqual(code, 4003)
+		self.assertFalse(StudentAttendanceRecord.objects.filter(student=self.outsider).exists())
+
+	def test_broadcasts_are_forwarded_as_pre_encoded_frames(self):
+		payload = {'id': 7, 'title': 'Fractions', 'content': 'Halves and quarters'}
+		received = []
+
+		async def listen(communicator):
+			await abroadcast_event(self.classroom.class_id, 'note_displayed', payload)
+			received.append(await communicator.receive_from())
+
+		self._connect(self.student, while_connected=listen)
+		self.assertEqual(received, [encode_event('note_displayed', payload, seq=1)])
+
+	def test_batched_events_arrive_as_individual_frames(self):
+		events = [('note_removed', {'id': 1}), ('note_removed', {'id': 2})]
+		received = []
+
+		async def listen(communicator):
+			await abroadcast_events(self.classroom.class_id, events)
+			received.append(await communicator.receive_from())
+			received.append(await communicator.receive_from())
+
+		self._connect(self.student, while_connected=listen)
+		self.assertEqual(received, [encode_event(*event, seq=seq) for seq, event in enumerate(events, 1)])
+
+	def test_msgpack_subprotocol_receives_binary_frames(self):
+		payload = {'id': 7, 'title': 'ግዕዝ', 'content': 'Halves and quarters'}
+		received = []
+
+		async def listen(communicator):
+			await abroadcast_event(self.classroom.class_id, 'note_displayed', payload)
+			received.append(await communicator.receive_from())
+
+		connected, subprotocol = self._connect(self.student, while_connected=listen, subprotocols=['msgpack'])
+		self.assertTrue(connected)
+		self.assertEqual(subprotocol, 'msgpack')
+		self.assertEqual(received, [encode_event_binary('note_displayed', payload, seq=1)])
+
+	def test_resume_replays_missed_events_or_requests_resync(self):
+		received = []
+
+		async def resume(communicator, last_seq):
+			await communicator.send_json_to({'type': 'resume', 'last_seq': last_seq})
+			while True:
+				frame = await communicator.receive_json_from()
+				received.append(frame)
+				if frame['type'] in ('replay_complete', 'resync_required'):
+					return
+
+		async def listen(communicator):
+			await abroadcast_events(self.classroom.class_id, [('note_removed', {'id': pk}) for pk in range(1, 61)])
+			for _ in range(60):
+				await communicator.receive_from()
+			await resume(communicator, 58)
+			await resume(communicator, 3)
+
+		self._connect(self.student, while_connected=listen)
+		self.assertEqual(received, [
+			{'type': 'note_removed', 'payload': {'id': 59}, 'seq': 59},
+			{'type': 'note_removed', 'payload': {'id': 60}, 'seq': 60},
+			{'type': 'replay_complete', 'payload': {'seq': 60}},
+			{'type': 'resync_required', 'payload': {'seq': 60}},
+		])
+
+	def test_replay_on_connect_precedes_live_events(self):
+		async_to_sync(abroadcast_events)(self.classroom.class_id, [('note_removed', {'id': pk}) for pk in range(1, 4)])
+		received = []
+
+		async def listen(communicator):
+			# Broadcast straight after connecting, before the client could have sent anything.
+			await abroadcast_event(self.classroom.class_id, 'note_removed', {'id': 4})
+			for _ in range(4):
+				received.append(await communicator.receive_json_from())
+
+		self._connect(self.student, while_connected=listen, query='&last_seq=1')
+		self.assertEqual(received, [
+			{'type': 'note_removed', 'payload': {'id': 2}, 'seq': 2},
+			{'type': 'note_removed', 'payload': {'id': 3}, 'seq': 3},
+			{'type': 'replay_complete', 'payload': {'seq': 3}},
+			{'type': 'note_removed', 'payload': {'id': 4}, 'seq': 4},
+		])
+
+	def test_blank_last_seq_reports_the_current_seq(self):
+		async_to_sync(abroadcast_events)(self.classroom.class_id, [('note_removed', {'id': pk}) for pk in range(1, 3)])
+		received = []
+
+		async def listen(communicator):
+			received.append(await communicator.receive_json_from())
+
+		self._connect(self.student, while_connected=listen, query='&last_seq=')
+		self.assertEqual(received, [{'type': 'replay_complete', 'payload': {'seq': 2}}])
+
+	@override_settings(CLASSROOM_OUTBOUND_QUEUE_SIZE=2)
+	def test_client_that_falls_behind_is_closed_for_resync(self):
+		outputs = []
+
+		async def stalled_writer(consumer, queue):
+			await asyncio.Event().wait()
+
+		async def listen(communicator):
+			await abroadcast_events(self.classroom.class_id, [('note_removed', {'id': pk}) for pk in range(1, 4)])
+			outputs.append(await communicator.receive_output())
+
+		with patch('classroom.consumers.ClassroomNoteConsumer._write_outbound', stalled_writer):
+			self._connect(self.student, while_connected=listen)
+		self.assertEqual(outputs, [{'type': 'websocket.close', 'code': 4009}])
+
+	@override_settings(CLASSROOM_AUTO_END_SESSION=True)
+	def test_session_ends_when_the_last_student_leaves(self):
+		with patch('classroom.events.get_channel_layer', return_value=Mock(group_send=AsyncMock())):
+			self._connect(self.student)
+
+		self.session.refresh_from_db()
+		self.assertFalse(self.session.is_active)
+
+
+class OutboundQueueTests(TestCase):
+	def _drain(self, queue):
+		async def drain():
+			return [(await queue.get())[0] for _ in range(queue.depth)]
+
+		return async_to_sync(drain)()
+
+	def test_display_then_remove_of_the_same_note_cancels_out(self):
+		queue = OutboundQueue(maxsize=10)
+		queue.put('show 1', event_type='note_displayed', target=1)
+		queue.put('show 2', event_type='note_displayed', target=2)
+		queue.put('hide 1', event_type='note_removed', target=1)
+		queue.put('hide 3', event_type='note_removed', target=3)
+
+		self.assertEqual(self._drain(queue), ['show 2', 'hide 3'])
+		self.assertEqual(queue.coalesced, 2)
+
+	def test_only_the_latest_notification_is_kept(self):
+		queue = OutboundQueue(maxsize=10)
+		for minutes in (5, 4, 3):
+			queue.put(f'{minutes} minutes', event_type='notification_sent', target=minutes)
+		self.assertEqual(self._drain(queue), ['3 minutes'])
+
+	def test_superseded_sequenced_frames_leave_skips_so_last_seq_advances(self):
+		queue = OutboundQueue(maxsize=10)
+		queue.put(encode_event('note_displayed', {'id': 1}, seq=1), event_type='note_displayed', target=1, seq=1)
+		queue.put(encode_event('notification_sent', {'id': 5}, seq=2), event_type='notification_sent', target=5, seq=2)
+		queue.put(encode_event('note_removed', {'id': 1}, seq=3), event_type='note_removed', target=1, seq=3)
+		queue.put(encode_event('notification_sent', {'id': 6}, seq=4), event_type='notification_sent', target=6, seq=4)
+		queue.put(encode_event('note_displayed', {'id': 2}, seq=5), event_type='note_displayed', target=2, seq=5)
+
+		frames = [json.loads(text) for text in self._drain(queue)]
+		self.assertEqual([frame['type'] for frame in frames], ['skip', 'skip', 'notification_sent', 'note_displayed'])
+		# As the client does: last_seq moves over contiguous seqs, whether applied or skipped.
+		last_seq, applied = 0, set()
+		for frame in frames:
+			applied.update(frame['payload']['seqs'] if frame['type'] == 'skip' else [frame['seq']])
+			while last_seq + 1 in applied:
+				last_seq += 1
+		self.assertEqual(last_seq, 5)
+
+	def test_overflow_raises_once_full(self):
+		queue = OutboundQueue(maxsize=2)
+		queue.put('a')
+		queue.put('b')
+		with self.assertRaises(OutboundQueueFull):
+			queue.put('c')
+		self.assertEqual(queue.max_depth, 2)
+
+
+class BatchBroadcastTests(TestCase):
+	def test_deleting_a_note_broadcasts_all_removals_in_one_message(self):
+		teacher = User.objects.create_user(username='teacher8', email='teacher8@example.com', password='pass12345')
+		UserProfile.objects.create(user=teacher, role=UserProfile.ROLE_TEACHER)
+		classroom = Classroom.objects.create(owner=teacher, name='Batch Classroom')
+		note = ClassroomNote.objects.create(classroom=classroom, title='Note', content='Shown three times')
+		displayed_ids = [
+			DisplayedClassroomNote.objects.create(classroom=classroom, note=note, displayed_by=teacher).id
+			for _ in range(3)
+		]
+
+		channel_layer = Mock(group_send=AsyncMock())
+		with patch('classroom.events.get_channel_layer', return_value=channel_layer), patch('classroom.replay._log', MemoryEventLog(50)):
+			response = self.client.delete(
+				f'/api/classrooms/{classroom.class_id}/notes/{note.id}/',
+				HTTP_AUTHORIZATION=f'Bearer {issue_tokens_for_user(teacher)["access"]}',
+			)
+
+		self.assertEqual(response.status_code, 200)
+		channel_layer.group_send.assert_awaited_once()
+		group, message = channel_layer.group_send.await_args.args
+		self.assertEqual(group, f'classroom_{classroom.class_id}_notes')
+		self.assertEqual(message['type'], 'note.batch')
+		self.assertEqual(
+			message['frames'],
+			[encode_event('note_removed', {'id': pk}, seq=seq) for seq, pk in enumerate(displayed_ids, 1)],
+		)
+
+
+class ProcessLocalGroupChannelLayerTests(TestCase):
+	def test_group_send_delivers_one_shared_message_to_local_members(self):
+		layer = ProcessLocalGroupChannelLayer()
+
+		async def run():
+			members = [await layer.new_channel() for _ in range(3)]
+			for channel in members:
+				await layer.group_add('classroom_x_notes', channel)
+			await layer.group_discard('classroom_x_notes', members[2])
+
+			message = {'type': 'note.frame', 'text': '{}'}
+			await layer.group_send('classroom_x_notes', message)
+			received = [await layer.receive(channel) for channel in members[:2]]
+			return message, received, members[2] in layer.channels
+
+		message, received, discarded_has_queue = async_to_sync(run)()
+		self.assertTrue(all(item is message for item in received))
+		self.assertFalse(discarded_has_queue)
+		self.assertEqual(layer.publishes, 0)
+
+	def test_sync_and_second_loop_sends_leave_the_listening_connection_alone(self):
+		clients = []
+
+		async def no_message(timeout):
+			await asyncio.sleep(0.01)
+
+		def from_url(url):
+			pubsub = Mock(subscribe=AsyncMock(), unsubscribe=AsyncMock(), aclose=AsyncMock(), get_message=no_message)
+			clients.append(Mock(publish=AsyncMock(), aclose=AsyncMock(), pubsub=Mock(return_value=pubsub)))
+			return clients[-1]
+
+		layer = ProcessLocalGroupChannelLayer(hosts=['redis://localhost:6379/0'])
+		sync_client = Mock()
+		main_loop = asyncio.new_event_loop()
+		self.addCleanup(main_loop.close)
+		message = {'type': 'note.frame', 'text': '{}'}
+		with patch('redis.asyncio.Redis.from_url', side_effect=from_url), patch('redis.Redis.from_url', return_value=sync_client) as sync_from_url:
+			async def join():
+				await layer.group_add('classroom_x_notes', await layer.new_channel())
+				return layer._connections[main_loop]
+
+			listening = main_loop.run_until_complete(join())
+			# As end_session_if_empty and the export worker do from their threads.
+			layer.group_send_sync('classroom_x_notes', message)
+			layer.group_send_sync('classroom_x_notes', message)
+			async_to_sync(layer.group_send)('classroom_x_notes', message)
+
+		sync_from_url.assert_called_once()
+		self.assertEqual(sync_client.publish.call_count, 2)
+		main, other = clients
+		other.publish.assert_awaited_once()
+		other.pubsub.assert_not_called()
+		self.assertFalse(listening.listener.done())
+		main.aclose.assert_not_awaited()
+		main.pubsub.return_value.aclose.assert_not_awaited()
+
+		main_loop.run_until_complete(layer.close())
+		main.pubsub.return_value.aclose.assert_awaited_once()
+		main.aclose.assert_awaited_once()
+		sync_client.close.assert_called_once()
+
+
+class ClassroomPresenceTests(TestCase):
+	def setUp(self):
+		self.teacher = User.objects.create_user(username='teacher9', email='teacher9@example.com', password='pass12345')
+		UserProfile.objects.create(user=self.teacher, role=UserProfile.ROLE_TEACHER)
+		self.student = User.objects.create_user(username='student9', email='student9@example.com', password='pass12345')
+		self.classroom = Classroom.objects.create(owner=self.teacher, name='Presence Classroom')
+		Enrollment.objects.create(classroom=self.classroom, student=self.student)
+		self.teacher_token = issue_tokens_for_user(self.teacher)['access']
+
+		self.index = MemoryPresenceIndex()
+		patcher = patch('classroom.presence._index', self.index)
+		patcher.start()
+		self.addCleanup(patcher.stop)
+
+	def _get(self, path):
+		return self.client.get(
+			f'/api/classrooms/{self.classroom.class_id}/{path}',
+			HTTP_AUTHORIZATION=f'Bearer {self.teacher_token}',
+		)
+
+	def test_presence_endpoint_lists_online_students(self):
+		self.index.touch(self.classroom.id, self.student.id, ttl=45)
+
+		response = self._get('presence/')
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(response.json()['active_now'], 1)
+		self.assertEqual([item['student_id'] for item in response.json()['students']], [self.student.id])
+
+		self.index.leave(self.classroom.id, self.student.id)
+		self.assertEqual(self._get('presence/?count_only=1').json(), {'active_now': 0})
+
+	def test_expired_presence_is_not_online(self):
+		self.index.touch(self.classroom.id, self.student.id, ttl=-1)
+		self.assertEqual(self.index.count(self.classroom.id), 0)
+
+	def test_insights_ignore_active_rows_without_presence(self):
+		session = ClassroomSession.objects.create(classroom=self.classroom, is_active=True)
+		StudentAttendanceRecord.objects.create(classroom=self.classroom, session=session, student=self.student)
+		refresh_attendance_rollups(StudentAttendanceRecord.objects.all())
+
+		self.assertEqual(self._get('attendance/').json()['summary']['active_now'], 0)
+
+		self.index.touch(self.classroom.id, self.student.id, ttl=45)
+		summary = self._get('attendance/').json()['summary']
+		self.assertEqual(summary['active_now'], 1)
+
+	def test_insights_paginate_in_ranked_order(self):
+		session = ClassroomSession.objects.create(classroom=self.classroom, is_active=True)
+		others = [
+			User.objects.create_user(username=f'ranked{index}', email=f'ranked{index}@example.com', password='pass12345')
+			for index in range(3)
+		]
+		for student in others:
+			Enrollment.objects.create(classroom=self.classroom, student=student)
+		StudentAttendanceRecord.objects.create(classroom=self.classroom, session=session, student=self.student)
+		for student, seconds in zip(others[:2], (600, 1200)):
+			StudentAttendanceRecord.objects.create(
+				classroom=self.classroom, session=session, student=student, duration_seconds=seconds,
+				left_at=timezone.now(), status=StudentAttendanceRecord.STATUS_LEFT,
+			)
+		refresh_attendance_rollups(StudentAttendanceRecord.objects.all())
+		self.index.touch(self.classroom.id, self.student.id, ttl=45)
+
+		full = self._get('attendance/').json()
+		expected = [self.student.id, others[1].id, others[0].id, others[2].id]
+		self.assertEqual([row['student_id'] for row in full['students']], expected)
+		self.assertEqual(full['students'][1]['total_duration_minutes'], 20.0)
+		self.assertEqual(full['students'][1]['engagement'], 'High')
+
+		second = self._get('attendance/?page=2&page_size=3').json()
+		self.assertEqual([row['student_id'] for row in second['students']], expected[3:])
+		self.assertEqual(second['pagination'], {'page': 2, 'page_size': 3, 'total': 4})
+		self.assertEqual(second['summary'], full['summary'])
+		self.assertEqual(self._get('attendance/?page_size=0').status_code, 400)
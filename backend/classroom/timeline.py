@@ -0,0 +1,145 @@
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db.models import DateTimeField, F, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from classroom.attendance import SecondsBetween
+from classroom.bitmaps import gaps, has_gaps
+from classroom.models import StudentAttendanceRecord
+
+
+def _session_intervals(session, end):
+	# (student, seconds from session start to join, to leave) per record, as an int64 array,
+	# and the records' presence bitmaps. The offsets are computed by the database, so no
+	# datetimes are built in Python.
+	start = Value(session.started_at, output_field=DateTimeField())
+	rows = list(
+		StudentAttendanceRecord.objects
+		.filter(session=session)
+		.order_by()
+		.values_list(
+			'student_id',
+			SecondsBetween(F('joined_at'), start),
+			SecondsBetween(Coalesce(F('left_at'), Value(end, output_field=DateTimeField())), start),
+			'presence',
+		)
+	)
+	return np.array([row[:3] for row in rows], dtype=np.int64).reshape(-1, 3), [row[3] for row in rows]
+
+
+def cut_absences(students, starts, ends, bitmaps):
+	"""
+	Intervals with the minutes their record's presence bitmap shows absent cut out, as
+	(students, starts, ends) of the pieces: a reconnect reopens the earlier record, so its
+	span also covers the time in between. Only minutes between two present ones count as
+	absent, since a bitmap lags behind the record's last heartbeat.
+	"""
+	# Few records have gaps; only theirs are unpacked, each to its own length.
+	found = [(index, gap) for index, bitmap in enumerate(bitmaps) if has_gaps(bitmap) for gap in gaps(bitmap)]
+	gap_records = np.array([index for index, _ in found], dtype=np.int64)
+	gap_starts = np.array([first for _, (first, _) in found], dtype=np.int64) * 60
+	gap_ends = np.array([last + 1 for _, (_, last) in found], dtype=np.int64) * 60
+	# A record with k absences splits into k + 1 pieces: its start and the absences' ends
+	# open them, the absences' starts and its end close them. Sorted within each record the
+	# two sides pair up, and absences reaching past either end leave only empty pieces.
+	records = np.concatenate((np.arange(len(starts)), gap_records))
+	piece_starts = np.concatenate((starts, gap_ends))
+	piece_ends = np.concatenate((ends, gap_starts))
+	by_start = np.lexsort((piece_starts, records))
+	piece_ends = piece_ends[np.lexsort((piece_ends, records))]
+	records, piece_starts = records[by_start], piece_starts[by_start]
+	kept = piece_ends > piece_starts
+	return students[records[kept]], piece_starts[kept], piece_ends[kept]
+
+
+def merge_student_intervals(students, starts, ends):
+	"""
+	Each student's overlapping or touching intervals merged into one, so a student with
+	two tabs open counts once. Returns (starts, ends) of the merged intervals.
+	"""
+	order = np.lexsort((starts, students))
+	students, starts, ends = students[order], starts[order], ends[order]
+	new_student = np.empty(len(students), dtype=bool)
+	new_student[:1] = True
+	new_student[1:] = students[1:] != students[:-1]
+	# A running maximum of ends that restarts per student: each student's ends are lifted
+	# above every earlier student's before accumulating, and lowered back afterwards.
+	lift = np.cumsum(new_student) * (int(ends.max(initial=0)) + 1)
+	reach = np.maximum.accumulate(ends + lift) - lift
+	block_start = new_student.copy()
+	block_start[1:] |= starts[1:] > reach[:-1]
+	first = np.flatnonzero(block_start)
+	return starts[first], np.maximum.reduceat(ends, first) if len(first) else ends[:0]
+
+
+def concurrency_series(starts, ends, span, bucket_seconds):
+	"""
+	(series, peak, peak_offset) for intervals in seconds within [0, span).
+
+	series[i] is the most intervals open at once during [i * bucket_seconds, (i + 1) *
+	bucket_seconds); peak is the most at any moment and peak_offset the first time it
+	was reached (None without intervals).
+	"""
+	bucket_count = -(-span // bucket_seconds)
+	times = np.concatenate((starts, ends))
+	deltas = np.concatenate((np.ones(len(starts), dtype=np.int64), np.full(len(ends), -1, dtype=np.int64)))
+	# Leaves sort before joins at the same second, so back-to-back visits never count twice.
+	order = np.lexsort((deltas, times))
+	times = times[order]
+	levels = np.cumsum(deltas[order])
+	# One level per distinct second, the one after all of its events: the dips between a
+	# leave and a join at the same second never happened.
+	settled = np.empty(len(times), dtype=bool)
+	settled[:-1] = times[1:] != times[:-1]
+	settled[-1:] = True
+	times, levels = times[settled], levels[settled]
+
+	bucket_starts = np.arange(bucket_count, dtype=np.int64) * bucket_seconds
+	# The level each bucket opens with: after the last event at or before its start.
+	series = np.concatenate(([0], levels))[np.searchsorted(times, bucket_starts, side='right')]
+	inside = times < span
+	np.maximum.at(series, times[inside] // bucket_seconds, levels[inside])
+
+	if not len(levels):
+		return series, 0, None
+	peak_index = int(np.argmax(levels))
+	return series, int(levels[peak_index]), int(times[peak_index])
+
+
+def session_timeline(session, bucket_seconds=60, now=None):
+	"""
+	Students in the room over a session, per bucket_seconds.
+
+	Open records count until the session ended, or until now while it runs, less the
+	minutes their presence bitmaps show the student was away. Raises ValueError when
+	that would take more than SESSION_TIMELINE_MAX_BUCKETS buckets.
+	"""
+	end = session.ended_at or now or timezone.now()
+	span = max(0, int((end - session.started_at).total_seconds()))
+	if -(-span // bucket_seconds) > settings.SESSION_TIMELINE_MAX_BUCKETS:
+		raise ValueError('bucket_seconds is too small for a session this long')
+
+	intervals, bitmaps = _session_intervals(session, end)
+	starts = np.clip(intervals[:, 1], 0, span)
+	ends = np.clip(intervals[:, 2], 0, span)
+	visited = ends > starts
+	students = intervals[:, 0][visited]
+	bitmaps = [bitmaps[index] for index in np.flatnonzero(visited)]
+	starts, ends = merge_student_intervals(*cut_absences(students, starts[visited], ends[visited], bitmaps))
+	series, peak, peak_offset = concurrency_series(starts, ends, span, bucket_seconds)
+
+	return {
+		'started_at': session.started_at.isoformat(),
+		'ended_at': end.isoformat(),
+		'bucket_seconds': bucket_seconds,
+		'students': series.tolist(),
+		'total_students': int(len(np.unique(students))),
+		'peak': {
+			'students': peak,
+			'offset_seconds': peak_offset,
+			'at': (session.started_at + timedelta(seconds=peak_offset)).isoformat() if peak_offset is not None else None,
+		},
+	}
@@ -18,6 +18,13 @@ urlpatterns = [
     path('<str:class_id>/notifications/', views.send_notification, name='send-notification'),
     path('<str:class_id>/notifications/list/', views.list_notifications, name='list-notifications'),
     path('<str:class_id>/attendance/', views.classroom_attendance_insights, name='classroom-attendance-insights'),
+    path('<str:class_id>/attendance/matrix/', views.classroom_attendance_matrix, name='classroom-attendance-matrix'),
+    path('<str:class_id>/session/end/', views.end_classroom_session, name='end-classroom-session'),
+    path('<str:class_id>/sessions/<int:session_id>/timeline/', views.classroom_session_timeline, name='session-timeline'),
+    path('<str:class_id>/presence/', views.classroom_presence, name='classroom-presence'),
     path('<str:class_id>/attendance/export/', views.export_attendance_csv, name='export-attendance-csv'),
+    path('<str:class_id>/exports/', views.export_jobs, name='export-jobs'),
+    path('<str:class_id>/exports/<int:job_id>/', views.export_job_detail, name='export-job-detail'),
+    path('<str:class_id>/exports/<int:job_id>/download/', views.download_export, name='download-export'),
 ]
 
@@ -3,7 +3,7 @@ import io
 import json
 import os
 import logging
-from datetime import timedelta
+from datetime import datetime, timedelta, timezone as dt_timezone
 from urllib.parse import quote
 
 from django.conf import settings
@@ -11,17 +11,36 @@ from django.contrib.auth.models import User
 from django.core.mail import send_mail
 from django.core.validators import validate_email
 from django.core.exceptions import ValidationError
+from django.core.handlers.asgi import ASGIRequest
 from django.db import transaction
 from django.db.models import F
-from django.http import HttpResponse, JsonResponse
+from django.http import FileResponse, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.middleware.gzip import re_accepts_gzip
+from django.utils.cache import patch_vary_headers
 from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
-from asgiref.sync import async_to_sync
-from channels.layers import get_channel_layer
+from asgiref.sync import sync_to_async
 
-from authentication.jwt_auth import get_user_from_request
+from authentication.auth_cache import get_user_role
+from authentication.jwt_auth import aget_user_from_request, get_user_from_request
 from authentication.models import UserProfile
-from classroom.models import Classroom, ClassroomInvitation, ClassroomNote, ClassroomNotification, DisplayedClassroomNote, Enrollment, ClassroomSession, StudentAttendanceRecord
+from classroom.access_cache import aresolve_class_access, resolve_class_access
+from classroom.claims import aget_class_member_from_claims
+from classroom.events import broadcast_event, broadcast_events
+from classroom.export_jobs import artifact_filename, artifact_path, enqueue_export, serialize_export_job
+from classroom.exports import (
+	aiter_chunks,
+	attendance_export_queryset,
+	gzip_chunks,
+	iter_attendance_csv,
+	parse_export_filters,
+)
+from classroom.insights import attendance_insights
+from classroom.matrix import ORDER_NAME, ORDERS, attendance_matrix
+from classroom.models import Classroom, ClassroomInvitation, ClassroomNote, ClassroomNotification, DisplayedClassroomNote, Enrollment, ClassroomSession, ExportJob
+from classroom.presence import active_student_count, active_student_ids
+from classroom.sessions import end_session
+from classroom.timeline import session_timeline
 
 
 logger = logging.getLogger(__name__)
@@ -38,7 +57,7 @@ def _require_teacher(request):
 	if user is None:
 		return None, JsonResponse({'detail': 'Authentication required'}, status=401)
 
-	role = getattr(getattr(user, 'profile', None), 'role', None)
+	role = get_user_role(user)
 	if role != UserProfile.ROLE_TEACHER:
 		return None, JsonResponse({'detail': 'Teacher role required'}, status=403)
 
@@ -91,17 +110,39 @@ def _require_class_member(request, class_id):
 	if user is None:
 		return None, None, False, JsonResponse({'detail': 'Authentication required'}, status=401)
 
-	try:
-		classroom = Classroom.objects.get(class_id=class_id)
-	except Classroom.DoesNotExist:
+	access = resolve_class_access(class_id, user.id)
+	if access is None:
 		return None, None, False, JsonResponse({'detail': 'Classroom not found'}, status=404)
 
-	is_owner = classroom.owner_id == user.id
-	is_enrolled = Enrollment.objects.filter(classroom=classroom, student=user).exists()
-	if not is_owner and not is_enrolled:
+	classroom_pk, owner_id, allowed = access
+	if not allowed:
 		return None, None, False, JsonResponse({'detail': 'Not allowed'}, status=403)
 
-	return user, classroom, is_owner, None
+	classroom = Classroom.from_reference(classroom_pk, class_id, owner_id=owner_id)
+	return user, classroom, owner_id == user.id, None
+
+
+async def _arequire_class_member(request, class_id, allow_claims=False):
+	if allow_claims:
+		member = await aget_class_member_from_claims(request, class_id)
+		if member is not None:
+			user, classroom, is_owner = member
+			return user, classroom, is_owner, None
+
+	user = await aget_user_from_request(request)
+	if user is None:
+		return None, None, False, JsonResponse({'detail': 'Authentication required'}, status=401)
+
+	access = await aresolve_class_access(class_id, user.id)
+	if access is None:
+		return None, None, False, JsonResponse({'detail': 'Classroom not found'}, status=404)
+
+	classroom_pk, owner_id, allowed = access
+	if not allowed:
+		return None, None, False, JsonResponse({'detail': 'Not allowed'}, status=403)
+
+	classroom = Classroom.from_reference(classroom_pk, class_id, owner_id=owner_id)
+	return user, classroom, owner_id == user.id, None
 
 
 def _serialize_saved_note(note):
@@ -127,38 +168,12 @@ def _serialize_displayed_note(displayed_note):
 	}
 
 
-def _note_group_name(class_id):
-	return f'classroom_{class_id}_notes'
-
-
 def _broadcast_notification_event(class_id, payload):
-	channel_layer = get_channel_layer()
-	if channel_layer is None:
-		return
-
-	async_to_sync(channel_layer.group_send)(
-		_note_group_name(class_id),
-		{
-			'type': 'note.event',
-			'event_type': 'notification_sent',
-			'payload': payload,
-		},
-	)
+	broadcast_event(class_id, 'notification_sent', payload)
 
 
 def _broadcast_note_event(class_id, event_type, payload):
-	channel_layer = get_channel_layer()
-	if channel_layer is None:
-		return
-
-	async_to_sync(channel_layer.group_send)(
-		_note_group_name(class_id),
-		{
-			'type': 'note.event',
-			'event_type': event_type,
-			'payload': payload,
-		},
-	)
+	broadcast_event(class_id, event_type, payload)
 
 
 @csrf_exempt
@@ -436,14 +451,22 @@ def invitation_status(request, token):
 
 
 @csrf_exempt
-def classroom_notes(request, class_id):
-	user, classroom, is_owner, error_response = _require_class_member(request, class_id)
+async def classroom_notes(request, class_id):
+	if request.method != 'GET':
+		return await sync_to_async(_save_classroom_note)(request, class_id)
+
+	_, classroom, _, error_response = await _arequire_class_member(request, class_id, allow_claims=True)
 	if error_response:
 		return error_response
 
-	if request.method == 'GET':
-		notes = ClassroomNote.objects.filter(classroom=classroom).order_by('note_index', 'id')
-		return JsonResponse({'notes': [_serialize_saved_note(note) for note in notes]})
+	notes = ClassroomNote.objects.filter(classroom=classroom).order_by('note_index', 'id')
+	return JsonResponse({'notes': [_serialize_saved_note(note) async for note in notes]})
+
+
+def _save_classroom_note(request, class_id):
+	user, classroom, is_owner, error_response = _require_class_member(request, class_id)
+	if error_response:
+		return error_response
 
 	if request.method == 'POST':
 		if not is_owner:
@@ -492,8 +515,7 @@ def delete_classroom_note(request, class_id, note_id):
 			note_index=F('note_index') - 1
 		)
 
-	for displayed_id in displayed_ids:
-		_broadcast_note_event(class_id, 'note_removed', {'id': displayed_id})
+	broadcast_events(class_id, [('note_removed', {'id': displayed_id}) for displayed_id in displayed_ids])
 
 	remaining_notes = ClassroomNote.objects.filter(classroom=classroom).order_by('note_index', 'id')
 	return JsonResponse(
@@ -504,8 +526,8 @@ def delete_classroom_note(request, class_id, note_id):
 	)
 
 
-def displayed_notes(request, class_id):
-	_, classroom, _, error_response = _require_class_member(request, class_id)
+async def displayed_notes(request, class_id):
+	_, classroom, _, error_response = await _arequire_class_member(request, class_id, allow_claims=True)
 	if error_response:
 		return error_response
 
@@ -513,7 +535,7 @@ def displayed_notes(request, class_id):
 		return JsonResponse({'detail': 'Method not allowed'}, status=405)
 
 	displayed = DisplayedClassroomNote.objects.filter(classroom=classroom).select_related('note').order_by('displayed_at', 'id')
-	return JsonResponse({'displayed_notes': [_serialize_displayed_note(item) for item in displayed]})
+	return JsonResponse({'displayed_notes': [_serialize_displayed_note(item) async for item in displayed]})
 
 
 @csrf_exempt
@@ -670,8 +692,8 @@ def send_notification(request, class_id):
 	return JsonResponse({'notification': payload}, status=201)
 
 
-def list_notifications(request, class_id):
-	_, classroom, _, error_response = _require_class_member(request, class_id)
+async def list_notifications(request, class_id):
+	_, classroom, _, error_response = await _arequire_class_member(request, class_id)
 	if error_response:
 		return error_response
 
@@ -684,7 +706,7 @@ def list_notifications(request, class_id):
 
 	result = []
 	now = timezone.now()
-	for n in notifications:
+	async for n in notifications:
 		ends_at = n.created_at + timedelta(seconds=n.countdown_seconds)
 		if ends_at > now:
 			result.append({
@@ -708,106 +730,28 @@ def classroom_attendance_insights(request, class_id):
 	except Classroom.DoesNotExist:
 		return JsonResponse({'detail': 'Classroom not found'}, status=404)
 
-	session_id = request.GET.get('session_id')
-	records_qs = StudentAttendanceRecord.objects.filter(classroom=classroom)
-	if session_id:
-		records_qs = records_qs.filter(session_id=session_id)
-
-	enrolled_students = User.objects.filter(class_enrollments__classroom=classroom).distinct()
-	total_enrolled = enrolled_students.count()
-
-	student_records_map = {}
-	for rec in records_qs.select_related('student', 'session').order_by('-joined_at'):
-		rec_duration = rec.duration_seconds
-		if rec.status == StudentAttendanceRecord.STATUS_ACTIVE and rec.joined_at:
-			rec_duration = max(rec_duration, int((timezone.now() - rec.joined_at).total_seconds()))
-
-		if rec.student_id not in student_records_map:
-			student_records_map[rec.student_id] = {
-				'records': [],
-				'total_duration_seconds': 0,
-				'is_active': False,
-				'latest_joined_at': rec.joined_at,
-				'latest_left_at': rec.left_at,
-				'latest_topic': rec.joined_topic,
-			}
-
-		s_data = student_records_map[rec.student_id]
-		s_data['records'].append(rec)
-		s_data['total_duration_seconds'] += rec_duration
-		if rec.status == StudentAttendanceRecord.STATUS_ACTIVE:
-			s_data['is_active'] = True
-
-	student_insights = []
-	total_attended = len(student_records_map)
-	active_now_count = 0
-	sum_duration_secs = 0
-
-	for s in enrolled_students:
-		s_info = student_records_map.get(s.id)
-		if s_info:
-			duration_mins = round(s_info['total_duration_seconds'] / 60, 1)
-			sum_duration_secs += s_info['total_duration_seconds']
-			is_active = s_info['is_active']
-			if is_active:
-				active_now_count += 1
-				status_str = 'Active Now'
-			else:
-				status_str = 'Left'
-
-			if duration_mins >= 15:
-				engagement = 'High'
-			elif duration_mins >= 5:
-				engagement = 'Moderate'
-			else:
-				engagement = 'Low'
-
-			student_insights.append({
-				'student_id': s.id,
-				'username': s.username,
-				'email': s.email,
-				'full_name': s.get_full_name() or s.username,
-				'status': status_str,
-				'total_duration_minutes': duration_mins,
-				'joined_at': s_info['latest_joined_at'].isoformat() if s_info['latest_joined_at'] else None,
-				'left_at': s_info['latest_left_at'].isoformat() if s_info['latest_left_at'] else None,
-				'joined_topic': s_info['latest_topic'],
-				'engagement': engagement,
-				'sessions_attended_count': len(s_info['records']),
-			})
-		else:
-			student_insights.append({
-				'student_id': s.id,
-				'username': s.username,
-				'email': s.email,
-				'full_name': s.get_full_name() or s.username,
-				'status': 'Absent',
-				'total_duration_minutes': 0,
-				'joined_at': None,
-				'left_at': None,
-				'joined_topic': 'N/A',
-				'engagement': 'None',
-				'sessions_attended_count': 0,
-			})
-
-	student_insights.sort(key=lambda x: (x['status'] != 'Active Now', -x['total_duration_minutes']))
-
-	avg_duration_minutes = round((sum_duration_secs / total_attended / 60), 1) if total_attended > 0 else 0
-	attendance_rate = round((total_attended / total_enrolled * 100), 1) if total_enrolled > 0 else 0
+	try:
+		page = max(1, int(request.GET.get('page', 1)))
+		page_size = int(request.GET['page_size']) if request.GET.get('page_size') else None
+	except ValueError:
+		return JsonResponse({'detail': 'page and page_size must be integers'}, status=400)
+	if page_size is not None and page_size <= 0:
+		return JsonResponse({'detail': 'page_size must be greater than 0'}, status=400)
+
+	insights = attendance_insights(
+		classroom,
+		session_id=request.GET.get('session_id'),
+		present_ids=active_student_ids(classroom.id),
+		offset=(page - 1) * page_size if page_size else 0,
+		limit=page_size,
+	)
 
 	sessions = list(
 		ClassroomSession.objects.filter(classroom=classroom).values('id', 'title', 'started_at', 'ended_at', 'is_active')
 	)
 
-	return JsonResponse({
-		'summary': {
-			'total_enrolled': total_enrolled,
-			'total_attended': total_attended,
-			'active_now': active_now_count,
-			'attendance_rate': attendance_rate,
-			'avg_duration_minutes': avg_duration_minutes,
-		},
-		'students': student_insights,
+	response = {
+		**insights,
 		'sessions': [{
 			'id': s['id'],
 			'title': s['title'],
@@ -815,10 +759,21 @@ def classroom_attendance_insights(request, class_id):
 			'ended_at': s['ended_at'].isoformat() if s['ended_at'] else None,
 			'is_active': s['is_active'],
 		} for s in sessions],
-	})
+	}
+	if page_size:
+		response['pagination'] = {
+			'page': page,
+			'page_size': page_size,
+			'total': insights['summary']['total_enrolled'],
+		}
+	return JsonResponse(response)
 
 
-def export_attendance_csv(request, class_id):
+@csrf_exempt
+def end_classroom_session(request, class_id):
+	if request.method != 'POST':
+		return JsonResponse({'detail': 'Method not allowed'}, status=405)
+
 	user, teacher_error = _require_teacher(request)
 	if teacher_error:
 		return teacher_error
@@ -828,28 +783,244 @@ def export_attendance_csv(request, class_id):
 	except Classroom.DoesNotExist:
 		return JsonResponse({'detail': 'Classroom not found'}, status=404)
 
-	records = StudentAttendanceRecord.objects.filter(classroom=classroom).select_related('student', 'session').order_by('-joined_at')
+	session_id = ClassroomSession.objects.filter(classroom=classroom, is_active=True).values_list('id', flat=True).first()
+	ended = end_session(session_id, class_id) if session_id is not None else None
+	if ended is None:
+		return JsonResponse({'detail': 'No active session'}, status=404)
 
-	response = HttpResponse(content_type='text/csv')
+	session, closed = ended
+	return JsonResponse({
+		'session': {
+			'id': session.id,
+			'title': session.title,
+			'started_at': session.started_at.isoformat(),
+			'ended_at': session.ended_at.isoformat(),
+		},
+		'closed_records': closed,
+	})
+
+
+def classroom_presence(request, class_id):
+	_, classroom, is_owner, error_response = _require_class_member(request, class_id)
+	if error_response:
+		return error_response
+
+	if request.method != 'GET':
+		return JsonResponse({'detail': 'Method not allowed'}, status=405)
+
+	if not is_owner:
+		return JsonResponse({'detail': 'Only the teacher can view presence'}, status=403)
+
+	if request.GET.get('count_only'):
+		return JsonResponse({'active_now': active_student_count(classroom.id)})
+
+	present = active_student_ids(classroom.id)
+	students = User.objects.filter(id__in=present.keys()).order_by('username')
+	return JsonResponse({
+		'active_now': len(present),
+		'students': [{
+			'student_id': student.id,
+			'username': student.username,
+			'full_name': student.get_full_name() or student.username,
+			'online_until': datetime.fromtimestamp(present[student.id], tz=dt_timezone.utc).isoformat(),
+		} for student in students],
+	})
+
+
+async def export_attendance_csv(request, class_id):
+	user, teacher_error = await sync_to_async(_require_teacher)(request)
+	if teacher_error:
+		return teacher_error
+
+	try:
+		classroom = await Classroom.objects.aget(class_id=class_id, owner=user)
+	except Classroom.DoesNotExist:
+		return JsonResponse({'detail': 'Classroom not found'}, status=404)
+
+	try:
+		filters = parse_export_filters(request.GET)
+	except ValueError as exc:
+		return JsonResponse({'detail': str(exc)}, status=400)
+	records = attendance_export_queryset(classroom, **filters)
+
+	# Streamed a chunk of rows at a time, so memory stays flat however long the history is.
+	chunks = iter_attendance_csv(records)
+	compress = bool(re_accepts_gzip.search(request.META.get('HTTP_ACCEPT_ENCODING', '')))
+	if compress:
+		chunks = gzip_chunks(chunks)
+	if isinstance(request, ASGIRequest):
+		chunks = aiter_chunks(chunks)
+
+	response = StreamingHttpResponse(chunks, content_type='text/csv')
 	response['Content-Disposition'] = f'attachment; filename="attendance_{class_id}.csv"'
+	if compress:
+		response['Content-Encoding'] = 'gzip'
+	patch_vary_headers(response, ('Accept-Encoding',))
+	return response
+
+
+def _owned_classroom(request, class_id):
+	user, teacher_error = _require_teacher(request)
+	if teacher_error:
+		return None, None, teacher_error
+	try:
+		return user, Classroom.objects.get(class_id=class_id, owner=user), None
+	except Classroom.DoesNotExist:
+		return user, None, JsonResponse({'detail': 'Classroom not found'}, status=404)
+
+
+@csrf_exempt
+def export_jobs(request, class_id):
+	user, classroom, error_response = _owned_classroom(request, class_id)
+	if error_response:
+		return error_response
+
+	if request.method == 'GET':
+		jobs = ExportJob.objects.filter(classroom=classroom).select_related('classroom')[:20]
+		return JsonResponse({'jobs': [serialize_export_job(job) for job in jobs]})
+
+	if request.method != 'POST':
+		return JsonResponse({'detail': 'Method not allowed'}, status=405)
+
+	data = _json_body(request)
+	try:
+		job = enqueue_export(classroom, user, data.get('kind') or ExportJob.KIND_ATTENDANCE, data)
+	except ValueError as exc:
+		return JsonResponse({'detail': str(exc)}, status=400)
+	return JsonResponse({'job': serialize_export_job(job)}, status=202)
+
+
+def export_job_detail(request, class_id, job_id):
+	_, classroom, error_response = _owned_classroom(request, class_id)
+	if error_response:
+		return error_response
 
-	writer = csv.writer(response)
-	writer.writerow(['Student Username', 'Student Email', 'Session Title', 'Joined Topic', 'Joined At', 'Left At', 'Duration (Mins)', 'Status'])
-
-	for r in records:
-		joined = r.joined_at.strftime('%Y-%m-%d %H:%M:%S') if r.joined_at else ''
-		left = r.left_at.strftime('%Y-%m-%d %H:%M:%S') if r.left_at else ('Active' if r.status == 'active' else '')
-		duration_mins = round(r.duration_seconds / 60, 1)
-		writer.writerow([
-			r.student.username,
-			r.student.email,
-			r.session.title if r.session else 'General Session',
-			r.joined_topic,
-			joined,
-			left,
-			duration_mins,
-			r.status.capitalize()
-		])
+	if request.method != 'GET':
+		return JsonResponse({'detail': 'Method not allowed'}, status=405)
 
+	job = ExportJob.objects.filter(classroom=classroom, id=job_id).select_related('classroom').first()
+	if job is None:
+		return JsonResponse({'detail': 'Export not found'}, status=404)
+	return JsonResponse({'job': serialize_export_job(job)})
+
+
+def _byte_range(header, size):
+	"""
+	(start, end) inclusive for a single-range "bytes=" Range header, None to send the whole
+	file (no header, or one this doesn't handle, such as several ranges), or False when the
+	range lies outside the file.
+	"""
+	if not header or not header.startswith('bytes=') or ',' in header:
+		return None
+	first, _, last = header[len('bytes='):].strip().partition('-')
+	try:
+		if not first:
+			suffix = int(last)
+			if suffix <= 0:
+				return False
+			return max(0, size - suffix), size - 1
+		start = int(first)
+		end = int(last) if last else size - 1
+	except ValueError:
+		return None
+	if start >= size or end < start:
+		return False
+	return start, min(end, size - 1)
+
+
+def _read_range(handle, start, length, block_size=64 * 1024):
+	with handle:
+		handle.seek(start)
+		while length > 0:
+			data = handle.read(min(block_size, length))
+			if not data:
+				return
+			length -= len(data)
+			yield data
+
+
+def download_export(request, class_id, job_id):
+	_, classroom, error_response = _owned_classroom(request, class_id)
+	if error_response:
+		return error_response
+
+	if request.method not in ('GET', 'HEAD'):
+		return JsonResponse({'detail': 'Method not allowed'}, status=405)
+
+	job = ExportJob.objects.filter(classroom=classroom, id=job_id).select_related('classroom').first()
+	if job is None:
+		return JsonResponse({'detail': 'Export not found'}, status=404)
+	if job.status == ExportJob.STATUS_EXPIRED:
+		return JsonResponse({'detail': 'Export has expired'}, status=410)
+	if job.status != ExportJob.STATUS_DONE:
+		return JsonResponse({'detail': f'Export is {job.status}'}, status=409)
+
+	try:
+		handle = open(artifact_path(job), 'rb')
+	except FileNotFoundError:
+		return JsonResponse({'detail': 'Export has expired'}, status=410)
+	size = os.fstat(handle.fileno()).st_size
+	filename = artifact_filename(job)
+	# Artifacts never change once written, so the name on disk is a strong validator.
+	etag = f'"{job.artifact_name}"'
+
+	if_range = request.META.get('HTTP_IF_RANGE')
+	byte_range = _byte_range(request.META.get('HTTP_RANGE'), size) if not if_range or if_range == etag else None
+	if byte_range is False:
+		handle.close()
+		response = HttpResponse(status=416)
+		response['Content-Range'] = f'bytes */{size}'
+	elif byte_range is None:
+		response = FileResponse(handle, as_attachment=True, filename=filename, content_type='application/gzip')
+	else:
+		start, end = byte_range
+		response = StreamingHttpResponse(_read_range(handle, start, end - start + 1), status=206, content_type='application/gzip')
+		response['Content-Range'] = f'bytes {start}-{end}/{size}'
+		response['Content-Length'] = str(end - start + 1)
+		response['Content-Disposition'] = f'attachment; filename="{filename}"'
+	response['Accept-Ranges'] = 'bytes'
+	response['ETag'] = etag
 	return response
 
+
+def classroom_session_timeline(request, class_id, session_id):
+	_, classroom, error_response = _owned_classroom(request, class_id)
+	if error_response:
+		return error_response
+
+	if request.method != 'GET':
+		return JsonResponse({'detail': 'Method not allowed'}, status=405)
+
+	try:
+		bucket_seconds = int(request.GET.get('bucket_seconds', 60))
+	except ValueError:
+		return JsonResponse({'detail': 'bucket_seconds must be an integer'}, status=400)
+	if not 1 <= bucket_seconds <= 86400:
+		return JsonResponse({'detail': 'bucket_seconds must be between 1 and 86400'}, status=400)
+
+	session = ClassroomSession.objects.filter(classroom=classroom, id=session_id).first()
+	if session is None:
+		return JsonResponse({'detail': 'Session not found'}, status=404)
+
+	try:
+		timeline = session_timeline(session, bucket_seconds)
+	except ValueError as exc:
+		return JsonResponse({'detail': str(exc)}, status=400)
+	return JsonResponse({
+		'session': {'id': session.id, 'title': session.title, 'is_active': session.is_active},
+		**timeline,
+	})
+
+
+def classroom_attendance_matrix(request, class_id):
+	_, classroom, error_response = _owned_classroom(request, class_id)
+	if error_response:
+		return error_response
+
+	if request.method != 'GET':
+		return JsonResponse({'detail': 'Method not allowed'}, status=405)
+
+	order = request.GET.get('order') or ORDER_NAME
+	if order not in ORDERS:
+		return JsonResponse({'detail': f"order must be one of: {', '.join(ORDERS)}"}, status=400)
+	return JsonResponse(attendance_matrix(classroom, order))
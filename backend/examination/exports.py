@@ -0,0 +1,28 @@
+from classroom.exports import encode_csv, filter_dates, iter_keyset_chunks, timestamp
+from examination.models import ExamAttempt
+
+
+EXAM_RESULTS_CSV_HEADER = (
+	'Student Username', 'Student Email', 'Attempted At', 'Questions', 'Answered', 'Correct', 'Score (%)',
+)
+
+_EXAM_RESULT_FIELDS = ('student__username', 'student__email', 'total_questions', 'answered_count', 'correct_count')
+
+
+def exam_results_queryset(classroom, date_from=None, date_to=None):
+	return filter_dates(ExamAttempt.objects.filter(classroom=classroom), 'created_at', date_from, date_to)
+
+
+def _score_percent(correct_count, total_questions):
+	# As the attempt endpoints report it.
+	return round((correct_count / total_questions) * 100, 2) if total_questions else 0
+
+
+def iter_exam_results_csv(attempts, chunk_size=None):
+	"""CSV bytes for exam attempts, newest first, holding at most one chunk of rows at a time."""
+	yield encode_csv([EXAM_RESULTS_CSV_HEADER])
+	for rows in iter_keyset_chunks(attempts, 'created_at', _EXAM_RESULT_FIELDS, chunk_size):
+		yield encode_csv(
+			(username, email, timestamp(created_at), total, answered, correct, _score_percent(correct, total))
+			for _, created_at, username, email, total, answered, correct in rows
+		)
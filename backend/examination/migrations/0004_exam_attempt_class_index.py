@@ -0,0 +1,17 @@
+# Generated by Django 6.0.2 on 2026-10-17 14:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('examination', '0003_exam_timing_settings'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='examattempt',
+            index=models.Index(fields=['classroom', 'created_at'], name='exam_attempt_class_idx'),
+        ),
+    ]
@@ -41,6 +41,10 @@ class ExamAttempt(models.Model):
 
 	class Meta:
 		ordering = ['-created_at', '-id']
+		indexes = [
+			# A classroom's attempts newest first, for results exports.
+			models.Index(fields=['classroom', 'created_at'], name='exam_attempt_class_idx'),
+		]
 
 	def __str__(self):
 		return f"ExamAttempt #{self.id} ({self.classroom.class_id})"
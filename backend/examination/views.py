@@ -1,12 +1,17 @@
 import json
 
+from asgiref.sync import sync_to_async
 from django.db import transaction
+from django.db.models import Prefetch
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 
-from authentication.jwt_auth import get_user_from_request
+from authentication.auth_cache import get_user_role
+from authentication.jwt_auth import aget_user_from_request, get_user_from_request
 from authentication.models import UserProfile
-from classroom.models import Classroom, Enrollment
+from classroom.access_cache import aresolve_class_access, resolve_class_access
+from classroom.claims import aget_class_member_from_claims
+from classroom.models import Classroom
 from examination.models import ClassroomQuestion, QuestionAnswer, ExamAttempt, ExamAnswer, ExamTimingSettings
 
 
@@ -21,7 +26,7 @@ def _require_teacher(request):
 	if user is None:
 		return None, JsonResponse({'detail': 'Authentication required'}, status=401)
 
-	role = getattr(getattr(user, 'profile', None), 'role', None)
+	role = get_user_role(user)
 	if role != UserProfile.ROLE_TEACHER:
 		return None, JsonResponse({'detail': 'Teacher role required'}, status=403)
 
@@ -33,16 +38,39 @@ def _require_class_member(request, class_id):
 	if user is None:
 		return None, None, False, JsonResponse({'detail': 'Authentication required'}, status=401)
 
-	classroom = Classroom.objects.filter(class_id=class_id).first()
-	if classroom is None:
+	access = resolve_class_access(class_id, user.id)
+	if access is None:
+		return None, None, False, JsonResponse({'detail': 'Classroom not found'}, status=404)
+
+	classroom_pk, owner_id, allowed = access
+	if not allowed:
+		return None, None, False, JsonResponse({'detail': 'Not allowed'}, status=403)
+
+	classroom = Classroom.from_reference(classroom_pk, class_id, owner_id=owner_id)
+	return user, classroom, owner_id == user.id, None
+
+
+async def _arequire_class_member(request, class_id, allow_claims=False):
+	if allow_claims:
+		member = await aget_class_member_from_claims(request, class_id)
+		if member is not None:
+			user, classroom, is_owner = member
+			return user, classroom, is_owner, None
+
+	user = await aget_user_from_request(request)
+	if user is None:
+		return None, None, False, JsonResponse({'detail': 'Authentication required'}, status=401)
+
+	access = await aresolve_class_access(class_id, user.id)
+	if access is None:
 		return None, None, False, JsonResponse({'detail': 'Classroom not found'}, status=404)
 
-	is_owner = classroom.owner_id == user.id
-	is_enrolled = Enrollment.objects.filter(classroom=classroom, student=user).exists()
-	if not is_owner and not is_enrolled:
+	classroom_pk, owner_id, allowed = access
+	if not allowed:
 		return None, None, False, JsonResponse({'detail': 'Not allowed'}, status=403)
 
-	return user, classroom, is_owner, None
+	classroom = Classroom.from_reference(classroom_pk, class_id, owner_id=owner_id)
+	return user, classroom, owner_id == user.id, None
 
 
 def _normalize_answers(raw_answers):
@@ -87,7 +115,7 @@ def _serialize_question(question, include_correct=True):
 		'created_at': question.created_at.isoformat(),
 		'answers': [
 			_serialize_answer(answer, include_correct=include_correct)
-			for answer in question.answers.all().order_by('position', 'id')
+			for answer in question.answers.all()
 		],
 	}
 
@@ -132,27 +160,32 @@ def _serialize_timing_settings(settings):
 
 
 @csrf_exempt
-def classroom_questions(request, class_id):
-	if request.method == 'GET':
-		user, classroom, is_owner, error_response = _require_class_member(request, class_id)
-		if error_response:
-			return error_response
-
-		questions = (
-			ClassroomQuestion.objects
-			.filter(classroom=classroom)
-			.prefetch_related('answers')
-			.order_by('id')
-		)
-		return JsonResponse(
-			{
-				'questions': [
-					_serialize_question(question, include_correct=is_owner)
-					for question in questions
-					]
-			}
-		)
+async def classroom_questions(request, class_id):
+	if request.method != 'GET':
+		return await sync_to_async(_create_classroom_question)(request, class_id)
 
+	_, classroom, is_owner, error_response = await _arequire_class_member(request, class_id, allow_claims=True)
+	if error_response:
+		return error_response
+
+	questions = (
+		ClassroomQuestion.objects
+		.filter(classroom=classroom)
+		.select_related('classroom')
+		.prefetch_related(Prefetch('answers', queryset=QuestionAnswer.objects.order_by('position', 'id')))
+		.order_by('id')
+	)
+	return JsonResponse(
+		{
+			'questions': [
+				_serialize_question(question, include_correct=is_owner)
+				async for question in questions
+			]
+		}
+	)
+
+
+def _create_classroom_question(request, class_id):
 	if request.method != 'POST':
 		return JsonResponse({'detail': 'Method not allowed'}, status=405)
 
@@ -215,7 +248,7 @@ def submit_exam_attempt(request, class_id):
 	if error_response:
 		return error_response
 
-	role = getattr(getattr(user, 'profile', None), 'role', None)
+	role = get_user_role(user)
 	if role != UserProfile.ROLE_STUDENT:
 		return JsonResponse({'detail': 'Student role required'}, status=403)
 
@@ -372,18 +405,22 @@ def exam_attempt_detail(request, class_id, attempt_id):
 
 
 @csrf_exempt
-def classroom_timing_settings(request, class_id):
-	if request.method == 'GET':
-		_, classroom, _, error_response = _require_class_member(request, class_id)
-		if error_response:
-			return error_response
+async def classroom_timing_settings(request, class_id):
+	if request.method != 'GET':
+		return await sync_to_async(_update_timing_settings)(request, class_id)
+
+	_, classroom, _, error_response = await _arequire_class_member(request, class_id)
+	if error_response:
+		return error_response
+
+	settings = await ExamTimingSettings.objects.filter(classroom=classroom).afirst()
+	if settings is None:
+		return JsonResponse({'settings': None})
 
-		settings = ExamTimingSettings.objects.filter(classroom=classroom).first()
-		if settings is None:
-			return JsonResponse({'settings': None})
+	return JsonResponse({'settings': _serialize_timing_settings(settings)})
 
-		return JsonResponse({'settings': _serialize_timing_settings(settings)})
 
+def _update_timing_settings(request, class_id):
 	if request.method not in {'POST', 'PUT', 'PATCH'}:
 		return JsonResponse({'detail': 'Method not allowed'}, status=405)
 
@@ -1,4 +1,4 @@
-import { useEffect, useState } from 'react'
+import { useEffect, useRef, useState } from 'react'
 import { apiFetch, getNotesWebSocketUrl } from '../apiClient'
 
 function useClassroomPageController({ classId, accessToken, setAccessToken }) {
@@ -23,6 +23,10 @@ function useClassroomPageController({ classId, accessToken, setAccessToken }) {
   const [liveAutoInitialized, setLiveAutoInitialized] = useState(false)
   const [sidebarPortalTarget, setSidebarPortalTarget] = useState(null)
   const [sidebarTab, setSidebarTab] = useState(null)
+  const [resyncCount, setResyncCount] = useState(0)
+  const lastSeqRef = useRef(null)
+  // Seqs applied above lastSeqRef, waiting for the ones below them to arrive.
+  const appliedSeqsRef = useRef(new Set())
 
   // Notification state
   const [notifications, setNotifications] = useState([])
@@ -154,7 +158,12 @@ function useClassroomPageController({ classId, accessToken, setAccessToken }) {
     return () => {
       isCurrent = false
     }
-  }, [classId, accessToken, setAccessToken])
+  }, [classId, accessToken, setAccessToken, resyncCount])
+
+  useEffect(() => {
+    lastSeqRef.current = null
+    appliedSeqsRef.current = new Set()
+  }, [classId])
 
   useEffect(() => {
     if (!accessToken) {
@@ -169,8 +178,29 @@ function useClassroomPageController({ classId, accessToken, setAccessToken }) {
 
     const websocketUrl = getNotesWebSocketUrl(classId, accessToken)
 
+    // Apply each seq once. lastSeqRef only moves over contiguous seqs, since a broadcast from
+    // another server can arrive ahead of a lower seq that is still on its way.
+    const acceptSeq = (seq) => {
+      const applied = appliedSeqsRef.current
+      if (lastSeqRef.current === null) {
+        lastSeqRef.current = seq
+        return true
+      }
+      if (seq <= lastSeqRef.current || applied.has(seq)) {
+        return false
+      }
+      applied.add(seq)
+      while (applied.has(lastSeqRef.current + 1)) {
+        lastSeqRef.current += 1
+        applied.delete(lastSeqRef.current)
+      }
+      return true
+    }
+
     const connect = () => {
-      socket = new WebSocket(websocketUrl)
+      // The server replays the events missed while disconnected before any live one (or just
+      // reports the current seq on first connect).
+      socket = new WebSocket(`${websocketUrl}&last_seq=${lastSeqRef.current ?? ''}`)
 
       socket.onopen = () => {
         heartbeatInterval = window.setInterval(() => {
@@ -183,6 +213,28 @@ function useClassroomPageController({ classId, accessToken, setAccessToken }) {
       socket.onmessage = (event) => {
         try {
           const data = JSON.parse(event.data)
+          if (data.type === 'resync_required') {
+            lastSeqRef.current = data.payload?.seq ?? null
+            appliedSeqsRef.current = new Set()
+            setResyncCount((count) => count + 1)
+            return
+          }
+          if (data.type === 'skip') {
+            // Stands in for events the server dropped as superseded while they were queued.
+            for (const seq of data.payload?.seqs ?? []) {
+              acceptSeq(seq)
+            }
+            return
+          }
+          if (data.type === 'replay_complete') {
+            if (lastSeqRef.current === null) {
+              lastSeqRef.current = data.payload?.seq ?? null
+            }
+            return
+          }
+          if (typeof data.seq === 'number' && !acceptSeq(data.seq)) {
+            return
+          }
           if (data.type === 'note_displayed' && data.payload) {
             upsertDisplayedNote(data.payload)
           }